@@ -0,0 +1,384 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Iterable
+from urllib.parse import parse_qs
+
+import orjson
+from jose import JWTError, jwt
+from sqlalchemy import insert, update
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeout
+from sqlmodel import Session
+
+from . import models
+from .auth import ALGORITHM, SECRET_KEY
+from .database import audit_engine
+from .dialects import supports_upsert, upsert_stmt
+from .diffs import json_patch
+
+logger = logging.getLogger(__name__)
+
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+# Longest an entry waits in the queue before its batch is written
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "0.5"))
+# When the queue is full: "drop" discards the new entry at once (counted in
+# /stats/audit); "wait" holds the response up to AUDIT_WAIT_TIMEOUT seconds for
+# room, slowing clients down to the writer's pace, and drops only after that
+AUDIT_QUEUE_FULL = os.getenv("AUDIT_QUEUE_FULL", "drop")
+AUDIT_WAIT_TIMEOUT = float(os.getenv("AUDIT_WAIT_TIMEOUT", "2.0"))
+# A batch that hits a locked or unreachable database is retried, backing off
+# up to this many seconds between attempts, until it is written or the
+# writer is stopped
+AUDIT_RETRY_MAX_DELAY = float(os.getenv("AUDIT_RETRY_MAX_DELAY", "30"))
+
+_STOP = object()
+
+
+def audit_timestamp() -> str:
+    # Same shape as the browser's Date.toISOString(), so old and new entries sort together
+    return datetime.utcnow().isoformat(timespec="milliseconds") + "Z"
+
+
+class AuditWriter:
+    """Bounded queue of AuditLog rows, written in batches by one background thread.
+
+    `submit` never touches the database; the writer thread inserts up to
+    `batch_size` queued entries per transaction, at most `flush_interval`
+    seconds after the first of them was queued. A batch the database cannot
+    take yet (locked, unreachable) is retried until it is written; only
+    `stop` gives up on it, once its timeout has passed. `stop` writes
+    everything still queued before returning.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = AUDIT_QUEUE_SIZE,
+        batch_size: int = AUDIT_BATCH_SIZE,
+        flush_interval: float = AUDIT_FLUSH_INTERVAL,
+        on_full: str = AUDIT_QUEUE_FULL,
+        wait_timeout: float = AUDIT_WAIT_TIMEOUT,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_full = on_full
+        self.wait_timeout = wait_timeout
+        self._queue: queue.Queue = queue.Queue(maxsize)
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._give_up_at: float | None = None
+        self.queued = self.written = self.dropped = self.failed = self.batches = self.retries = 0
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._give_up_at = None
+                self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float | None = 30) -> None:
+        """Write every queued entry, then stop the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        if timeout is not None:
+            self._give_up_at = time.monotonic() + timeout
+        self._queue.put(_STOP)  # blocks while the queue is full; the writer is draining it
+        thread.join(timeout)
+
+    def flush(self) -> None:
+        """Block until every entry queued so far is written (or has failed)."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def submit(self, entry: dict[str, Any]) -> bool:
+        """Queue one AuditLog row (column -> value); False if the queue is full and it was dropped."""
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.queued += 1
+        return True
+
+    async def submit_async(self, entry: dict[str, Any]) -> bool:
+        """`submit`, applying the `on_full` policy without blocking the event loop."""
+        deadline = time.monotonic() + (self.wait_timeout if self.on_full == "wait" else 0)
+        while True:
+            try:
+                self._queue.put_nowait(entry)
+            except queue.Full:
+                if time.monotonic() >= deadline:
+                    self.dropped += 1
+                    return False
+                await asyncio.sleep(0.01)
+                continue
+            self.queued += 1
+            return True
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "pending": self._queue.qsize(),
+            "capacity": self._queue.maxsize,
+            "queued": self.queued,
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "retries": self.retries,
+            "on_full": self.on_full,
+            "running": self._thread is not None and self._thread.is_alive(),
+        }
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch: list[dict[str, Any]] = []
+            deadline = None
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    self._queue.task_done()
+                    stopping = True
+                    break
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            if batch:
+                self._write(batch)
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch: list[dict[str, Any]]) -> None:
+        delay = 0.5
+        while True:
+            try:
+                with Session(audit_engine) as session:
+                    session.execute(insert(models.AuditLog), batch)
+                    apply_rollups(session, batch)
+                    session.commit()
+                self.written += len(batch)
+                self.batches += 1
+                return
+            except (OperationalError, PoolTimeout):
+                # e.g. a long import holding the SQLite write lock past busy_timeout
+                give_up_at = self._give_up_at
+                if give_up_at is not None and time.monotonic() >= give_up_at:
+                    self.failed += len(batch)
+                    logger.exception("Audit batch of %d entries not written before shutdown", len(batch))
+                    return
+                self.retries += 1
+                logger.warning("Audit batch of %d entries not written yet; retrying in %.1fs", len(batch), delay)
+                time.sleep(delay if give_up_at is None else max(0.0, min(delay, give_up_at - time.monotonic())))
+                delay = min(delay * 2, AUDIT_RETRY_MAX_DELAY)
+            except Exception:
+                # Not transient (e.g. a malformed entry): retrying cannot help
+                self.failed += len(batch)
+                logger.exception("Audit batch of %d entries could not be written", len(batch))
+                return
+
+
+# Actions that change an entity, counted per entity in AuditDailyEntity
+EDIT_ACTIONS = {"CREATE", "UPDATE", "DELETE"}
+
+
+def apply_rollups(session, entries: Iterable[dict[str, Any]]) -> None:
+    """Add entries to the daily rollup tables (AuditDailyActivity, AuditDailyEntity).
+
+    The caller commits, in the same transaction that stores the entries.
+    """
+    activity: Counter = Counter()
+    edits: Counter = Counter()
+    for e in entries:
+        day = (e.get("timestamp") or "")[:10]
+        activity[(day, e["username"], e["action"], e["entity_type"])] += 1
+        if e.get("entity_id") is not None and e["action"] in EDIT_ACTIONS:
+            edits[(day, e["entity_type"], e["entity_id"])] += 1
+    dialect = session.get_bind().dialect.name
+    for model, keys, counts in (
+        (models.AuditDailyActivity, ["day", "username", "action", "entity_type"], activity),
+        (models.AuditDailyEntity, ["day", "entity_type", "entity_id"], edits),
+    ):
+        if not counts:
+            continue
+        rows = [dict(zip(keys, key), count=n) for key, n in sorted(counts.items())]
+        if supports_upsert(dialect):
+            session.execute(upsert_stmt(dialect, model, keys, increment_columns=["count"]), rows)
+            continue
+        for row in rows:
+            match = [getattr(model, k) == row[k] for k in keys]
+            result = session.execute(update(model).where(*match).values(count=model.count + row["count"]))
+            if not result.rowcount:
+                session.execute(insert(model), [row])
+
+
+audit_writer = AuditWriter()
+
+
+# Request -> audit event. Reads are not recorded, except searches.
+ENTITY_PATHS = {"regions", "districts", "landmarks", "poles", "junction-boxes", "components", "credentials"}
+_ENTITY_ACTIONS = {"POST": "CREATE", "PUT": "UPDATE", "PATCH": "UPDATE", "DELETE": "DELETE"}
+_READ_ONLY_IMPORTS = {"detect-schema"}
+# A created row is echoed back; its id is read from responses up to this size
+_MAX_CREATED_BODY = 64 * 1024
+
+
+def classify(method: str, path: str) -> tuple[str, str, int | None] | None:
+    """(action, entity_type, entity_id) for a request worth auditing, else None."""
+    parts = path.strip("/").split("/")
+    head = parts[0]
+    entity_id = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else None
+    if head in ENTITY_PATHS:
+        if method == "POST" and len(parts) > 1 and parts[1] == "bulk":
+            return "BULK", head, None
+        action = _ENTITY_ACTIONS.get(method)
+        if action is None or (action == "CREATE") != (entity_id is None):
+            return None
+        return action, head, entity_id
+    if head == "import" and method == "POST" and len(parts) > 1 and parts[1] not in _READ_ONLY_IMPORTS:
+        return "IMPORT", "/".join(parts[1:]), None
+    if head == "search" and method == "GET" and len(parts) > 1:
+        return "SEARCH", parts[1], None
+    if head == "excel" and len(parts) == 3:
+        kind, key = parts[1], parts[2]
+        if method == "PATCH" and kind == "rows" and key.isdigit():
+            return "UPDATE", "excel_rows", int(key)
+        if method == "DELETE" and kind == "workbooks" and key.isdigit():
+            return "DELETE", "excel_workbooks", int(key)
+        if method == "POST" and kind == "workbooks" and key == "prune":
+            return "DELETE", "excel_workbooks", None
+    return None
+
+
+def record_changes(request, before: dict[str, Any] | None, after: dict[str, Any] | None) -> None:
+    """Attach the field-level diff of an entity to the request's audit entry.
+
+    Call right after the commit: the entry is timestamped here rather than
+    when the response has been sent, which keeps entries for one entity in
+    commit order for rebuilding past states.
+    """
+    request.state.audit_changes = {**_patch_values(before, after), "timestamp": audit_timestamp()}
+
+
+def record_entity_changes(request, changes: list[tuple[int, dict[str, Any] | None, dict[str, Any] | None]]) -> None:
+    """Attach one diff per entity to a request that writes many (POST /{entity}/bulk).
+
+    `changes` holds (entity_id, before, after), with before None for a create
+    and after None for a delete. AuditMiddleware then queues a CREATE, UPDATE
+    or DELETE entry for each entity instead of a single BULK entry, so bulk
+    edits can be undone like single-item ones.
+    """
+    timestamp = audit_timestamp()
+    request.state.audit_entities = [
+        {
+            "action": "CREATE" if before is None else "DELETE" if after is None else "UPDATE",
+            "entity_id": entity_id,
+            "timestamp": timestamp,
+            **_patch_values(before, after),
+        }
+        for entity_id, before, after in changes
+    ]
+
+
+def _patch_values(before: dict[str, Any] | None, after: dict[str, Any] | None) -> dict[str, str | None]:
+    forward, inverse = json_patch(before, after)
+    return {
+        "new_value": orjson.dumps(forward).decode() if forward else None,
+        "old_value": orjson.dumps(inverse).decode() if inverse else None,
+    }
+
+
+@lru_cache(maxsize=1024)
+def _token_subject(token: str) -> str | None:
+    # Identity only: an expired but correctly signed token still names its user
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], options={"verify_exp": False}).get("sub")
+    except JWTError:
+        return None
+
+
+def _username(scope) -> str:
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                return _token_subject(token) or "unknown"
+    return "unknown"
+
+
+class AuditMiddleware:
+    """Queue an AuditLog entry for each successful write, import or search.
+
+    Plain ASGI rather than BaseHTTPMiddleware, so unaudited requests pass
+    straight through and audited ones only pay for building a dict.
+    """
+
+    def __init__(self, app, writer: AuditWriter = audit_writer):
+        self.app = app
+        self.writer = writer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        event = classify(scope["method"], scope["path"])
+        if event is None:
+            return await self.app(scope, receive, send)
+
+        action, entity_type, entity_id = event
+        status_code = 500
+        created = bytearray()
+
+        async def send_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif action == "CREATE" and len(created) <= _MAX_CREATED_BODY:
+                created.extend(message.get("body", b""))
+            await send(message)
+
+        await self.app(scope, receive, send_status)
+        if status_code >= 400:
+            return
+        if action == "CREATE" and len(created) <= _MAX_CREATED_BODY:
+            try:
+                entity_id = orjson.loads(created).get("id")
+            except (orjson.JSONDecodeError, AttributeError):
+                pass
+        if action == "SEARCH":
+            description = parse_qs(scope["query_string"].decode("latin-1")).get("q", [""])[0]
+        else:
+            description = f"{scope['method']} {scope['path']}"
+        client = scope.get("client")
+        entry = {
+            "username": _username(scope),
+            "action": action,
+            "entity_type": entity_type,
+            "entity_id": entity_id,
+            "description": description,
+            "timestamp": audit_timestamp(),
+            "ip_address": client[0] if client else None,
+        }
+        # Set by record_changes / record_entity_changes in the handler
+        # (Request.state lives in the scope)
+        state = scope.get("state", {})
+        entities = state.get("audit_entities")
+        if entities is not None:
+            for changes in entities:
+                await self.writer.submit_async({**entry, **changes})
+            return
+        changes = state.get("audit_changes")
+        if changes:
+            entry.update(changes)
+        await self.writer.submit_async(entry)
@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import os
+import re
+from collections import defaultdict
+from datetime import datetime, timedelta
+from functools import lru_cache
+from pathlib import Path
+from typing import Any
+
+import orjson
+from sqlalchemy import delete, insert, select
+from sqlmodel import Session
+
+from . import models
+from .database import session_scope
+from .pagination import keyset_after
+
+# Audit logs older than AUDIT_HOT_DAYS move from the AuditLog table into
+# gzip-compressed JSON-lines segment files, one append-only file per month:
+#   <AUDIT_ARCHIVE_DIR>/2024/2024-03.jsonl.gz
+# Each archive run appends one gzip member per month it touches and records
+# the member's byte range, checksum and time range as an AuditSegment row, so
+# a date-range query only reads the members that overlap it.
+AUDIT_ARCHIVE_DIR = Path(os.getenv("AUDIT_ARCHIVE_DIR", "./audit_archive"))
+AUDIT_HOT_DAYS = int(os.getenv("AUDIT_HOT_DAYS", "90"))  # 0 keeps everything in the table
+AUDIT_ARCHIVE_BATCH = int(os.getenv("AUDIT_ARCHIVE_BATCH", "20000"))
+AUDIT_ARCHIVE_INTERVAL = float(os.getenv("AUDIT_ARCHIVE_INTERVAL", "3600"))  # seconds; 0 disables the periodic run
+
+_COLUMNS = list(models.AuditLog.__table__.columns)
+
+
+class ArchiveCorrupt(Exception):
+    """An archive member no longer matches the checksum recorded in its AuditSegment."""
+_MONTH = re.compile(r"^\d{4}-\d{2}")
+
+
+def _partition(timestamp: str) -> str:
+    return timestamp[:7] if _MONTH.match(timestamp or "") else "undated"
+
+
+def _segment_path(partition: str) -> str:
+    return f"{partition[:4]}/{partition}.jsonl.gz" if partition != "undated" else "undated.jsonl.gz"
+
+
+def _append_member(archive_dir: Path, relpath: str, rows: list[dict[str, Any]]) -> tuple[int, int, str]:
+    """Append rows as one gzip member; returns (offset, length, sha256). Durable on return."""
+    blob = gzip.compress(b"".join(orjson.dumps(row) + b"\n" for row in rows), mtime=0)
+    path = archive_dir / relpath
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "ab") as f:
+        offset = f.seek(0, os.SEEK_END)
+        f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    return offset, len(blob), hashlib.sha256(blob).hexdigest()
+
+
+def _archive_batch(cutoff: str, batch_size: int, archive_dir: Path) -> tuple[int, int]:
+    log = models.AuditLog
+    written: list[tuple[Path, int]] = []
+    with session_scope() as session:
+        oldest = select(log.id).where(log.timestamp < cutoff).order_by(log.timestamp, log.id).limit(batch_size)
+        # DELETE first: it takes the write lock, so an archiver in another
+        # worker process waits here and then finds these rows gone
+        rows = session.execute(
+            delete(log).where(log.id.in_(oldest.scalar_subquery())).returning(*_COLUMNS),
+            execution_options={"synchronize_session": False},
+        ).mappings().all()
+        if not rows:
+            return 0, 0
+        by_partition: dict[str, list[dict[str, Any]]] = defaultdict(list)
+        for row in sorted(rows, key=lambda r: (r["timestamp"], r["id"])):
+            by_partition[_partition(row["timestamp"])].append(dict(row))
+        try:
+            segments = []
+            for partition, part_rows in sorted(by_partition.items()):
+                relpath = _segment_path(partition)
+                offset, length, digest = _append_member(archive_dir, relpath, part_rows)
+                written.append((archive_dir / relpath, offset))
+                segments.append({
+                    "partition": partition, "path": relpath, "offset": offset, "length": length,
+                    "sha256": digest, "rows": len(part_rows),
+                    "min_ts": part_rows[0]["timestamp"], "max_ts": part_rows[-1]["timestamp"],
+                    "min_id": min(r["id"] for r in part_rows), "max_id": max(r["id"] for r in part_rows),
+                    "created_at": datetime.utcnow().replace(microsecond=0).isoformat(),
+                })
+            session.execute(insert(models.AuditSegment), segments)
+            session.commit()
+        except BaseException:
+            # The rows roll back into the table; cut the unindexed members off again
+            for path, offset in written:
+                with open(path, "r+b") as f:
+                    f.truncate(offset)
+            raise
+    return len(rows), len(segments)
+
+
+def archive_audit_logs(
+    older_than_days: int = AUDIT_HOT_DAYS,
+    batch_size: int = AUDIT_ARCHIVE_BATCH,
+    archive_dir: Path | None = None,
+) -> dict[str, Any]:
+    """Move audit logs older than `older_than_days` into segment files, `batch_size` rows per transaction."""
+    if older_than_days <= 0:
+        return {"archived": 0, "segments": 0, "cutoff": None}
+    archive_dir = archive_dir or AUDIT_ARCHIVE_DIR
+    cutoff = (datetime.utcnow() - timedelta(days=older_than_days)).isoformat()
+    archived = segments = 0
+    while True:
+        n, s = _archive_batch(cutoff, batch_size, archive_dir)
+        archived += n
+        segments += s
+        if n < batch_size:
+            break
+    return {"archived": archived, "segments": segments, "cutoff": cutoff}
+
+
+@lru_cache(maxsize=16)
+def _segment_rows(path: str, offset: int, length: int, digest: str) -> tuple[dict[str, Any], ...]:
+    # Members never change once indexed, so decoded segments can be reused across pages
+    with open(path, "rb") as f:
+        f.seek(offset)
+        blob = f.read(length)
+    if hashlib.sha256(blob).hexdigest() != digest:
+        raise ArchiveCorrupt(f"Audit archive {path} at offset {offset} failed its checksum")
+    return tuple(orjson.loads(line) for line in gzip.decompress(blob).splitlines())
+
+
+def query_audit_logs(
+    session: Session,
+    start: str | None = None,
+    end: str | None = None,
+    filters: dict[str, Any] | None = None,
+    after: tuple[str, int] | None = None,
+    limit: int = 1000,
+    archive_dir: Path | None = None,
+) -> list[dict[str, Any]]:
+    """Audit logs with start <= timestamp < end from the table and the archive, in (timestamp, id) order.
+
+    `filters` are equality matches on AuditLog columns; `after` is the
+    (timestamp, id) of the last row of the previous page.
+    """
+    archive_dir = archive_dir or AUDIT_ARCHIVE_DIR
+    filters = {k: v for k, v in (filters or {}).items() if v is not None}
+    log = models.AuditLog
+    sort_key = [(log.timestamp, False), (log.id, False)]
+
+    stmt = select(*_COLUMNS)
+    if start:
+        stmt = stmt.where(log.timestamp >= start)
+    if end:
+        stmt = stmt.where(log.timestamp < end)
+    for name, value in filters.items():
+        stmt = stmt.where(getattr(log, name) == value)
+    if after:
+        stmt = stmt.where(keyset_after(sort_key, after))
+    stmt = stmt.order_by(log.timestamp, log.id).limit(limit)
+    live = [dict(row) for row in session.execute(stmt).mappings()]
+
+    def key(row):
+        return row["timestamp"], row["id"]
+
+    def wanted(row) -> bool:
+        ts = row["timestamp"]
+        return (
+            (not start or ts >= start)
+            and (not end or ts < end)
+            and all(row.get(name) == value for name, value in filters.items())
+            and (after is None or key(row) > tuple(after))
+        )
+
+    low = max(filter(None, [start, after[0] if after else None]), default=None)
+    seg = models.AuditSegment
+    seg_stmt = select(seg).order_by(seg.min_ts, seg.id)
+    if low:
+        seg_stmt = seg_stmt.where(seg.max_ts >= low)
+    if end:
+        seg_stmt = seg_stmt.where(seg.min_ts < end)
+    archived: list[dict[str, Any]] = []
+    for segment in session.execute(seg_stmt).scalars():
+        # Segments come in min_ts order: once `limit` rows are held, a segment
+        # starting after the last of them cannot contribute
+        if len(archived) >= limit and segment.min_ts > archived[-1]["timestamp"]:
+            break
+        rows = _segment_rows(str(archive_dir / segment.path), segment.offset, segment.length, segment.sha256)
+        archived.extend(row for row in rows if wanted(row))
+        archived.sort(key=key)
+        del archived[limit:]
+
+    return sorted(live + archived, key=key)[:limit]
@@ -4,19 +4,19 @@ from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from sqlmodel import Session, select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from .database import get_session
+from .cache import MISSING, user_cache
+from .database import get_async_read_session
 from .models import User
+from .passwords import get_password_hash, pwd_context, verify_password  # noqa: F401
 
 # Security configuration
 SECRET_KEY = "your-secret-key-change-in-production"  # Change this in production!
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-# ✅ use pbkdf2_sha256 (stable on windows, no bcrypt 72-byte limit issues)
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
 security = HTTPBearer()
 
 
@@ -28,14 +28,6 @@ class UserModel:
         self.is_active: bool = True
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
-
-
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
-
-
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=15))
@@ -43,9 +35,9 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-def get_current_user(
+async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_read_session),
 ) -> UserModel:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -61,13 +53,22 @@ def get_current_user(
     except JWTError:
         raise credentials_exception
 
-    user = session.exec(select(User).where(User.username == username)).first()
-    if user is None:
+    # Resolved users are cached by token subject, so a valid token costs only
+    # the signature check; the cache is cleared whenever the user table changes
+    user_model = user_cache.get(username)
+    if user_model is MISSING:
+        generation = user_cache.generation
+        user = (await session.exec(select(User).where(User.username == username))).first()
+        user_model = None
+        if user is not None:
+            user_model = UserModel()
+            user_model.id = user.id
+            user_model.username = user.username
+            user_model.email = user.email
+            user_model.is_active = user.is_active
+        user_cache.set(username, user_model, generation=generation)
+    if user_model is None:
         raise credentials_exception
-
-    user_model = UserModel()
-    user_model.id = user.id
-    user_model.username = user.username
-    user_model.email = user.email
-    user_model.is_active = user.is_active
+    if not user_model.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
     return user_model
@@ -4,18 +4,18 @@ from typing import Optional
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel
-from sqlmodel import Session, select
+from sqlalchemy import update
+from sqlmodel import select
 
 from .auth import (
     ACCESS_TOKEN_EXPIRE_MINUTES,
     create_access_token,
     get_current_user,
-    get_password_hash,
-    verify_password,
     UserModel,
 )
-from .database import get_session
+from .database import async_session_scope
 from .models import User
+from .passwords import get_password_hash_async, verify_and_update_async
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
@@ -36,31 +36,44 @@ class Token(BaseModel):
     token_type: str = "bearer"
 
 
+# Hashing runs on the password executor (see passwords.py) while these handlers
+# await it. No connection is held across that wait: the lookup's read session
+# is closed first, and the write connection is only taken for the INSERT or a
+# rehash UPDATE.
+
+
+async def _find_user(username: str) -> Optional[User]:
+    async with async_session_scope(read_only=True) as session:
+        return (await session.exec(select(User).where(User.username == username))).first()
+
+
 @router.post("/register", response_model=dict)
-def register(user_data: UserCreate, session: Session = Depends(get_session)):
+async def register(user_data: UserCreate):
     """Register a new user"""
-    existing = session.exec(select(User).where(User.username == user_data.username)).first()
-    if existing:
+    if await _find_user(user_data.username):
         raise HTTPException(status_code=400, detail="Username already registered")
     
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash_async(user_data.password)
     user = User(
         username=user_data.username,
         email=user_data.email,
         hashed_password=hashed_password,
         is_active=True,
     )
-    session.add(user)
-    session.commit()
-    session.refresh(user)
+    async with async_session_scope() as write_session:
+        write_session.add(user)
+        await write_session.commit()
     return {"message": "User created successfully", "username": user.username}
 
 
 @router.post("/login", response_model=Token)
-def login(credentials: UserLogin, session: Session = Depends(get_session)):
+async def login(credentials: UserLogin):
     """Login and get access token"""
-    user = session.exec(select(User).where(User.username == credentials.username)).first()
-    if not user or not verify_password(credentials.password, user.hashed_password):
+    user = await _find_user(credentials.username)
+    valid, new_hash = (False, None)
+    if user:
+        valid, new_hash = await verify_and_update_async(credentials.password, user.hashed_password)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -68,6 +81,17 @@ def login(credentials: UserLogin, session: Session = Depends(get_session)):
         )
     if not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
+    if new_hash:
+        # Stored hash predates the current PASSWORD_HASH_ROUNDS; the plaintext is
+        # only available now, so upgrade it in place. Guarded on the old value in
+        # case a concurrent login or password change got there first.
+        async with async_session_scope() as write_session:
+            await write_session.execute(
+                update(User)
+                .where(User.id == user.id, User.hashed_password == user.hashed_password)
+                .values(hashed_password=new_hash)
+            )
+            await write_session.commit()
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
@@ -77,7 +101,7 @@ def login(credentials: UserLogin, session: Session = Depends(get_session)):
 
 
 @router.get("/me", response_model=dict)
-def read_users_me(current_user: UserModel = Depends(get_current_user)):
+async def read_users_me(current_user: UserModel = Depends(get_current_user)):
     """Get current user info"""
     return {
         "id": current_user.id,
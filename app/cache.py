@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable
+
+from . import models
+from .versions import add_change_listener
+
+REFERENCE_CACHE_TTL = float(os.getenv("REFERENCE_CACHE_TTL", "300"))
+REFERENCE_CACHE_SIZE = int(os.getenv("REFERENCE_CACHE_SIZE", "10000"))
+# Shorter: a user deactivated through another worker process stays valid here until expiry
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+
+MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU map with a per-entry time-to-live and hit/miss counters.
+
+    Writes through this process invalidate it at commit (see `reference_cache`);
+    the TTL bounds how long another worker process's writes can go unseen.
+    """
+
+    def __init__(self, name: str, maxsize: int = REFERENCE_CACHE_SIZE, ttl: float = REFERENCE_CACHE_TTL):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    @property
+    def generation(self) -> int:
+        """Read before loading a value; pass to `set` so a load that raced an invalidation is dropped."""
+        return self._generation
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, generation: int | None = None) -> None:
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._generation += 1
+            self.invalidations += 1
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+_caches: list[TTLCache] = []
+_caches_by_table: dict[str, list[TTLCache]] = {}
+
+
+def reference_cache(name: str, tables: Iterable[str], **kwargs) -> TTLCache:
+    """A TTLCache cleared whenever a transaction that wrote any of `tables` commits or rolls back."""
+    cache = TTLCache(name, **kwargs)
+    _caches.append(cache)
+    for table in tables:
+        _caches_by_table.setdefault(table, []).append(cache)
+    return cache
+
+
+def _invalidate(tables: set[str]) -> None:
+    for cache in {c for t in tables for c in _caches_by_table.get(t, ())}:
+        cache.clear()
+
+
+add_change_listener(_invalidate)
+
+
+def cache_stats() -> list[dict[str, Any]]:
+    return [c.stats() for c in _caches]
+
+
+# Token subject (username) -> auth.UserModel, or None for unknown users. Shared
+# between requests, so treat cached users as read-only.
+user_cache = reference_cache("users", [models.User.__tablename__], ttl=USER_CACHE_TTL)
+
+# Natural key -> id, for importers resolving names and codes to rows
+lookup_caches: dict[type, TTLCache] = {
+    model: reference_cache(f"{model.__tablename__}_lookup", [model.__tablename__])
+    for model in (models.Region, models.District, models.Landmark)
+}
+
+# Id/name lists served by GET /reference
+reference_lists = reference_cache(
+    "reference_lists", [m.__tablename__ for m in (models.Region, models.District, models.Landmark)], maxsize=16
+)
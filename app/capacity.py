@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import ipaddress
+import os
+from typing import Any
+
+from fastapi import APIRouter, Depends, Query, Request, Response
+from sqlalchemy import select
+from sqlmodel import Session
+
+from . import models
+from .database import get_read_session
+from .responses import ORJSONResponse
+from .versions import conditional
+
+# Address capacity per proposed subnet and VLAN. The counts come from the
+# SubnetUsage rollup, which triggers on the component table keep current for
+# every write path, so these endpoints read a table with one row per
+# (district, VLAN, subnet) and never scan components. Subnet sizes and free
+# address estimates are worked out here from the CIDR text.
+CAPACITY_MAX_RESULTS = int(os.getenv("CAPACITY_MAX_RESULTS", "5000"))
+
+# Sizes above this (IPv6) are reported as null: effectively never full
+_MAX_SIZE = 2 ** 53
+
+router = APIRouter(prefix="/capacity", tags=["Capacity"])
+
+_MODELS = [models.Component, models.District]
+
+
+def _network(subnet: str):
+    try:
+        return ipaddress.ip_network(subnet.strip(), strict=False)
+    except ValueError:
+        return None
+
+
+def _usable(network) -> int | None:
+    """Assignable addresses: IPv4 networks up to /30 lose the network and broadcast addresses."""
+    if network is None or network.num_addresses > _MAX_SIZE:
+        return None
+    if network.version == 4 and network.prefixlen <= 30:
+        return network.num_addresses - 2
+    return network.num_addresses
+
+
+def _estimate(size: int | None, addressed: int) -> dict[str, Any]:
+    if size is None:
+        return {"size": None, "free": None, "utilization": None}
+    return {"size": size, "free": max(0, size - addressed), "utilization": round(addressed / size, 4) if size else None}
+
+
+def _usage_rows(session: Session, *where) -> list[tuple]:
+    u = models.SubnetUsage
+    stmt = (
+        select(u.district_id, models.District.name, u.vlan, u.subnet, u.components, u.addressed)
+        .outerjoin(models.District, models.District.id == u.district_id)
+        .where(*where)
+    )
+    return session.execute(stmt).all()
+
+
+def _subnet_order(name: str, network) -> tuple:
+    if network is None:
+        return (1, 0, 0, 0, name)
+    return (0, network.version, int(network.network_address), network.prefixlen, name)
+
+
+def _district(district_id: int, name: str | None, components: int, addressed: int) -> dict[str, Any]:
+    return {"district_id": district_id or None, "district": name, "components": components, "addressed": addressed}
+
+
+def _ranked(items: list[dict[str, Any]], key: str) -> list[dict[str, Any]]:
+    # Fullest first; unknown sizes last
+    return sorted(items, key=lambda i: (i["utilization"] is None, -(i["utilization"] or 0), i[key]))
+
+
+@router.get("/subnets")
+def subnet_capacity(
+    request: Request,
+    response: Response,
+    district_id: int | None = Query(None, description="Subnets used in this district"),
+    vlan: str | None = Query(None),
+    limit: int = Query(500, ge=1, le=CAPACITY_MAX_RESULTS),
+    session: Session = Depends(get_read_session),
+):
+    """Components and addresses used per proposed subnet, fullest first.
+
+    Subnets are grouped by network, so "10.0.0.5/24" and "10.0.0.0/24" are
+    one subnet; `free` is its assignable addresses minus the components with a
+    local_if_ip, across all districts. Values that are not subnets are listed
+    with a null size.
+    """
+    not_modified = conditional(request, response, session, _MODELS)
+    if not_modified:
+        return not_modified
+    groups: dict[str, dict[str, Any]] = {}
+    # Filters pick subnets; a picked subnet's usage is still counted over every
+    # district and spelling of it, so all rollup rows with a subnet are read
+    for d_id, d_name, row_vlan, subnet, components, addressed in _usage_rows(session, models.SubnetUsage.subnet != ""):
+        network = _network(subnet)
+        name = str(network) if network is not None else subnet
+        group = groups.get(name)
+        if group is None:
+            group = groups[name] = {
+                "subnet": name, "valid": network is not None, "network": network, "picked": False,
+                "vlans": set(), "components": 0, "addressed": 0, "districts": {},
+            }
+        if (district_id is None or d_id == district_id) and (vlan is None or row_vlan == vlan):
+            group["picked"] = True
+        if row_vlan:
+            group["vlans"].add(row_vlan)
+        group["components"] += components
+        group["addressed"] += addressed
+        per = group["districts"].setdefault(d_id, [d_name, 0, 0])
+        per[1] += components
+        per[2] += addressed
+    items = []
+    for group in groups.values():
+        if not group["picked"]:
+            continue
+        items.append({
+            "subnet": group["subnet"],
+            "valid": group["valid"],
+            "vlans": sorted(group["vlans"]),
+            "components": group["components"],
+            "addressed": group["addressed"],
+            **_estimate(_usable(group["network"]), group["addressed"]),
+            "districts": [
+                _district(d_id, *per) for d_id, per in sorted(group["districts"].items(), key=lambda kv: -kv[1][1])
+            ],
+        })
+    items = _ranked(items, "subnet")
+    return ORJSONResponse({"total": len(items), "subnets": items[:limit]}, headers=dict(response.headers))
+
+
+@router.get("/vlans")
+def vlan_capacity(
+    request: Request,
+    response: Response,
+    district_id: int | None = Query(None, description="VLANs used in this district"),
+    limit: int = Query(500, ge=1, le=CAPACITY_MAX_RESULTS),
+    session: Session = Depends(get_read_session),
+):
+    """Components, subnets and addresses used per proposed VLAN, fullest first.
+
+    A VLAN's size is the sum of its distinct valid subnets.
+    """
+    not_modified = conditional(request, response, session, _MODELS)
+    if not_modified:
+        return not_modified
+    u = models.SubnetUsage
+    where = [u.vlan != ""]
+    if district_id is not None:
+        where.append(u.vlan.in_(select(u.vlan).where(u.district_id == district_id, u.vlan != "")))
+    groups: dict[str, dict[str, Any]] = {}
+    for d_id, d_name, vlan, subnet, components, addressed in _usage_rows(session, *where):
+        group = groups.get(vlan)
+        if group is None:
+            group = groups[vlan] = {"subnets": {}, "components": 0, "addressed": 0, "districts": {}}
+        if subnet:
+            network = _network(subnet)
+            group["subnets"][str(network) if network is not None else subnet] = network
+        group["components"] += components
+        group["addressed"] += addressed
+        per = group["districts"].setdefault(d_id, [d_name, 0, 0])
+        per[1] += components
+        per[2] += addressed
+    items = []
+    for vlan, group in groups.items():
+        sizes = [_usable(n) for n in group["subnets"].values() if n is not None]
+        size = sum(sizes) if sizes and None not in sizes else None
+        items.append({
+            "vlan": vlan,
+            "subnets": sorted(group["subnets"], key=lambda name: _subnet_order(name, group["subnets"][name])),
+            "components": group["components"],
+            "addressed": group["addressed"],
+            **_estimate(size, group["addressed"]),
+            "districts": [
+                _district(d_id, *per) for d_id, per in sorted(group["districts"].items(), key=lambda kv: -kv[1][1])
+            ],
+        })
+    items = _ranked(items, "vlan")
+    return ORJSONResponse({"total": len(items), "vlans": items[:limit]}, headers=dict(response.headers))
+
+
+@router.get("/districts")
+def district_capacity(request: Request, response: Response, session: Session = Depends(get_read_session)):
+    """Per district: components with a proposed subnet or VLAN, addresses used, and how many subnets and VLANs."""
+    not_modified = conditional(request, response, session, _MODELS)
+    if not_modified:
+        return not_modified
+    districts: dict[int, dict[str, Any]] = {}
+    for d_id, d_name, vlan, subnet, components, addressed in _usage_rows(session):
+        d = districts.get(d_id)
+        if d is None:
+            d = districts[d_id] = {**_district(d_id, d_name, 0, 0), "subnets": set(), "vlans": set()}
+        d["components"] += components
+        d["addressed"] += addressed
+        if subnet:
+            network = _network(subnet)
+            d["subnets"].add(str(network) if network is not None else subnet)
+        if vlan:
+            d["vlans"].add(vlan)
+    body = [
+        {**d, "subnets": len(d["subnets"]), "vlans": len(d["vlans"])}
+        for d in sorted(districts.values(), key=lambda d: -d["components"])
+    ]
+    return ORJSONResponse(body, headers=dict(response.headers))
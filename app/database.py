@@ -1,25 +1,146 @@
-from contextlib import contextmanager
-from typing import Iterator
+import os
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Iterator
 
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from . import versions  # noqa: F401  (registers per-table change-version listeners)
+from .migrations import run_migrations
 
-def get_engine(db_url: str | None = None):
-    url = db_url or "sqlite:///./inventory.db"
-    connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
-    return create_engine(url, connect_args=connect_args, echo=False)
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./inventory.db")
+
+# SQLite PRAGMAs applied to every new connection. "balanced" is the default:
+# WAL lets readers run alongside a writer, and busy_timeout makes a second
+# writer wait instead of failing with "database is locked".
+STORAGE_PROFILES: dict[str, dict[str, object]] = {
+    "legacy": {},  # SQLite defaults: rollback journal; only the driver's 5 s lock wait
+    "balanced": {
+        "auto_vacuum": "INCREMENTAL",  # takes effect on new files; see workbooks.reclaim_space
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "cache_size": -65536,  # KiB, i.e. 64 MiB
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+    },
+    "durable": {
+        "auto_vacuum": "INCREMENTAL",
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "busy_timeout": 10000,
+        "cache_size": -16384,
+        "mmap_size": 0,
+    },
+    "fast": {
+        "auto_vacuum": "INCREMENTAL",
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "busy_timeout": 5000,
+        "cache_size": -262144,
+        "mmap_size": 1073741824,
+        "temp_store": "MEMORY",
+    },
+}
+STORAGE_PROFILE = os.getenv("STORAGE_PROFILE", "balanced")
+READ_POOL_SIZE = int(os.getenv("READ_POOL_SIZE", "8"))
+
+# Async drivers for the same databases; ASYNC_DATABASE_URL overrides the mapping
+_ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def async_url(url: str) -> str:
+    """sqlite:///x.db -> sqlite+aiosqlite:///x.db, postgresql[+psycopg2]://... -> postgresql+asyncpg://..."""
+    scheme, sep, rest = url.partition("://")
+    driver = _ASYNC_DRIVERS.get(scheme.split("+")[0])
+    return f"{driver}{sep}{rest}" if driver else url
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or async_url(DATABASE_URL)
+
+
+def storage_pragmas(profile: str | None = None) -> dict[str, object]:
+    """Profile PRAGMAs plus overrides from SQLITE_PRAGMAS="cache_size=-20000,mmap_size=0"."""
+    name = profile or STORAGE_PROFILE
+    if name not in STORAGE_PROFILES:
+        raise ValueError(f"Unknown STORAGE_PROFILE {name!r}; expected one of {sorted(STORAGE_PROFILES)}")
+    pragmas = dict(STORAGE_PROFILES[name])
+    for item in os.getenv("SQLITE_PRAGMAS", "").split(","):
+        key, sep, value = item.partition("=")
+        if sep and key.strip():
+            pragmas[key.strip()] = value.strip()
+    return pragmas
+
+
+def _install_pragmas(engine, pragmas: dict[str, object], read_only: bool) -> None:
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_conn, connection_record):
+        cursor = dbapi_conn.cursor()
+        for key, value in pragmas.items():
+            cursor.execute(f"PRAGMA {key}={value}")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+
+def _is_sqlite_file(url: str) -> bool:
+    return url.startswith("sqlite") and url not in ("sqlite://", "sqlite:///:memory:")
+
+
+def get_engine(db_url: str | None = None, profile: str | None = None, read_only: bool = False):
+    url = db_url or DATABASE_URL
+    if not url.startswith("sqlite"):
+        return create_engine(url, echo=False, pool_pre_ping=True)
+    if not _is_sqlite_file(url):
+        return create_engine(url, connect_args={"check_same_thread": False}, echo=False)
+
+    # A write engine holds one connection, so writes through that engine queue
+    # in its pool. The sync, async and audit engines are separate writers, as
+    # are other worker processes; busy_timeout makes them wait for each other's
+    # write lock. Readers get their own pool and never take the write lock.
+    pool = {"pool_size": READ_POOL_SIZE, "max_overflow": READ_POOL_SIZE} if read_only else {"pool_size": 1, "max_overflow": 0}
+    engine = create_engine(url, connect_args={"check_same_thread": False}, echo=False, **pool)
+    _install_pragmas(engine, storage_pragmas(profile), read_only)
+    return engine
+
+
+def get_async_engine(db_url: str | None = None, profile: str | None = None, read_only: bool = False):
+    """Async counterpart of `get_engine`, with the same pools and PRAGMAs."""
+    url = db_url or ASYNC_DATABASE_URL
+    if not url.startswith("sqlite"):
+        return create_async_engine(url, echo=False, pool_pre_ping=True)
+    if not _is_sqlite_file(url):
+        return create_async_engine(url, echo=False)
+
+    pool = {"pool_size": READ_POOL_SIZE, "max_overflow": READ_POOL_SIZE} if read_only else {"pool_size": 1, "max_overflow": 0}
+    # aiosqlite defaults to NullPool; pool explicitly so this engine still writes through one connection
+    engine = create_async_engine(url, echo=False, poolclass=AsyncAdaptedQueuePool, **pool)
+    _install_pragmas(engine.sync_engine, storage_pragmas(profile), read_only)
+    return engine
 
 
 engine = get_engine()
+# Separate read pool only for file-backed SQLite; elsewhere one engine serves both
+read_engine = get_engine(read_only=True) if _is_sqlite_file(DATABASE_URL) else engine
+# The audit writer's own connection, so an import holding the write pool's
+# only connection cannot starve it; SQLite's busy_timeout orders the two writers
+audit_engine = get_engine() if _is_sqlite_file(DATABASE_URL) else engine
+
+async_engine = get_async_engine()
+async_read_engine = get_async_engine(read_only=True) if _is_sqlite_file(ASYNC_DATABASE_URL) else async_engine
 
 
 def init_db():
     SQLModel.metadata.create_all(engine)
+    run_migrations(engine)
 
 
 @contextmanager
-def session_scope() -> Iterator[Session]:
-    with Session(engine) as session:
+def session_scope(read_only: bool = False) -> Iterator[Session]:
+    with Session(read_engine if read_only else engine) as session:
         yield session
 
 
@@ -27,3 +148,27 @@ def get_session() -> Iterator[Session]:
     with session_scope() as session:
         yield session
 
+
+def get_read_session() -> Iterator[Session]:
+    """Session on the read pool; use for handlers that never write."""
+    with session_scope(read_only=True) as session:
+        yield session
+
+
+@asynccontextmanager
+async def async_session_scope(read_only: bool = False) -> AsyncIterator[AsyncSession]:
+    # Objects stay loaded after commit; an expired attribute cannot lazy-load
+    # outside the session's greenlet
+    async with AsyncSession(async_read_engine if read_only else async_engine, expire_on_commit=False) as session:
+        yield session
+
+
+async def get_async_session() -> AsyncIterator[AsyncSession]:
+    """Session for `async def` handlers; they run on the event loop, not the threadpool."""
+    async with async_session_scope() as session:
+        yield session
+
+
+async def get_async_read_session() -> AsyncIterator[AsyncSession]:
+    async with async_session_scope(read_only=True) as session:
+        yield session
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+from typing import Iterable
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def supports_upsert(dialect_name: str) -> bool:
+    return dialect_name in _INSERTS
+
+
+def upsert_stmt(
+    dialect_name: str,
+    model,
+    index_elements: list[str],
+    update_columns: Iterable[str] = (),
+    set_: dict | None = None,
+    increment_columns: Iterable[str] = (),
+):
+    """INSERT ... ON CONFLICT (index_elements) DO UPDATE for SQLite and PostgreSQL.
+
+    Conflicting rows take the incoming value for each of `update_columns`,
+    and add it to the stored value for each of `increment_columns` (counters),
+    unless an explicit `set_` is given. Execute with a list of row dicts for
+    a batched upsert.
+    """
+    if not supports_upsert(dialect_name):
+        raise NotImplementedError(f"Upsert is not implemented for dialect {dialect_name!r}")
+    stmt = _INSERTS[dialect_name](model)
+    if set_ is None:
+        set_ = {c: stmt.excluded[c] for c in update_columns if c not in index_elements}
+        set_.update({c: getattr(model, c) + stmt.excluded[c] for c in increment_columns})
+    return stmt.on_conflict_do_update(index_elements=index_elements, set_=set_)
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import copy
+from typing import Any
+
+# Field-level changes as JSON Patch (RFC 6902) documents, stored in
+# AuditLog.new_value (the patch that made the change) and AuditLog.old_value
+# (its inverse). Only changed fields are recorded. Nested objects such as
+# ExcelRow.data are diffed per key. A created entity's new_value holds the whole
+# row as an "add" at the document root; a deleted one's old_value does the same,
+# so undoing entries newest-first from the current row rebuilds any past state.
+
+Patch = list[dict[str, Any]]
+
+
+def _escape(key: str) -> str:
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def json_patch(before: dict[str, Any] | None, after: dict[str, Any] | None, path: str = "") -> tuple[Patch, Patch]:
+    """(patch, inverse) turning `before` into `after` and back; None means the entity does not exist."""
+    if before is None or after is None:
+        if before is None and after is None:
+            return [], []
+        if before is None:
+            return [{"op": "add", "path": path, "value": after}], [{"op": "remove", "path": path}]
+        return [{"op": "remove", "path": path}], [{"op": "add", "path": path, "value": before}]
+    forward: Patch = []
+    inverse: Patch = []
+    for key in sorted(before.keys() - after.keys(), key=str):
+        forward.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+        inverse.append({"op": "add", "path": f"{path}/{_escape(key)}", "value": before[key]})
+    for key, new in after.items():
+        pointer = f"{path}/{_escape(key)}"
+        if key not in before:
+            forward.append({"op": "add", "path": pointer, "value": new})
+            inverse.append({"op": "remove", "path": pointer})
+        elif isinstance(new, dict) and isinstance(before[key], dict):
+            f, i = json_patch(before[key], new, pointer)
+            forward.extend(f)
+            inverse.extend(i)
+        elif new != before[key]:
+            forward.append({"op": "replace", "path": pointer, "value": new})
+            inverse.append({"op": "replace", "path": pointer, "value": before[key]})
+    return forward, inverse
+
+
+def apply_patch(doc: dict[str, Any] | None, patch: Patch) -> dict[str, Any] | None:
+    """Apply a patch from `json_patch` to a copy of `doc`.
+
+    Supports the add/remove/replace operations it produces; raises ValueError
+    when a path does not fit the document.
+    """
+    doc = copy.deepcopy(doc)
+    for op in patch:
+        kind, path = op.get("op"), op.get("path", "")
+        if path == "":
+            if kind == "remove":
+                doc = None
+            elif kind in ("add", "replace"):
+                doc = copy.deepcopy(op["value"])
+            else:
+                raise ValueError(f"Unsupported operation {kind!r}")
+            continue
+        tokens = [_unescape(t) for t in path.lstrip("/").split("/")]
+        parent = doc
+        for token in tokens[:-1]:
+            parent = parent.get(token) if isinstance(parent, dict) else None
+        key = tokens[-1]
+        if not isinstance(parent, dict):
+            raise ValueError(f"Path {path} not found")
+        if kind == "remove":
+            if key not in parent:
+                raise ValueError(f"Path {path} not found")
+            del parent[key]
+        elif kind in ("add", "replace"):
+            if kind == "replace" and key not in parent:
+                raise ValueError(f"Path {path} not found")
+            parent[key] = copy.deepcopy(op["value"])
+        else:
+            raise ValueError(f"Unsupported operation {kind!r}")
+    return doc
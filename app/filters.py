@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import sys
+from typing import Any, Iterable, Type
+
+from fastapi import HTTPException, status
+from sqlalchemy import String
+from sqlmodel import SQLModel
+
+from .pagination import SortKey
+
+# Query parameters with their own meaning on list endpoints. Other parameters
+# named `field` or `field__op` after a model column are filters; the rest
+# (cache-busters, tracking tags) are ignored.
+RESERVED_PARAMS = {"limit", "offset", "skip", "after", "fields", "include", "sort"}
+
+FILTER_OPS = {"eq", "ne", "in", "gt", "gte", "lt", "lte", "prefix", "isnull"}
+
+
+def _bad_request(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+
+def _column(model: Type[SQLModel], name: str):
+    columns = model.__table__.c
+    if name not in columns:
+        raise _bad_request(f"Unknown field: {name}")
+    return columns[name]
+
+
+def _coerce(column, raw: str) -> Any:
+    try:
+        py_type = column.type.python_type
+    except NotImplementedError:
+        return raw
+    if py_type is bool:
+        return raw.lower() in ("1", "true", "yes")
+    try:
+        return py_type(raw)
+    except (TypeError, ValueError):
+        raise _bad_request(f"Invalid value for {column.name}: {raw!r}")
+
+
+def _is_text(column) -> bool:
+    # SQLModel's AutoString wraps String in a TypeDecorator
+    return isinstance(getattr(column.type, "impl", column.type), String)
+
+
+def _prefix_upper_bound(prefix: str) -> str | None:
+    """"abc" -> "abd": prefix match as a range so it can use a B-tree index.
+
+    Trailing U+10FFFF cannot be incremented and is dropped first; None when
+    nothing is left, i.e. the range has no upper bound.
+    """
+    prefix = prefix.rstrip(chr(sys.maxunicode))
+    if not prefix:
+        return None
+    code = ord(prefix[-1]) + 1
+    if 0xD800 <= code <= 0xDFFF:
+        code = 0xE000  # surrogates are not characters a driver can encode
+    return prefix[:-1] + chr(code)
+
+
+def parse_filters(model: Type[SQLModel], params: Iterable[tuple[str, str]]) -> list:
+    """Compile `field=v`, `field__in=a,b`, `field__gte=v`, `field__prefix=v`, ... into WHERE clauses."""
+    clauses = []
+    for key, raw in params:
+        if key in RESERVED_PARAMS:
+            continue
+        name, _, op = key.partition("__")
+        if name not in model.__table__.c:
+            continue
+        op = op or "eq"
+        if op not in FILTER_OPS:
+            raise _bad_request(f"Unknown filter operator: {op}")
+        col = model.__table__.c[name]
+
+        if op == "isnull":
+            clauses.append(col.is_(None) if raw.lower() in ("1", "true", "yes") else col.is_not(None))
+        elif op == "in":
+            clauses.append(col.in_([_coerce(col, v) for v in raw.split(",") if v != ""]))
+        elif op == "prefix":
+            if not _is_text(col):
+                raise _bad_request(f"__prefix needs a text field: {name}")
+            if not raw:
+                continue
+            clauses.append(col >= raw)
+            upper = _prefix_upper_bound(raw)
+            if upper is not None:
+                clauses.append(col < upper)
+        else:
+            value = _coerce(col, raw)
+            clauses.append({
+                "eq": col == value,
+                "ne": col != value,
+                "gt": col > value,
+                "gte": col >= value,
+                "lt": col < value,
+                "lte": col <= value,
+            }[op])
+    return clauses
+
+
+def parse_sort(model: Type[SQLModel], sort: str | None) -> SortKey:
+    """`sort=-district_id,code` -> [(district_id, desc), (code, asc), (id, asc)]."""
+    key: list[tuple[Any, bool]] = []
+    seen = set()
+    for part in (sort or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        desc = part.startswith("-")
+        name = part.lstrip("+-")
+        if name in seen:
+            continue
+        seen.add(name)
+        key.append((_column(model, name), desc))
+    if "id" not in seen:
+        # Primary key tie-breaker keeps the order total for keyset cursors
+        key.append((_column(model, "id"), False))
+    return key
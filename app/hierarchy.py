@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import or_
+from sqlmodel import Session, select
+
+from . import models
+from .database import get_read_session
+from .responses import ORJSONResponse
+from .versions import conditional
+
+router = APIRouter(prefix="/hierarchy", tags=["Hierarchy"])
+
+# (level name, model, columns to return, parent candidates from deepest up)
+# A row hangs under its deepest parent id that is set: a component without a
+# JB shows up under its pole, but one whose JB is outside the tree is an
+# orphan rather than being moved up to its pole.
+LEVELS = [
+    ("regions", models.Region, ["id", "name"], []),
+    ("districts", models.District, ["id", "name", "region_id"], [("regions", "region_id")]),
+    ("landmarks", models.Landmark, ["id", "code", "name", "lat", "lng", "district_id"],
+     [("districts", "district_id")]),
+    ("poles", models.Pole, ["id", "code", "location_name", "lat", "lng", "landmark_id", "district_id"],
+     [("landmarks", "landmark_id"), ("districts", "district_id")]),
+    ("junction_boxes", models.JunctionBox, ["id", "code", "lat", "lng", "pole_id", "landmark_id", "district_id"],
+     [("poles", "pole_id"), ("landmarks", "landmark_id"), ("districts", "district_id")]),
+    ("components", models.Component,
+     ["id", "component_code", "component_type", "lat", "lng", "jb_id", "pole_id", "landmark_id", "district_id", "region_id"],
+     [("junction_boxes", "jb_id"), ("poles", "pole_id"), ("landmarks", "landmark_id"),
+      ("districts", "district_id"), ("regions", "region_id")]),
+]
+LEVEL_INDEX = {name: i for i, (name, *_rest) in enumerate(LEVELS)}
+
+
+def _scope_column(model, region_id: int | None, district_id: int | None) -> tuple[str, int] | None:
+    """(column, value) tying a level to the subtree; every table below Region carries region/district ids."""
+    if district_id is not None:
+        return ("id" if model is models.District else "district_id"), district_id
+    if region_id is not None:
+        return ("id" if model is models.Region else "region_id"), region_id
+    return None
+
+
+def _scope(model, scope: tuple[str, int] | None) -> list:
+    """Restrict a level to the subtree.
+
+    Rows whose (optional) region/district id is unset are fetched too: they
+    belong to the subtree when their parent does.
+    """
+    if scope is None:
+        return []
+    column = model.__table__.c[scope[0]]
+    if column.nullable:
+        return [or_(column == scope[1], column.is_(None))]
+    return [column == scope[1]]
+
+
+@router.get("")
+def get_hierarchy(
+    request: Request,
+    response: Response,
+    region_id: int | None = Query(None),
+    district_id: int | None = Query(None),
+    depth: int = Query(len(LEVELS) - 1, ge=0, le=len(LEVELS) - 1, description="Levels below the root to expand"),
+    session: Session = Depends(get_read_session),
+):
+    """Region/district subtree in one response: one query per level, no lazy loading.
+
+    `counts` holds the rows placed in the tree per level, expanded or not.
+    `orphans` counts rows of the subtree whose deepest parent is missing from
+    it (a dangling id, or a parent filed under another region or district).
+    """
+    not_modified = conditional(request, response, session, [m for _, m, _, _ in LEVELS])
+    if not_modified:
+        return not_modified
+
+    root_level = LEVEL_INDEX["districts"] if district_id is not None else LEVEL_INDEX["regions"]
+    last_level = min(root_level + depth, len(LEVELS) - 1)
+
+    # Ids placed per level; expanded levels map them to their nodes
+    nodes: Dict[str, Dict[int, dict | None]] = {}
+    counts: Dict[str, int] = {}
+    orphans: Dict[str, int] = {}
+    roots: List[dict] = []
+    for level in range(root_level, len(LEVELS)):
+        name, model, cols, parents = LEVELS[level]
+        scope = _scope_column(model, region_id, district_id)
+        expanded = level <= last_level
+        # Below the requested depth only the ids needed to place rows are read
+        wanted = cols if expanded else ["id"]
+        fetch = list(dict.fromkeys([*wanted, *(fk for _, fk in parents), *([scope[0]] if scope else [])]))
+        table = model.__table__.c
+        rows = session.execute(
+            select(*[table[c] for c in fetch]).where(*_scope(model, scope)).order_by(table["id"])
+        ).all()
+
+        level_nodes = nodes.setdefault(name, {})
+        orphans[name] = 0
+        for row in rows:
+            values = row._mapping
+            node: Dict[str, Any] | None = None
+            if expanded:
+                node = {"type": name, **{c: values[c] for c in cols}}
+                if level < last_level:
+                    node["children"] = []
+            if level == root_level:
+                level_nodes[row.id] = node
+                roots.append(node)
+                continue
+            parent_level, fk = next(((p, fk) for p, fk in parents if values[fk] is not None), (None, None))
+            siblings = nodes.get(parent_level, {})
+            if fk is not None and values[fk] in siblings:
+                level_nodes[row.id] = node
+                parent = siblings[values[fk]]
+                if node is not None and parent is not None:
+                    parent["children"].append(node)
+            elif scope is None or values[scope[0]] is not None:
+                orphans[name] += 1
+        counts[name] = len(level_nodes)
+
+    if (region_id is not None or district_id is not None) and not roots:
+        raise HTTPException(status_code=404, detail="Not found")
+
+    return ORJSONResponse(
+        {"depth": last_level - root_level, "counts": counts, "orphans": orphans, "tree": roots},
+        headers=dict(response.headers),
+    )
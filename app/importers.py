@@ -13,7 +13,12 @@ from pydantic import BaseModel
 from sqlmodel import Session, select
 
 from . import models
+from .cache import MISSING, lookup_caches
 from .database import get_session
+from .dialects import supports_upsert, upsert_stmt
+from .workbooks import delete_workbooks, expired_workbooks
+
+UPSERT_BATCH_SIZE = 500
 
 def _excel_col_letter(n: int) -> str:
     """1-based column number -> Excel letter (A..Z, AA..)."""
@@ -117,7 +122,14 @@ def store_workbook_raw(path: Path, session: Session, filename_override: str | No
             session.add(models.ExcelRow(sheet_id=sheet.id, row_index=r, data=row_data))
 
     session.commit()
-    return {"workbook_id": book.id, "filename": book.filename, "sha256": sha, "deduped": False}
+
+    # Retention: older versions of this filename beyond the policy go now; the
+    # freed pages are reused by the next upload
+    pruned = expired_workbooks(session, filename=filename)
+    if pruned:
+        delete_workbooks(session, pruned)
+        session.commit()
+    return {"workbook_id": book.id, "filename": book.filename, "sha256": sha, "deduped": False, "pruned": pruned}
 
 class Enum1ImportRequest(BaseModel):
     file_path: str
@@ -135,15 +147,40 @@ class SheetImportRequest(BaseModel):
     sheet_name: str | None = None
 
 
+def _cached_get(session: Session, model, key: tuple):
+    """Row for a natural key via the reference cache; returns (obj or None, cache generation)."""
+    cache = lookup_caches.get(model)
+    if cache is None:
+        return None, None
+    generation = cache.generation
+    cached_id = cache.get(key)
+    if cached_id is not MISSING:
+        # Identity map first, then a primary-key read; None if the row is gone
+        obj = session.get(model, cached_id)
+        if obj is not None:
+            return obj, generation
+    return None, generation
+
+
+def _remember(model, key: tuple, obj, generation: int | None) -> None:
+    cache = lookup_caches.get(model)
+    if cache is not None:
+        cache.set(key, obj.id, generation=generation)
+
+
 def _get_or_create(session: Session, model, defaults: dict | None = None, **filters):
-    stmt = select(model).filter_by(**filters)
-    obj = session.exec(stmt).first()
+    key = tuple(sorted(filters.items()))
+    obj, generation = _cached_get(session, model, key)
     if obj:
         return obj
-    obj = model(**filters, **(defaults or {}))
-    session.add(obj)
-    session.flush()
-    session.refresh(obj)
+    stmt = select(model).filter_by(**filters)
+    obj = session.exec(stmt).first()
+    if not obj:
+        obj = model(**filters, **(defaults or {}))
+        session.add(obj)
+        session.flush()
+        session.refresh(obj)
+    _remember(model, key, obj, generation)
     return obj
 
 
@@ -178,15 +215,18 @@ def _get_or_create_by_code(
     Lookup strictly by unique 'code' column, to avoid UNIQUE constraint failures.
     If creating new, defaults MUST contain any NOT NULL foreign keys for this model.
     """
-    stmt = select(model).where(model.code == code_value)
-    obj = session.exec(stmt).first()
+    key = (("code", code_value),)
+    obj, generation = _cached_get(session, model, key)
     if obj:
         return obj
-
-    obj = model(code=code_value, **(defaults or {}))
-    session.add(obj)
-    session.flush()      # flush is safe only if defaults satisfy NOT NULL constraints
-    session.refresh(obj)
+    stmt = select(model).where(model.code == code_value)
+    obj = session.exec(stmt).first()
+    if not obj:
+        obj = model(code=code_value, **(defaults or {}))
+        session.add(obj)
+        session.flush()      # flush is safe only if defaults satisfy NOT NULL constraints
+        session.refresh(obj)
+    _remember(model, key, obj, generation)
     return obj
 
 
@@ -199,6 +239,18 @@ def _find_header_row(rows: Iterable[Sequence], required_columns: list[str]) -> t
     raise HTTPException(status_code=400, detail="Could not find header row with required columns")
 
 
+def _upsert_components(session: Session, pending: dict[str, dict]) -> None:
+    """Write buffered component rows with one INSERT ... ON CONFLICT (component_code)."""
+    if not pending:
+        return
+    rows = list(pending.values())
+    stmt = upsert_stmt(
+        session.get_bind().dialect.name, models.Component, ["component_code"], update_columns=rows[0].keys()
+    )
+    session.execute(stmt, rows)
+    pending.clear()
+
+
 def import_enum1(path: Path, sheet_name: str, session: Session) -> Enum1ImportResult:
     if not path.exists():
         raise HTTPException(status_code=400, detail=f"File not found: {path}")
@@ -221,6 +273,8 @@ def import_enum1(path: Path, sheet_name: str, session: Session) -> Enum1ImportRe
         return row[idx] if idx is not None else None
 
     ingested = skipped = 0
+    upsert = supports_upsert(session.get_bind().dialect.name)
+    pending: dict[str, dict] = {}
 
     for row in rows:
         component_code = col("Component ID", row)
@@ -366,19 +420,26 @@ def import_enum1(path: Path, sheet_name: str, session: Session) -> Enum1ImportRe
             rtsp_port=_to_str(col("RTSP Port", row)),
         )
 
-        existing = session.exec(
-            select(models.Component).where(models.Component.component_code == payload.component_code)
-        ).first()
-
-        if existing:
-            for k, v in payload.dict(exclude_unset=True).items():
-                setattr(existing, k, v)
-            session.add(existing)
+        if upsert:
+            # Last row wins for a code repeated in the sheet, as with the per-row path
+            pending[payload.component_code] = payload.dict(exclude_unset=True)
+            if len(pending) >= UPSERT_BATCH_SIZE:
+                _upsert_components(session, pending)
         else:
-            session.add(payload)
+            existing = session.exec(
+                select(models.Component).where(models.Component.component_code == payload.component_code)
+            ).first()
+
+            if existing:
+                for k, v in payload.dict(exclude_unset=True).items():
+                    setattr(existing, k, v)
+                session.add(existing)
+            else:
+                session.add(payload)
 
         ingested += 1
 
+    _upsert_components(session, pending)
     session.commit()
     return Enum1ImportResult(rows_ingested=ingested, rows_skipped=skipped, message="Import finished")
 
@@ -0,0 +1,472 @@
+from __future__ import annotations
+
+import functools
+import ipaddress
+import os
+import socket
+import threading
+import time
+from collections import Counter
+from typing import Any, NamedTuple
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy import inspect, or_, select
+from sqlmodel import Session
+
+from . import models
+from .database import get_read_session
+from .responses import ORJSONResponse
+from .versions import (
+    APPLY,
+    RELOAD,
+    CommitListener,
+    add_commit_listener,
+    conditional,
+    table_versions,
+    version_step,
+)
+
+# IP address consistency across hand-entered fields: Component.local_if_ip,
+# remote_if_ip and static_router_ip, and Credential.ip_address. Each row is
+# parsed once into its addresses and proposed_subnet, indexed by address (for
+# duplicates) and by subnet (for overlaps). The index is kept at the versions
+# of the component and credential tables, like the topology graph, but changed
+# rows are only queued by a commit and re-read on the next check:
+# - ORM commits queue the rows they touched;
+# - bulk statements that carry their rows (importer upserts, /bulk updates by
+#   id) queue those rows;
+# - other bulk statements and writes from other worker processes make the next
+#   check re-read the whole table.
+IP_CHECK_MAX_RESULTS = int(os.getenv("IP_CHECK_MAX_RESULTS", "1000"))
+# Queued rows beyond this re-read the whole table instead of an IN (...) list
+IP_CHECK_MAX_PENDING = int(os.getenv("IP_CHECK_MAX_PENDING", "5000"))
+
+_COMPONENT = models.Component.__tablename__
+_CREDENTIAL = models.Credential.__tablename__
+_TABLES = {_COMPONENT: models.Component, _CREDENTIAL: models.Credential}
+_COMPONENT_IP_FIELDS = ("local_if_ip", "remote_if_ip", "static_router_ip")
+# Interface addresses on the row's own link, expected inside its proposed_subnet
+_SUBNET_FIELDS = ("local_if_ip", "remote_if_ip")
+_WATCHED = {
+    _COMPONENT: ("component_code", "connected_to_code", "proposed_subnet", *_COMPONENT_IP_FIELDS),
+    _CREDENTIAL: ("component_code", "ip_address"),
+}
+# Values people type for "no address"
+_PLACEHOLDERS = {"", "-", "--", "na", "n/a", "nil", "none", "null", "dhcp", "tbd"}
+
+
+RowKey = tuple[str, int]  # (table, id)
+# (IP version, address as an integer): hashes and sorts in C, unlike ipaddress objects
+Address = tuple[int, int]
+Network = tuple[int, int, int, int]  # (IP version, first address, last address, prefix length)
+IpUse = tuple[str, int, str, str | None]  # (table, id, field, owner); owner None = not an assignment
+
+
+class _Row(NamedTuple):
+    label: str  # component code, or the credential's component code
+    code: str | None  # component_code of a component row
+    uses: list[tuple[str, Address, str | None]]  # (field, address, owner); owner None = not an assignment
+    subnet: Network | None
+    problems: list[dict[str, Any]]
+
+
+def _blank(value) -> bool:
+    return value is None or str(value).strip().lower() in _PLACEHOLDERS
+
+
+def _parse_ip(value: str) -> Address:
+    text = str(value).strip()
+    try:
+        # Fast path for the common dotted quad: ipaddress parses octets in Python
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, text), "big")
+    except OSError:
+        # "10.0.0.5/24" names the address and its prefix; the address is what is assigned
+        address = ipaddress.ip_interface(text).ip
+        return address.version, int(address)
+
+
+def _format_ip(address: Address) -> str:
+    version, value = address
+    return str(ipaddress.IPv4Address(value) if version == 4 else ipaddress.IPv6Address(value))
+
+
+def _in_network(address: Address, network: Network) -> bool:
+    return address[0] == network[0] and network[1] <= address[1] <= network[2]
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_network(value: str) -> Network:
+    # Many rows share a subnet
+    network = ipaddress.ip_network(value.strip(), strict=False)
+    return network.version, int(network.network_address), int(network.broadcast_address), network.prefixlen
+
+
+def _format_network(network: Network) -> str:
+    return f"{_format_ip(network[:2])}/{network[3]}"
+
+
+def _component_row(id, code, connected_to, local_ip, remote_ip, router_ip, subnet) -> _Row:
+    # The remote interface belongs to the device this one connects to, so rows
+    # linked to the same device may share it; the router's address is shared by
+    # everything behind that router, so it is only validated
+    owners = {
+        "local_if_ip": code,
+        "remote_if_ip": connected_to or f"{code} (remote side)",
+        "static_router_ip": None,
+    }
+    uses, problems = [], []
+    network = None
+    if not _blank(subnet):
+        try:
+            network = _parse_network(str(subnet))
+        except ValueError:
+            problems.append({"problem": "invalid_subnet", "field": "proposed_subnet", "value": subnet})
+    for field, value in zip(_COMPONENT_IP_FIELDS, (local_ip, remote_ip, router_ip)):
+        if _blank(value):
+            continue
+        try:
+            address = _parse_ip(value)
+        except ValueError:
+            problems.append({"problem": "invalid_ip", "field": field, "value": value})
+            continue
+        uses.append((field, address, owners[field]))
+        if network is not None and field in _SUBNET_FIELDS and not _in_network(address, network):
+            problems.append({"problem": "outside_subnet", "field": field, "value": value, "subnet": _format_network(network)})
+    return _Row(code, code, uses, network, problems)
+
+
+def _credential_row(id, code, ip) -> _Row:
+    owner = code or f"credential {id}"
+    if _blank(ip):
+        return _Row(owner, None, [], None, [])
+    try:
+        return _Row(owner, None, [("ip_address", _parse_ip(ip), owner)], None, [])
+    except ValueError:
+        return _Row(owner, None, [], None, [{"problem": "invalid_ip", "field": "ip_address", "value": ip}])
+
+
+_ROW_COLUMNS = {
+    _COMPONENT: lambda c: (c.id, c.component_code, c.connected_to_code, c.local_if_ip, c.remote_if_ip,
+                           c.static_router_ip, c.proposed_subnet),
+    _CREDENTIAL: lambda c: (c.id, c.component_code, c.ip_address),
+}
+_ROW_BUILDERS = {_COMPONENT: _component_row, _CREDENTIAL: _credential_row}
+
+
+class IpIndex:
+    """Parsed addresses and subnets of every component and credential row.
+
+    `by_ip[address]` holds the (table, id, field, owner) uses of an address
+    and `owners[address]` counts them per owner (device); an address assigned
+    to more than one owner is a duplicate. `subnets` counts the component rows
+    per proposed subnet.
+    """
+
+    def __init__(self):
+        self._clear()
+        # Table versions the index reflects; None = re-read the table on next use
+        self.versions: dict[str, int | None] = {t: None for t in _TABLES}
+        self.pending: dict[str, tuple[set[int], set[str]]] = {t: (set(), set()) for t in _TABLES}
+        self.lock = threading.RLock()
+        self.full_checks = self.incremental_checks = self.rows_rechecked = 0
+        self.last_check_ms = 0.0
+
+    def _clear(self) -> None:
+        self.rows: dict[RowKey, _Row] = {}
+        self.by_ip: dict[Address, set[IpUse]] = {}
+        self.owners: dict[Address, dict[str, int]] = {}  # address -> uses per owner, assignments only
+        self.duplicates: set[Address] = set()
+        self.subnets: Counter[Network] = Counter()
+        self.problem_rows: set[RowKey] = set()
+        self.id_by_code: dict[str, int] = {}
+        self._overlaps: list[dict[str, Any]] | None = None
+
+    # -- maintenance --------------------------------------------------------
+
+    def _remove(self, key: RowKey) -> None:
+        row = self.rows.pop(key, None)
+        if row is None:
+            return
+        if row.code is not None and self.id_by_code.get(row.code) == key[1]:
+            del self.id_by_code[row.code]
+        for field, address, owner in row.uses:
+            uses = self.by_ip[address]
+            uses.discard((*key, field, owner))
+            if not uses:
+                del self.by_ip[address]
+            if owner is not None:
+                owners = self.owners[address]
+                owners[owner] -= 1
+                if not owners[owner]:
+                    del owners[owner]
+                    if len(owners) < 2:
+                        self.duplicates.discard(address)
+                    if not owners:
+                        del self.owners[address]
+        if row.subnet is not None:
+            self.subnets[row.subnet] -= 1
+            if not self.subnets[row.subnet]:
+                del self.subnets[row.subnet]
+            self._overlaps = None
+        self.problem_rows.discard(key)
+
+    def _add(self, key: RowKey, row: _Row) -> None:
+        self.rows[key] = row
+        if row.code is not None:
+            self.id_by_code[row.code] = key[1]
+        for field, address, owner in row.uses:
+            self.by_ip.setdefault(address, set()).add((*key, field, owner))
+            if owner is not None:
+                owners = self.owners.get(address)
+                if owners is None:
+                    owners = self.owners[address] = {}
+                owners[owner] = owners.get(owner, 0) + 1
+                if len(owners) > 1:
+                    self.duplicates.add(address)
+        if row.subnet is not None:
+            self.subnets[row.subnet] += 1
+            self._overlaps = None
+        if row.problems:
+            self.problem_rows.add(key)
+
+    def _load(self, session, table: str, version: int) -> int:
+        for key in [k for k in self.rows if k[0] == table]:
+            self._remove(key)
+        build = _ROW_BUILDERS[table]
+        rows = session.connection().execute(select(*_ROW_COLUMNS[table](_TABLES[table]))).all()
+        for row in rows:
+            self._add((table, row[0]), build(*row))
+        self.versions[table] = version
+        self.pending[table] = (set(), set())
+        return len(rows)
+
+    def _recheck(self, session, table: str) -> int:
+        ids, codes = self.pending[table]
+        self.pending[table] = (set(), set())
+        model = _TABLES[table]
+        ids = ids | {self.id_by_code[c] for c in codes if c in self.id_by_code}
+        where = [model.id.in_(sorted(ids))]
+        if codes:
+            where.append(model.component_code.in_(sorted(codes)))
+        rows = session.connection().execute(select(*_ROW_COLUMNS[table](model)).where(or_(*where))).all()
+        for id in ids:
+            self._remove((table, id))
+        build = _ROW_BUILDERS[table]
+        for row in rows:
+            self._remove((table, row[0]))
+            self._add((table, row[0]), build(*row))
+        return len(ids | {row[0] for row in rows})
+
+    def refresh(self, session, full: bool = False) -> dict[str, Any]:
+        """Bring the index up to the current table versions: re-read whole tables
+        that moved without a record of their rows (or all of them with `full`),
+        otherwise re-read only the queued rows."""
+        with self.lock:
+            started = time.perf_counter()
+            current = table_versions(session, _TABLES.values())
+            reloaded = [
+                table for table, (ids, codes) in self.pending.items()
+                if full or self.versions[table] != current[table] or len(ids) + len(codes) > IP_CHECK_MAX_PENDING
+            ]
+            if len(reloaded) == len(_TABLES):
+                self._clear()  # cheaper than removing every row one by one
+            rechecked = 0
+            for table, (ids, codes) in list(self.pending.items()):
+                if table in reloaded:
+                    rechecked += self._load(session, table, current[table])
+                elif ids or codes:
+                    rechecked += self._recheck(session, table)
+            if reloaded:
+                self.full_checks += 1
+            elif rechecked:
+                self.incremental_checks += 1
+            self.rows_rechecked += rechecked
+            self.last_check_ms = round((time.perf_counter() - started) * 1000, 1)
+            return {"reloaded": reloaded, "rows_rechecked": rechecked, "ms": self.last_check_ms}
+
+    def apply(self, changes: dict[str, tuple[set[int], set[str]]], full: set[str], versions: dict[str, int]) -> None:
+        """Queue one committed transaction's changed rows; `versions` are the table versions it produced."""
+        with self.lock:
+            for table, version in versions.items():
+                step = version_step(self.versions[table], version)
+                if step == APPLY and table in full:
+                    step = RELOAD  # rows unknown
+                if step == RELOAD:
+                    self.versions[table] = None
+                if step != APPLY:
+                    continue
+                ids, codes = changes.get(table, (set(), set()))
+                self.pending[table][0].update(ids)
+                self.pending[table][1].update(codes)
+                self.versions[table] = version
+
+    # -- queries ------------------------------------------------------------
+
+    def _use(self, table: str, id: int, field: str, owner: str | None = None) -> dict[str, Any]:
+        row = self.rows.get((table, id))
+        use = {"table": table, "id": id, "label": row.label if row else None, "field": field}
+        if owner is not None:
+            use["owner"] = owner
+        return use
+
+    def duplicate(self, address: Address) -> dict[str, Any]:
+        uses = sorted(self.by_ip.get(address, ()), key=lambda u: (u[3] or "", u[0], u[1], u[2]))
+        return {
+            "ip": _format_ip(address),
+            "owners": sorted({owner for *_, owner in uses if owner is not None}),
+            "uses": [self._use(*u) for u in uses],
+        }
+
+    def problems(self, kind: str | None = None) -> list[dict[str, Any]]:
+        found = []
+        for key in sorted(self.problem_rows):
+            for problem in self.rows[key].problems:
+                if kind is None or problem["problem"] == kind:
+                    found.append({**self._use(key[0], key[1], problem["field"]), **problem})
+        return found
+
+    def overlaps(self) -> list[dict[str, Any]]:
+        """Pairs of distinct subnets where one contains the other, each nested subnet
+        with its closest container. One sorted sweep: CIDR ranges either nest or
+        are disjoint, so a stack of the ranges still open finds every container."""
+        if self._overlaps is None:
+            found = []
+            open_ranges: list = []
+            for network in sorted(self.subnets, key=lambda n: (n[0], n[1], n[3])):
+                while open_ranges and not (open_ranges[-1][0] == network[0] and network[1] <= open_ranges[-1][2]):
+                    open_ranges.pop()
+                if open_ranges:
+                    outer = open_ranges[-1]
+                    found.append({
+                        "subnet": _format_network(network),
+                        "rows": self.subnets[network],
+                        "inside": _format_network(outer),
+                        "inside_rows": self.subnets[outer],
+                    })
+                open_ranges.append(network)
+            self._overlaps = found
+        return self._overlaps
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "components": sum(1 for t, _ in self.rows if t == _COMPONENT),
+            "credentials": sum(1 for t, _ in self.rows if t == _CREDENTIAL),
+            "addresses": len(self.by_ip),
+            "subnets": len(self.subnets),
+            "versions": dict(self.versions),
+            "full_checks": self.full_checks,
+            "incremental_checks": self.incremental_checks,
+            "rows_rechecked": self.rows_rechecked,
+            "last_check_ms": self.last_check_ms,
+        }
+
+
+ip_index = IpIndex()
+
+
+# -- keeping the index current -------------------------------------------------
+
+def _changes(changes: dict, table: str) -> tuple[set[int], set[str]]:
+    return changes.setdefault(table, (set(), set()))
+
+
+class _IpChanges(CommitListener):
+    tables = frozenset(_TABLES)
+
+    def flushed(self, session, changes: dict) -> None:
+        for objects, check_history in ((session.new, False), (session.dirty, True), (session.deleted, False)):
+            for obj in objects:
+                table = getattr(getattr(obj, "__table__", None), "name", None)
+                if table not in _TABLES:
+                    continue
+                if check_history:
+                    state = inspect(obj)
+                    if not any(state.attrs[name].history.has_changes() for name in _WATCHED[table]):
+                        continue
+                _changes(changes, table)[0].add(obj.id)
+
+    def bulk(self, orm_execute_state, table: str, changes: dict) -> bool:
+        params = orm_execute_state.parameters
+        params = [params] if isinstance(params, dict) else list(params or ())
+        # Statements that carry their rows say which rows they touched: inserts and
+        # upserts by component_code, updates by primary key
+        if orm_execute_state.is_insert and table == _COMPONENT and params and all("component_code" in p for p in params):
+            _changes(changes, table)[1].update(p["component_code"] for p in params)
+            return True
+        if (orm_execute_state.is_insert or orm_execute_state.is_update) and params and all("id" in p for p in params):
+            _changes(changes, table)[0].update(p["id"] for p in params)
+            return True
+        return False
+
+    def committed(self, changes: dict, unknown: set[str], versions: dict[str, int]) -> None:
+        ip_index.apply(changes, unknown, versions)
+
+
+add_commit_listener(_IpChanges())
+
+
+# -- endpoints --------------------------------------------------------------------
+
+router = APIRouter(prefix="/ip-checks", tags=["IP Checks"])
+
+_KINDS = ("duplicate_ip", "outside_subnet", "overlapping_subnets", "invalid_ip", "invalid_subnet")
+
+
+@router.get("")
+def ip_checks(
+    request: Request,
+    response: Response,
+    kind: str | None = Query(None, description=", ".join(_KINDS)),
+    full: bool = Query(False, description="Re-read every row instead of only the rows changed since the last check"),
+    limit: int = Query(100, ge=0, le=IP_CHECK_MAX_RESULTS, description="Per kind"),
+    session: Session = Depends(get_read_session),
+):
+    """Duplicate addresses, addresses outside their row's proposed_subnet,
+    nested subnets and values that are not addresses, with a count per kind."""
+    if kind is not None and kind not in _KINDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown kind: {kind}; expected {', '.join(_KINDS)}"
+        )
+    if not full:
+        not_modified = conditional(request, response, session, _TABLES.values())
+        if not_modified:
+            return not_modified
+    with ip_index.lock:
+        check = ip_index.refresh(session, full=full)
+        found = {
+            "duplicate_ip": lambda: [ip_index.duplicate(a) for a in sorted(ip_index.duplicates)],
+            "outside_subnet": lambda: ip_index.problems("outside_subnet"),
+            "overlapping_subnets": ip_index.overlaps,
+            "invalid_ip": lambda: ip_index.problems("invalid_ip"),
+            "invalid_subnet": lambda: ip_index.problems("invalid_subnet"),
+        }
+        body: dict[str, Any] = {"counts": {}, "check": check}
+        for name in ([kind] if kind else _KINDS):
+            items = found[name]()
+            body["counts"][name] = len(items)
+            body[name] = items[:limit]
+    return ORJSONResponse(body, headers=dict(response.headers))
+
+
+@router.get("/stats")
+def ip_check_stats(session: Session = Depends(get_read_session)):
+    """Size of the address index and how it has been kept current."""
+    with ip_index.lock:
+        ip_index.refresh(session)
+        return ip_index.stats()
+
+
+@router.get("/ip/{ip}")
+def ip_uses(ip: str, session: Session = Depends(get_read_session)):
+    """Every row that uses an address, and whether it is a duplicate."""
+    try:
+        address = _parse_ip(ip)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Not an IP address: {ip}")
+    with ip_index.lock:
+        ip_index.refresh(session)
+        body = ip_index.duplicate(address)
+        body["duplicate"] = address in ip_index.duplicates
+        containing = sorted((n for n in ip_index.subnets if _in_network(address, n)), key=lambda n: -n[3])
+        body["subnets"] = [{"subnet": _format_network(n), "rows": ip_index.subnets[n]} for n in containing]
+    return body
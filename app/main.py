@@ -1,14 +1,29 @@
+import asyncio
+import logging
+
+from anyio import to_thread
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pathlib import Path
 import os
 
+from .audit import AuditMiddleware, audit_writer
+from .audit_archive import AUDIT_ARCHIVE_INTERVAL, AUDIT_HOT_DAYS, archive_audit_logs
 from .database import init_db
 from .importers import router as import_router
-from .database import engine
+from .hierarchy import router as hierarchy_router
+from .topology import router as topology_router
+from .spatial import router as geo_router
+from .map_clusters import router as map_router
+from .ip_checks import router as ip_check_router
+from .capacity import router as capacity_router
+from .database import async_engine, async_read_engine, engine
+from .passwords import shutdown_executor
 from sqlmodel import Session, select
 from .auth_routes import router as auth_router
 from .routers import (
+    component_crud_router,
     component_router,
     credential_router,
     district_router,
@@ -19,11 +34,13 @@ from .routers import (
     audit_router,
     search_router,
     excel_router,
+    stats_router,
+    reference_router,
 )
 
 
 def create_app() -> FastAPI:
-    app = FastAPI(title="Inventory GUI API", version="0.1.0")
+    app = FastAPI(title="Inventory GUI API", version="0.1.0", default_response_class=ORJSONResponse)
 
     # Get CORS origins from environment variable or use defaults
     cors_origins = os.getenv(
@@ -31,6 +48,7 @@ def create_app() -> FastAPI:
         "http://localhost:5173,http://127.0.0.1:5173,http://localhost:3000"
     ).split(",")
 
+    app.add_middleware(AuditMiddleware)
     app.add_middleware(
         CORSMiddleware,
         allow_origins=cors_origins,
@@ -43,6 +61,47 @@ def create_app() -> FastAPI:
     @app.on_event("startup")
     def _startup():
         init_db()
+        audit_writer.start()
+
+    @app.on_event("startup")
+    async def _size_threadpool():
+        # Sync handlers (imports, Excel views) share this pool; async handlers never take a slot
+        to_thread.current_default_thread_limiter().total_tokens = int(os.getenv("THREADPOOL_SIZE", "40"))
+
+    @app.on_event("startup")
+    async def _schedule_audit_archive():
+        if AUDIT_ARCHIVE_INTERVAL <= 0 or AUDIT_HOT_DAYS <= 0:
+            return
+
+        async def run():
+            while True:
+                try:
+                    await to_thread.run_sync(archive_audit_logs)
+                except Exception:
+                    logging.getLogger(__name__).exception("Audit archive run failed")
+                await asyncio.sleep(AUDIT_ARCHIVE_INTERVAL)
+
+        app.state.audit_archive_task = asyncio.create_task(run())
+
+    @app.on_event("shutdown")
+    async def _stop_audit_archive():
+        task = getattr(app.state, "audit_archive_task", None)
+        if task is not None:
+            task.cancel()
+
+    @app.on_event("shutdown")
+    def _flush_audit_log():
+        # Writes whatever is still queued before the engines go away
+        audit_writer.stop()
+
+    @app.on_event("shutdown")
+    async def _dispose_async_engines():
+        await async_read_engine.dispose()
+        await async_engine.dispose()
+
+    @app.on_event("shutdown")
+    def _stop_password_workers():
+        shutdown_executor()
 
     @app.get("/")
     def root():
@@ -59,10 +118,19 @@ def create_app() -> FastAPI:
     app.include_router(pole_router)
     app.include_router(junction_box_router)
     app.include_router(component_router)
+    app.include_router(component_crud_router)
     app.include_router(credential_router)
     app.include_router(audit_router)
     app.include_router(search_router)
     app.include_router(excel_router)
+    app.include_router(stats_router)
+    app.include_router(reference_router)
+    app.include_router(hierarchy_router)
+    app.include_router(topology_router)
+    app.include_router(geo_router)
+    app.include_router(map_router)
+    app.include_router(ip_check_router)
+    app.include_router(capacity_router)
     app.include_router(import_router)
 
     return app
@@ -0,0 +1,407 @@
+from __future__ import annotations
+
+import math
+import os
+import threading
+import time
+from typing import Any
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy import inspect, select
+from sqlmodel import Session
+
+from .database import get_read_session
+from .responses import ORJSONResponse
+from .spatial import GEO_MAX_RESULTS, GEO_TYPES, _models, _types, in_boxes, split_box
+from .versions import (
+    APPLY,
+    RELOAD,
+    CommitListener,
+    add_commit_listener,
+    conditional,
+    table_versions,
+    version_step,
+)
+
+# Map clusters: assets grouped into square cells of the Web Mercator grid a map
+# client draws at each zoom level (MAP_CLUSTER_CELL_PX screen pixels a side).
+# Each asset type keeps a per-zoom hierarchy in memory for zooms up to
+# MAP_CLUSTER_MAX_ZOOM: a cell at zoom z is the four cells below it at z + 1,
+# so the hierarchy is built once from the finest level, and an asset added,
+# moved or removed touches one cell per level. Like the topology graph, each
+# hierarchy is kept at the version of its table: commits through this
+# process's sessions are applied in place, bulk statements and other worker
+# processes make the next request rebuild it. Above MAP_CLUSTER_MAX_ZOOM a
+# viewport holds few assets, so they are read through the spatial index and
+# grouped per request.
+MAP_CLUSTER_MAX_ZOOM = int(os.getenv("MAP_CLUSTER_MAX_ZOOM", "16"))
+MAP_CLUSTER_CELL_PX = int(os.getenv("MAP_CLUSTER_CELL_PX", "64"))  # power of two up to 256
+
+MAP_MAX_ZOOM = 24
+_CELL_BITS = (256 // MAP_CLUSTER_CELL_PX).bit_length() - 1  # cells per 256px tile side = 2 ** _CELL_BITS
+_MAX_MERCATOR_LAT = 85.05112878
+
+# Columns broken down within a cell, per type
+_KIND_COLUMNS = {"components": "component_type"}
+
+_TABLE_TYPES = {model.__tablename__: name for name, (model, _) in GEO_TYPES.items()}
+
+Cell = tuple[int, int]
+# [count, sum of lat, sum of lng, sum of ids, {kind: count} or None]: sums
+# give the centroid, and with one asset in the cell the id sum is its id
+Aggregate = list
+
+
+def cell_xy(lat: float, lng: float, zoom: int) -> Cell:
+    """Grid cell containing (lat, lng) at `zoom`, counted from the top-left of the world."""
+    n = 1 << (zoom + _CELL_BITS)
+    lat = min(_MAX_MERCATOR_LAT, max(-_MAX_MERCATOR_LAT, lat))
+    s = math.sin(math.radians(lat))
+    x = int((lng + 180.0) / 360.0 * n)
+    y = int((0.5 - math.log((1 + s) / (1 - s)) / (4 * math.pi)) * n)
+    return min(n - 1, max(0, x)), min(n - 1, max(0, y))
+
+
+def cell_box(x0: int, y0: int, x1: int, y1: int, zoom: int) -> tuple[float, float, float, float]:
+    """(south, west, north, east) covering cells x0..x1, y0..y1 at `zoom`."""
+    n = 1 << (zoom + _CELL_BITS)
+
+    def lat(y: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+
+    south, north = lat(y1 + 1), lat(y0)
+    # The grid stops at the Mercator limit; its edge rows reach the poles
+    south = -90.0 if y1 == n - 1 else south
+    north = 90.0 if y0 == 0 else north
+    return south, x0 / n * 360.0 - 180.0, north, (x1 + 1) / n * 360.0 - 180.0
+
+
+def _merge(target: Aggregate, source: Aggregate) -> None:
+    target[0] += source[0]
+    target[1] += source[1]
+    target[2] += source[2]
+    target[3] += source[3]
+    if source[4] is not None:
+        kinds = target[4]
+        for kind, count in source[4].items():
+            kinds[kind] = kinds.get(kind, 0) + count
+
+
+class ClusterGrid:
+    """Per-zoom aggregates of one asset type: `levels[z]` maps cell -> Aggregate."""
+
+    def __init__(self, geo_type: str):
+        self.geo_type = geo_type
+        self.model = GEO_TYPES[geo_type][0]
+        self.kind_column = _KIND_COLUMNS.get(geo_type)
+        self.levels: list[dict[Cell, Aggregate]] = []
+        self.version: int | None = None  # table version; None = load on next use
+        self.lock = threading.RLock()
+        self.loads = self.incremental_updates = 0
+        self.load_seconds = 0.0
+
+    def _new(self) -> Aggregate:
+        return [0, 0.0, 0.0, 0, {} if self.kind_column else None]
+
+    # -- maintenance --------------------------------------------------------
+
+    def load(self, session) -> None:
+        with self.lock:
+            started = time.perf_counter()
+            # Version first: a write that lands in between makes the next check reload again
+            version = table_versions(session, [self.model])[self.model.__tablename__]
+            m = self.model
+            columns = [m.id, m.lat, m.lng]
+            if self.kind_column:
+                columns.append(getattr(m, self.kind_column))
+            rows = session.connection().execute(
+                select(*columns).where(m.lat.is_not(None), m.lng.is_not(None))
+            ).all()
+            # cell_xy inlined: this loop runs once per asset
+            n = 1 << (MAP_CLUSTER_MAX_ZOOM + _CELL_BITS)
+            top, sin, log, radians = n - 1, math.sin, math.log, math.radians
+            x_scale, y_scale = n / 360.0, n / (4 * math.pi)
+            kinds = self.kind_column is not None
+            finest: dict[Cell, Aggregate] = {}
+            for row in rows:
+                lat, lng = row[1], row[2]
+                s = sin(radians(min(_MAX_MERCATOR_LAT, max(-_MAX_MERCATOR_LAT, lat))))
+                key = (
+                    min(top, max(0, int((lng + 180.0) * x_scale))),
+                    min(top, max(0, int(n / 2 - log((1 + s) / (1 - s)) * y_scale))),
+                )
+                agg = finest.get(key)
+                if agg is None:
+                    finest[key] = [1, lat, lng, row[0], {row[3]: 1} if kinds else None]
+                    continue
+                agg[0] += 1
+                agg[1] += lat
+                agg[2] += lng
+                agg[3] += row[0]
+                if kinds:
+                    agg[4][row[3]] = agg[4].get(row[3], 0) + 1
+            levels = [finest]
+            for _ in range(MAP_CLUSTER_MAX_ZOOM):
+                coarser: dict[Cell, Aggregate] = {}
+                for (x, y), agg in levels[-1].items():
+                    key = (x >> 1, y >> 1)
+                    parent = coarser.get(key)
+                    if parent is None:
+                        coarser[key] = [*agg[:4], dict(agg[4]) if kinds else None]
+                    else:
+                        _merge(parent, agg)
+                levels.append(coarser)
+            levels.reverse()
+            self.levels = levels
+            self.version = version
+            self.loads += 1
+            self.load_seconds = time.perf_counter() - started
+
+    def _update(self, point: tuple, sign: int) -> None:
+        id, lat, lng, kind = point
+        x, y = cell_xy(lat, lng, MAP_CLUSTER_MAX_ZOOM)
+        for zoom, level in enumerate(self.levels):
+            shift = MAP_CLUSTER_MAX_ZOOM - zoom
+            key = (x >> shift, y >> shift)
+            agg = level.get(key)
+            if agg is None:
+                agg = level[key] = self._new()
+            agg[0] += sign
+            if agg[0] <= 0:
+                del level[key]
+                continue
+            agg[1] += sign * lat
+            agg[2] += sign * lng
+            agg[3] += sign * id
+            if self.kind_column:
+                agg[4][kind] = agg[4].get(kind, 0) + sign
+                if agg[4][kind] <= 0:
+                    del agg[4][kind]
+
+    def apply(self, changes: list[tuple[tuple | None, tuple | None]], version: int) -> None:
+        """Apply one committed transaction's (old point, new point) changes that moved the table to `version`."""
+        with self.lock:
+            step = version_step(self.version, version)
+            if step == RELOAD:
+                self.version = None
+            if step != APPLY:
+                return
+            for old, new in changes:
+                if old == new:
+                    continue
+                if old is not None:
+                    self._update(old, -1)
+                if new is not None:
+                    self._update(new, 1)
+            self.version = version
+            self.incremental_updates += 1
+
+    def invalidate(self) -> None:
+        with self.lock:
+            self.version = None
+
+    # -- queries ------------------------------------------------------------
+
+    def cells(self, zoom: int, ranges: list[tuple[int, int, int, int]]):
+        """(cell, aggregate) pairs at `zoom` inside the (x0, y0, x1, y1) cell ranges."""
+        level = self.levels[zoom]
+        for x0, y0, x1, y1 in ranges:
+            if (x1 - x0 + 1) * (y1 - y0 + 1) <= len(level):
+                for x in range(x0, x1 + 1):
+                    for y in range(y0, y1 + 1):
+                        agg = level.get((x, y))
+                        if agg is not None:
+                            yield (x, y), agg
+            else:
+                for (x, y), agg in level.items():
+                    if x0 <= x <= x1 and y0 <= y <= y1:
+                        yield (x, y), agg
+
+    def stats(self) -> dict[str, Any]:
+        with self.lock:
+            return {
+                "assets": sum(agg[0] for agg in self.levels[0].values()) if self.levels else 0,
+                "cells": sum(len(level) for level in self.levels),
+                "version": self.version,
+                "loads": self.loads,
+                "last_load_ms": round(self.load_seconds * 1000, 1),
+                "incremental_updates": self.incremental_updates,
+            }
+
+
+grids = {name: ClusterGrid(name) for name in GEO_TYPES}
+
+
+def cluster_grid(session, geo_type: str) -> ClusterGrid:
+    """The hierarchy of `geo_type`, rebuilt first if its table has changed since it was built."""
+    grid = grids[geo_type]
+    version = table_versions(session, [grid.model])[grid.model.__tablename__]
+    with grid.lock:
+        if grid.version != version:
+            grid.load(session)
+    return grid
+
+
+# -- keeping the hierarchies current ------------------------------------------
+
+def _point(geo_type: str, id, lat, lng, kind) -> tuple | None:
+    if id is None or lat is None or lng is None:
+        return None
+    return id, lat, lng, kind if geo_type in _KIND_COLUMNS else None
+
+
+def _committed(state, name: str):
+    history = state.attrs[name].history
+    return history.deleted[0] if history.deleted else state.attrs[name].value
+
+
+def _current_point(geo_type: str, obj) -> tuple | None:
+    kind = _KIND_COLUMNS.get(geo_type)
+    return _point(geo_type, obj.id, obj.lat, obj.lng, getattr(obj, kind) if kind else None)
+
+
+def _old_point(geo_type: str, obj) -> tuple | None:
+    state = inspect(obj)
+    kind = _KIND_COLUMNS.get(geo_type)
+    return _point(
+        geo_type, _committed(state, "id"), _committed(state, "lat"), _committed(state, "lng"),
+        _committed(state, kind) if kind else None,
+    )
+
+
+def _geo_type(obj) -> str | None:
+    table = getattr(obj, "__table__", None)
+    return _TABLE_TYPES.get(table.name) if table is not None else None
+
+
+class _GridChanges(CommitListener):
+    tables = frozenset(_TABLE_TYPES)
+
+    def flushed(self, session, changes: dict) -> None:
+        for objects, old, new in (
+            (session.new, None, _current_point),
+            (session.dirty, _old_point, _current_point),
+            (session.deleted, _old_point, None),
+        ):
+            for obj in objects:
+                geo_type = _geo_type(obj)
+                if geo_type is None:
+                    continue
+                change = (old(geo_type, obj) if old else None, new(geo_type, obj) if new else None)
+                if change[0] != change[1]:
+                    changes.setdefault(geo_type, []).append(change)
+
+    def committed(self, changes: dict, unknown: set[str], versions: dict[str, int]) -> None:
+        for table, version in versions.items():
+            geo_type = _TABLE_TYPES[table]
+            if table in unknown:
+                grids[geo_type].invalidate()
+            else:
+                grids[geo_type].apply(changes.get(geo_type, []), version)
+
+
+add_commit_listener(_GridChanges())
+
+
+# -- endpoints --------------------------------------------------------------------
+
+router = APIRouter(prefix="/map", tags=["Map"])
+
+
+def _cell_ranges(min_lat: float, min_lng: float, max_lat: float, max_lng: float, zoom: int):
+    ranges = []
+    for south, west, north, east in split_box(min_lat, min_lng, max_lat, max_lng):
+        x0, y0 = cell_xy(north, west, zoom)
+        x1, y1 = cell_xy(south, east, zoom)
+        ranges.append((x0, y0, x1, y1))
+    return ranges
+
+
+def _cluster(aggs: dict[str, Aggregate], with_kinds: bool) -> dict[str, Any]:
+    count = sum(agg[0] for agg in aggs.values())
+    cluster = {
+        "lat": round(sum(agg[1] for agg in aggs.values()) / count, 7),
+        "lng": round(sum(agg[2] for agg in aggs.values()) / count, 7),
+        "count": count,
+        "types": {name: agg[0] for name, agg in aggs.items()},
+    }
+    if with_kinds:
+        kinds = aggs.get("components")
+        cluster["component_types"] = dict(kinds[4]) if kinds else {}
+    if count == 1:
+        cluster["id"] = next(iter(aggs.values()))[3]
+    return cluster
+
+
+@router.get("/clusters")
+def map_clusters(
+    request: Request,
+    response: Response,
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lng: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lng: float = Query(..., ge=-180, le=180),
+    zoom: int = Query(..., ge=0, le=MAP_MAX_ZOOM),
+    types: str | None = Query(None, description="Comma-separated: landmarks,poles,junction_boxes,components"),
+    session: Session = Depends(get_read_session),
+):
+    """Assets in a bounding box grouped into map cells at a zoom level.
+
+    Each cluster has its asset count, centroid and count per type (and per
+    component_type); a cluster of one asset also has its `id`. Cells that
+    overlap the box are returned whole. min_lng > max_lng means the box
+    crosses the antimeridian.
+    """
+    if min_lat > max_lat:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="min_lat is greater than max_lat")
+    names = _types(types)
+    not_modified = conditional(request, response, session, _models(names))
+    if not_modified:
+        return not_modified
+    cells: dict[Cell, dict[str, Aggregate]] = {}
+    truncated = []
+    ranges = _cell_ranges(min_lat, min_lng, max_lat, max_lng, zoom)
+    if zoom <= MAP_CLUSTER_MAX_ZOOM:
+        for name in names:
+            grid = cluster_grid(session, name)
+            with grid.lock:
+                for key, agg in grid.cells(zoom, ranges):
+                    cells.setdefault(key, {})[name] = [*agg[:4], dict(agg[4]) if agg[4] is not None else None]
+    else:
+        boxes = [cell_box(*r, zoom) for r in ranges]
+        for name in names:
+            kind = _KIND_COLUMNS.get(name)
+            rows = in_boxes(session, name, boxes, GEO_MAX_RESULTS + 1)
+            if len(rows) > GEO_MAX_RESULTS:
+                truncated.append(name)
+                del rows[GEO_MAX_RESULTS:]
+            for row in rows:
+                # The index boxes are closed; an asset on a shared edge belongs to one cell only
+                key = cell_xy(row["lat"], row["lng"], zoom)
+                if not any(x0 <= key[0] <= x1 and y0 <= key[1] <= y1 for x0, y0, x1, y1 in ranges):
+                    continue
+                by_type = cells.setdefault(key, {})
+                agg = by_type.get(name)
+                if agg is None:
+                    agg = by_type[name] = [0, 0.0, 0.0, 0, {} if kind else None]
+                agg[0] += 1
+                agg[1] += row["lat"]
+                agg[2] += row["lng"]
+                agg[3] += row["id"]
+                if kind:
+                    agg[4][row[kind]] = agg[4].get(row[kind], 0) + 1
+    with_kinds = any(name in _KIND_COLUMNS for name in names)
+    clusters = sorted((_cluster(aggs, with_kinds) for aggs in cells.values()), key=lambda c: (-c["count"], c["lat"], c["lng"]))
+    body = {
+        "zoom": zoom,
+        "total": sum(c["count"] for c in clusters),
+        "clusters": clusters,
+        "truncated": truncated,
+    }
+    return ORJSONResponse(body, headers=dict(response.headers))
+
+
+@router.get("/stats")
+def map_cluster_stats(session: Session = Depends(get_read_session)):
+    """Size of each type's cluster hierarchy and how it has been kept current."""
+    return {name: cluster_grid(session, name).stats() for name in GEO_TYPES}
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import logging
+from datetime import datetime
+from typing import Callable
+
+from sqlalchemy import func, insert, inspect, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from sqlmodel import SQLModel
+
+from .models import (
+    GEO_TABLES, AuditDailyActivity, AuditDailyEntity, AuditLog, AuditSegment, Component, SchemaMigration,
+    _create_geo_index, _create_usage_triggers, rebuild_subnet_usage,
+)
+
+logger = logging.getLogger(__name__)
+
+# `SQLModel.metadata.create_all` builds new databases from the models but never
+# touches tables that already exist. Each migration brings an existing
+# database up to the models; it must be safe on a database create_all just
+# built, since a fresh database runs every migration once too.
+
+
+def _create_missing_indexes(conn: Connection) -> None:
+    """Create every index declared on the models that the database lacks."""
+    existing_tables = set(inspect(conn).get_table_names())
+    for table in SQLModel.metadata.sorted_tables:
+        if table.name in existing_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+
+def _access_path_indexes(conn: Connection) -> None:
+    _create_missing_indexes(conn)
+    # Superseded by ix_auditlog_username_id and ix_excelrow_sheet_id_row_index
+    for name in ("ix_auditlog_username", "ix_excelrow_sheet_id"):
+        conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+def _audit_query_indexes(conn: Connection) -> None:
+    _create_missing_indexes(conn)
+    # Superseded by the (column, timestamp, id) indexes on auditlog
+    for name in ("ix_auditlog_username_id", "ix_auditlog_action", "ix_auditlog_entity_type", "ix_auditlog_timestamp"):
+        conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+    # Imported here: both modules import the database module, which imports this one
+    from .audit import EDIT_ACTIONS, apply_rollups
+    from .audit_archive import AUDIT_ARCHIVE_DIR, ArchiveCorrupt, _segment_rows
+
+    # Seed the daily rollups from the entries written before they existed:
+    # the live table in SQL, archived segments through the writer's code path
+    log = AuditLog
+    day = func.substr(log.timestamp, 1, 10)
+    conn.execute(insert(AuditDailyActivity).from_select(
+        ["day", "username", "action", "entity_type", "count"],
+        select(day, log.username, log.action, log.entity_type, func.count())
+        .group_by(day, log.username, log.action, log.entity_type),
+    ))
+    conn.execute(insert(AuditDailyEntity).from_select(
+        ["day", "entity_type", "entity_id", "count"],
+        select(day, log.entity_type, log.entity_id, func.count())
+        .where(log.entity_id.is_not(None), log.action.in_(sorted(EDIT_ACTIONS)))
+        .group_by(day, log.entity_type, log.entity_id),
+    ))
+    with Session(bind=conn) as session:
+        for segment in session.execute(select(AuditSegment)).scalars():
+            try:
+                rows = _segment_rows(str(AUDIT_ARCHIVE_DIR / segment.path), segment.offset, segment.length, segment.sha256)
+            except OSError:
+                logger.warning("Audit segment %s is missing; its entries are not in the rollups", segment.path)
+                continue
+            except ArchiveCorrupt as exc:
+                logger.warning("%s; its entries are not in the rollups", exc)
+                continue
+            apply_rollups(session, rows)
+        session.flush()
+
+
+def _geo_indexes(conn: Connection) -> None:
+    # Same DDL as a new table gets; on SQLite the R*Tree is rebuilt from the table's rows
+    for table in GEO_TABLES:
+        _create_geo_index(table, conn)
+
+
+def _subnet_usage(conn: Connection) -> None:
+    # create_all made the subnetusage table; count the components written before it
+    _create_usage_triggers(Component.__table__, conn)
+    rebuild_subnet_usage(conn)
+
+
+MIGRATIONS: list[tuple[str, Callable[[Connection], None]]] = [
+    ("0001_access_path_indexes", _access_path_indexes),
+    ("0002_audit_query_indexes", _audit_query_indexes),
+    ("0003_geo_indexes", _geo_indexes),
+    ("0004_subnet_usage", _subnet_usage),
+]
+
+
+def run_migrations(engine) -> list[str]:
+    """Apply pending migrations in order, each in its own transaction; returns their names."""
+    with engine.connect() as conn:
+        applied = set(conn.execute(select(SchemaMigration.name)).scalars())
+    ran = []
+    for name, migrate in MIGRATIONS:
+        if name in applied:
+            continue
+        with engine.begin() as conn:
+            migrate(conn)
+            conn.execute(SchemaMigration.__table__.insert().values(name=name, applied_at=datetime.utcnow()))
+        ran.append(name)
+    return ran
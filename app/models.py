@@ -1,9 +1,12 @@
 from datetime import datetime
 from typing import Any, Dict, List, Optional
-from sqlalchemy import Column
-from sqlalchemy.dialects.sqlite import JSON as SQLITE_JSON
+from sqlalchemy import JSON, Column, Index, event, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlmodel import Field, Relationship, SQLModel
 
+# Plain JSON (TEXT) on SQLite, binary JSONB on PostgreSQL so it can be GIN-indexed
+JSONVariant = JSON().with_variant(JSONB(), "postgresql")
+
 
 class Region(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -16,7 +19,7 @@ class Region(SQLModel, table=True):
 class District(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str = Field(index=True)
-    region_id: int = Field(foreign_key="region.id")
+    region_id: int = Field(foreign_key="region.id", index=True)
 
     region: Region = Relationship(back_populates="districts")
     landmarks: List["Landmark"] = Relationship(back_populates="district")
@@ -30,8 +33,8 @@ class Landmark(SQLModel, table=True):
     name: Optional[str] = Field(default=None)
     lat: Optional[float] = None
     lng: Optional[float] = None
-    district_id: int = Field(foreign_key="district.id")
-    region_id: int = Field(foreign_key="region.id")
+    district_id: int = Field(foreign_key="district.id", index=True)
+    region_id: int = Field(foreign_key="region.id", index=True)
 
     district: District = Relationship(back_populates="landmarks")
     region: Region = Relationship()
@@ -46,9 +49,9 @@ class Pole(SQLModel, table=True):
     location_name: Optional[str] = Field(default=None)
     lat: Optional[float] = None
     lng: Optional[float] = None
-    landmark_id: int = Field(foreign_key="landmark.id")
-    district_id: int = Field(foreign_key="district.id")
-    region_id: int = Field(foreign_key="region.id")
+    landmark_id: int = Field(foreign_key="landmark.id", index=True)
+    district_id: int = Field(foreign_key="district.id", index=True)
+    region_id: int = Field(foreign_key="region.id", index=True)
 
     landmark: Landmark = Relationship(back_populates="poles")
     district: District = Relationship(back_populates="poles")
@@ -62,10 +65,10 @@ class JunctionBox(SQLModel, table=True):
     code: str = Field(index=True, unique=True)
     lat: Optional[float] = None
     lng: Optional[float] = None
-    pole_id: int = Field(foreign_key="pole.id")
-    landmark_id: int = Field(foreign_key="landmark.id")
-    district_id: int = Field(foreign_key="district.id")
-    region_id: int = Field(foreign_key="region.id")
+    pole_id: int = Field(foreign_key="pole.id", index=True)
+    landmark_id: int = Field(foreign_key="landmark.id", index=True)
+    district_id: int = Field(foreign_key="district.id", index=True)
+    region_id: int = Field(foreign_key="region.id", index=True)
 
     pole: Pole = Relationship(back_populates="junction_boxes")
     landmark: Landmark = Relationship(back_populates="junction_boxes")
@@ -75,6 +78,11 @@ class JunctionBox(SQLModel, table=True):
 
 
 class Component(SQLModel, table=True):
+    __table_args__ = (
+        # District drill-down by type (ix_component_district_id keeps district-only pages in id order)
+        Index("ix_component_district_id_component_type", "district_id", "component_type"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     component_code: str = Field(index=True, unique=True)
     component_type: str = Field(index=True)
@@ -84,11 +92,11 @@ class Component(SQLModel, table=True):
     firmware: Optional[str] = None
     os: Optional[str] = None
     licenses: Optional[str] = None
-    pole_id: Optional[int] = Field(default=None, foreign_key="pole.id")
-    jb_id: Optional[int] = Field(default=None, foreign_key="junctionbox.id")
-    landmark_id: Optional[int] = Field(default=None, foreign_key="landmark.id")
-    district_id: Optional[int] = Field(default=None, foreign_key="district.id")
-    region_id: Optional[int] = Field(default=None, foreign_key="region.id")
+    pole_id: Optional[int] = Field(default=None, foreign_key="pole.id", index=True)
+    jb_id: Optional[int] = Field(default=None, foreign_key="junctionbox.id", index=True)
+    landmark_id: Optional[int] = Field(default=None, foreign_key="landmark.id", index=True)
+    district_id: Optional[int] = Field(default=None, foreign_key="district.id", index=True)
+    region_id: Optional[int] = Field(default=None, foreign_key="region.id", index=True)
     project_phase: Optional[float] = None
     lat: Optional[float] = None
     lng: Optional[float] = None
@@ -158,17 +166,74 @@ class User(SQLModel, table=True):
 
 
 class AuditLog(SQLModel, table=True):
+    # GET /audit-logs lists newest first, by (timestamp, id); each filter has
+    # an index that also yields that order, so a page reads only its rows
+    __table_args__ = (
+        Index("ix_auditlog_timestamp_id", "timestamp", "id"),
+        Index("ix_auditlog_username_timestamp", "username", "timestamp", "id"),
+        Index("ix_auditlog_action_timestamp", "action", "timestamp", "id"),
+        Index("ix_auditlog_entity_timestamp", "entity_type", "entity_id", "timestamp", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    username: str = Field(index=True)
-    action: str = Field(index=True)  # CREATE, READ, UPDATE, DELETE, SEARCH
-    entity_type: str = Field(index=True)  # regions, districts, components, etc.
+    username: str
+    action: str  # CREATE, READ, UPDATE, DELETE, SEARCH
+    entity_type: str  # regions, districts, components, etc.
     entity_id: Optional[int] = None
     old_value: Optional[str] = None
     new_value: Optional[str] = None
     description: Optional[str] = None
-    timestamp: str = Field(index=True)  # ISO format timestamp
+    timestamp: str  # ISO format timestamp
     ip_address: Optional[str] = None
 
+
+class AuditDailyActivity(SQLModel, table=True):
+    """Audit entries per day, user, action and entity type.
+
+    Kept up to date by the audit writer in the same transaction as the
+    entries, and never archived, so it covers the whole history.
+    """
+    day: str = Field(primary_key=True)  # YYYY-MM-DD
+    username: str = Field(primary_key=True)
+    action: str = Field(primary_key=True)
+    entity_type: str = Field(primary_key=True)
+    count: int = Field(default=0)
+
+
+class AuditDailyEntity(SQLModel, table=True):
+    """Create/update/delete entries per day and entity; maintained like AuditDailyActivity."""
+    __table_args__ = (
+        # Ranking one entity type over all time (GET /audit-logs/stats/top-entities?entity_type=...)
+        Index("ix_auditdailyentity_entity_day", "entity_type", "entity_id", "day"),
+    )
+
+    day: str = Field(primary_key=True)
+    entity_type: str = Field(primary_key=True)
+    entity_id: int = Field(primary_key=True)
+    count: int = Field(default=0)
+
+
+class AuditSegment(SQLModel, table=True):
+    """One compressed batch of archived audit logs (see app/audit_archive.py).
+
+    Segment files are append-only: each archive run appends a gzip member to
+    the file of its month, and this row records where the member starts and
+    the time range it covers.
+    """
+    id: Optional[int] = Field(default=None, primary_key=True)
+    partition: str = Field(index=True)  # YYYY-MM
+    path: str  # relative to AUDIT_ARCHIVE_DIR
+    offset: int
+    length: int
+    sha256: str
+    rows: int
+    min_ts: str = Field(index=True)
+    max_ts: str
+    min_id: int
+    max_id: int
+    created_at: str
+
+
 class ExcelWorkbook(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     filename: str = Field(index=True)
@@ -187,18 +252,196 @@ class ExcelSheet(SQLModel, table=True):
     header_row: Optional[int] = None  # 1-based row number if detected
     max_row: Optional[int] = None
     max_col: Optional[int] = None
-    columns: List[str] = Field(default_factory=list, sa_column=Column(SQLITE_JSON))
+    columns: List[str] = Field(default_factory=list, sa_column=Column(JSONVariant))
 
     workbook: "ExcelWorkbook" = Relationship(back_populates="sheets")
     rows: List["ExcelRow"] = Relationship(back_populates="sheet")
 
 
 class ExcelRow(SQLModel, table=True):
+    __table_args__ = (
+        # Containment queries (data @> '{"Column": "value"}') on PostgreSQL only
+        Index(
+            "ix_excelrow_data_gin", "data",
+            postgresql_using="gin", postgresql_ops={"data": "jsonb_path_ops"},
+        ).ddl_if(dialect="postgresql"),
+        # A sheet's rows in sheet order (GET /excel/sheets/{id}/rows)
+        Index("ix_excelrow_sheet_id_row_index", "sheet_id", "row_index"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    sheet_id: int = Field(foreign_key="excelsheet.id", index=True)
+    sheet_id: int = Field(foreign_key="excelsheet.id")
     row_index: int = Field(index=True)  # 1-based row index in the original sheet
 
     # column_key -> value (keys are detected headers if possible, else A/B/C...)
-    data: Dict[str, Any] = Field(default_factory=dict, sa_column=Column(SQLITE_JSON))
+    data: Dict[str, Any] = Field(default_factory=dict, sa_column=Column(JSONVariant))
 
     sheet: "ExcelSheet" = Relationship(back_populates="rows")
+
+
+@event.listens_for(ExcelRow.__table__, "after_create")
+def _create_excelrow_trigram_index(target, connection, **kw):
+    """Trigram index for substring search over raw cell text (PostgreSQL with pg_trgm)."""
+    if connection.dialect.name != "postgresql":
+        return
+    available = connection.execute(
+        text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    ).first()
+    if not available:
+        return
+    connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_excelrow_data_trgm ON excelrow "
+        "USING gin ((CAST(data AS TEXT)) gin_trgm_ops)"
+    ))
+
+
+# Tables whose lat/lng get a spatial index (GET /geo/...)
+GEO_TABLES = [Landmark.__table__, Pole.__table__, JunctionBox.__table__, Component.__table__]
+
+
+def geo_index_name(table_name: str) -> str:
+    return f"{table_name}_geo"
+
+
+def _create_geo_index(target, connection, **kw):
+    """Spatial index over lat/lng: an R*Tree kept current by triggers on SQLite,
+    a GiST index on point(lng, lat) on PostgreSQL."""
+    name = geo_index_name(target.name)
+    if connection.dialect.name == "postgresql":
+        connection.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{name} ON {target.name} USING gist (point(lng, lat))"))
+        return
+    if connection.dialect.name != "sqlite":
+        return
+    # Every write path (ORM, bulk statements, imports, other processes) goes
+    # through the triggers, so the R*Tree never needs maintaining from Python
+    connection.execute(text(f"DROP TABLE IF EXISTS {name}"))
+    connection.execute(text(f"CREATE VIRTUAL TABLE {name} USING rtree(id, min_lat, max_lat, min_lng, max_lng)"))
+    point = "NEW.id, NEW.lat, NEW.lat, NEW.lng, NEW.lng"
+    located = "NEW.lat IS NOT NULL AND NEW.lng IS NOT NULL"
+    connection.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS {name}_insert AFTER INSERT ON {target.name} WHEN {located} "
+        f"BEGIN INSERT OR REPLACE INTO {name} VALUES ({point}); END"
+    ))
+    connection.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS {name}_update AFTER UPDATE OF id, lat, lng ON {target.name} "
+        f"BEGIN DELETE FROM {name} WHERE id = OLD.id; INSERT INTO {name} SELECT {point} WHERE {located}; END"
+    ))
+    connection.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS {name}_delete AFTER DELETE ON {target.name} "
+        f"BEGIN DELETE FROM {name} WHERE id = OLD.id; END"
+    ))
+    connection.execute(text(
+        f"INSERT INTO {name} SELECT id, lat, lat, lng, lng FROM {target.name} WHERE lat IS NOT NULL AND lng IS NOT NULL"
+    ))
+
+
+def _drop_geo_index(target, connection, **kw):
+    if connection.dialect.name == "sqlite":
+        connection.execute(text(f"DROP TABLE IF EXISTS {geo_index_name(target.name)}"))
+
+
+for _table in GEO_TABLES:
+    event.listen(_table, "after_create", _create_geo_index)
+    event.listen(_table, "after_drop", _drop_geo_index)
+
+
+class SubnetUsage(SQLModel, table=True):
+    """Components per district, proposed VLAN and proposed subnet.
+
+    Kept up to date by triggers on the component table (see
+    _create_usage_triggers), so every write path updates it in the same
+    transaction. Missing values are stored as 0 / "" to keep the key unique.
+    """
+    __table_args__ = (
+        # One VLAN across every district (GET /capacity/vlans?district_id=...)
+        Index("ix_subnetusage_vlan", "vlan"),
+    )
+
+    district_id: int = Field(default=0, primary_key=True)  # 0 = no district
+    vlan: str = Field(default="", primary_key=True)
+    subnet: str = Field(default="", primary_key=True)
+    components: int = Field(default=0)
+    addressed: int = Field(default=0)  # components with a local_if_ip
+
+
+def _usage_sql(row: str) -> dict[str, str]:
+    """Statements adding / removing one component row (NEW or OLD) to / from its SubnetUsage row."""
+    key = (f"coalesce({row}.district_id, 0)", f"coalesce({row}.proposed_vlan, '')", f"coalesce({row}.proposed_subnet, '')")
+    addressed = f"CASE WHEN coalesce({row}.local_if_ip, '') <> '' THEN 1 ELSE 0 END"
+    match = f"district_id = {key[0]} AND vlan = {key[1]} AND subnet = {key[2]}"
+    return {
+        "add": (
+            f"INSERT INTO subnetusage (district_id, vlan, subnet, components, addressed) "
+            f"SELECT {', '.join(key)}, 1, {addressed} WHERE {key[1]} <> '' OR {key[2]} <> '' "
+            f"ON CONFLICT (district_id, vlan, subnet) DO UPDATE SET "
+            f"components = subnetusage.components + 1, addressed = subnetusage.addressed + excluded.addressed"
+        ),
+        "remove": (
+            f"UPDATE subnetusage SET components = components - 1, addressed = addressed - {addressed} WHERE {match}; "
+            f"DELETE FROM subnetusage WHERE {match} AND components <= 0"
+        ),
+    }
+
+
+_USAGE_COLUMNS = "district_id, proposed_vlan, proposed_subnet, local_if_ip"
+
+
+def _create_usage_triggers(target, connection, **kw):
+    """Triggers keeping SubnetUsage in step with component inserts, updates and deletes."""
+    new, old = _usage_sql("NEW"), _usage_sql("OLD")
+    if connection.dialect.name == "postgresql":
+        connection.execute(text(
+            "CREATE OR REPLACE FUNCTION component_usage() RETURNS trigger AS $$ BEGIN "
+            f"IF TG_OP <> 'INSERT' THEN {old['remove']}; END IF; "
+            f"IF TG_OP <> 'DELETE' THEN {new['add']}; END IF; "
+            "RETURN NULL; END $$ LANGUAGE plpgsql"
+        ))
+        connection.execute(text(f"DROP TRIGGER IF EXISTS component_usage ON {target.name}"))
+        connection.execute(text(
+            f"CREATE TRIGGER component_usage AFTER INSERT OR DELETE OR UPDATE OF {_USAGE_COLUMNS} ON {target.name} "
+            "FOR EACH ROW EXECUTE FUNCTION component_usage()"
+        ))
+        return
+    if connection.dialect.name != "sqlite":
+        return
+    connection.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS component_usage_insert AFTER INSERT ON {target.name} "
+        f"BEGIN {new['add']}; END"
+    ))
+    connection.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS component_usage_update AFTER UPDATE OF {_USAGE_COLUMNS} ON {target.name} "
+        f"BEGIN {old['remove']}; {new['add']}; END"
+    ))
+    connection.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS component_usage_delete AFTER DELETE ON {target.name} "
+        f"BEGIN {old['remove']}; END"
+    ))
+
+
+def rebuild_subnet_usage(connection) -> None:
+    """Recount SubnetUsage from the component table."""
+    vlan, subnet = "coalesce(proposed_vlan, '')", "coalesce(proposed_subnet, '')"
+    connection.execute(text("DELETE FROM subnetusage"))
+    connection.execute(text(
+        f"INSERT INTO subnetusage (district_id, vlan, subnet, components, addressed) "
+        f"SELECT coalesce(district_id, 0), {vlan}, {subnet}, count(*), "
+        f"sum(CASE WHEN coalesce(local_if_ip, '') <> '' THEN 1 ELSE 0 END) "
+        f"FROM component WHERE {vlan} <> '' OR {subnet} <> '' "
+        f"GROUP BY coalesce(district_id, 0), {vlan}, {subnet}"
+    ))
+
+
+event.listen(Component.__table__, "after_create", _create_usage_triggers)
+
+
+class TableVersion(SQLModel, table=True):
+    """Monotonic per-table change counter, bumped in the same transaction as each write."""
+    table_name: str = Field(primary_key=True)
+    version: int = Field(default=0)
+
+
+class SchemaMigration(SQLModel, table=True):
+    """Migrations already applied to this database (see app/migrations.py)."""
+    name: str = Field(primary_key=True)
+    applied_at: datetime = Field(default_factory=datetime.utcnow)
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import base64
+import json
+from typing import Any, Sequence
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, false, or_
+
+# A sort key is a list of (column, descending) pairs; the last pair should be
+# the primary key so that every row has a unique position.
+SortKey = Sequence[tuple[Any, bool]]
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Opaque, URL-safe token holding the sort-key values of the last row."""
+    raw = json.dumps(list(values), separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str, size: int) -> list[Any]:
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return values
+
+
+def _nullable(col) -> bool:
+    return getattr(col, "nullable", True) and not getattr(col, "primary_key", False)
+
+
+def keyset_after(sort_key: SortKey, values: Sequence[Any]):
+    """WHERE clause selecting rows strictly after `values` in `sort_key` order.
+
+    Expands to (a > x) OR (a = x AND b > y) OR ... so it works for mixed
+    directions and on any dialect. NULLs sort lowest: first when ascending,
+    last when descending (see `order_by`).
+    """
+    clauses = []
+    for i, (col, desc) in enumerate(sort_key):
+        # `col == None` renders as IS NULL
+        prefix = [sort_key[j][0] == values[j] for j in range(i)]
+        value = values[i]
+        if value is None:
+            if desc:
+                continue  # nothing sorts after NULL in a descending column
+            step = col.is_not(None)
+        elif desc:
+            step = or_(col < value, col.is_(None)) if _nullable(col) else col < value
+        else:
+            step = col > value
+        clauses.append(and_(*prefix, step))
+    return or_(*clauses) if clauses else false()
+
+
+def order_by(sort_key: SortKey) -> list:
+    clauses = []
+    for col, desc in sort_key:
+        clause = col.desc() if desc else col.asc()
+        if _nullable(col):
+            clause = clause.nulls_last() if desc else clause.nulls_first()
+        clauses.append(clause)
+    return clauses
+
+
+def apply_keyset(stmt, sort_key: SortKey, after: str | None):
+    """Order `stmt` by `sort_key` and, if a cursor is given, seek past it."""
+    if after:
+        stmt = stmt.where(keyset_after(sort_key, decode_cursor(after, len(sort_key))))
+    return stmt.order_by(*order_by(sort_key))
+
+
+def next_cursor(rows: Sequence[Any], sort_key: SortKey, limit: int) -> str | None:
+    """Cursor for the page after `rows`, or None when this was the last page."""
+    if not rows or len(rows) < limit:
+        return None
+    last = rows[-1]
+    return encode_cursor([getattr(last, col.key) for col, _ in sort_key])
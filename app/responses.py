@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+from typing import Callable, Iterator
+
+import orjson
+from fastapi import Request
+from fastapi.responses import ORJSONResponse, StreamingResponse
+
+from .database import read_engine
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+STREAM_BATCH_SIZE = 1000
+
+__all__ = ["NDJSON_MEDIA_TYPE", "ORJSONResponse", "ndjson_response", "wants_ndjson"]
+
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def _iter_ndjson(stmt, transform: Callable | None) -> Iterator[bytes]:
+    # The request's session is closed before a streaming body is sent, so the
+    # generator owns its connection for the lifetime of the stream.
+    with read_engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=STREAM_BATCH_SIZE).execute(stmt)
+        for part in result.partitions():
+            rows = [dict(r._mapping) for r in part]
+            if transform is not None:
+                rows = transform(conn, rows)
+            yield b"".join(orjson.dumps(row) + b"\n" for row in rows)
+
+
+def ndjson_response(stmt, headers: dict | None = None, transform: Callable | None = None) -> StreamingResponse:
+    """Stream `stmt` as newline-delimited JSON, one batch of rows at a time.
+
+    `transform(conn, rows)` may enrich each batch (e.g. attach related rows)
+    using the same connection.
+    """
+    return StreamingResponse(_iter_ndjson(stmt, transform), media_type=NDJSON_MEDIA_TYPE, headers=headers)
@@ -1,83 +1,297 @@
 from __future__ import annotations
 
 import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
 from typing import Any, Dict, List, Type, TypeVar
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, Response, status
+from pydantic import BaseModel
+from sqlalchemy import Text, cast, delete, func, update
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import SQLModel, Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from .database import get_session
+from .audit import EDIT_ACTIONS, audit_writer, record_changes, record_entity_changes
+from .audit_archive import AUDIT_HOT_DAYS, ArchiveCorrupt, archive_audit_logs, query_audit_logs
+from .cache import MISSING, cache_stats, reference_lists
+from .database import get_async_read_session, get_async_session, get_read_session, get_session
 from . import models
+from .diffs import apply_patch
+from .filters import parse_filters, parse_sort
+from .pagination import NEXT_CURSOR_HEADER, apply_keyset, decode_cursor, encode_cursor, next_cursor
+from .responses import ORJSONResponse, ndjson_response, wants_ndjson
+from .versions import conditional, conditional_async, table_versions
+from .workbooks import WORKBOOK_KEEP_VERSIONS, WORKBOOK_MAX_AGE_DAYS, delete_workbooks, expired_workbooks, reclaim_space
 
 ModelType = TypeVar("ModelType", bound=SQLModel)
 
+logger = logging.getLogger(__name__)
+
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "1000"))
+
+
+class BulkRequest(BaseModel):
+    create: List[Dict[str, Any]] = []
+    update: List[Dict[str, Any]] = []  # each item carries its "id"
+    delete: List[int] = []
+
+
+def _projection(model: Type[SQLModel], fields: str | None) -> list | None:
+    """Validate a comma-separated `fields` list into table columns (id always included)."""
+    if not fields:
+        return None
+    names = [f.strip() for f in fields.split(",") if f.strip()]
+    columns = model.__table__.c
+    unknown = [n for n in names if n not in columns]
+    if unknown:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown field(s): {', '.join(unknown)}")
+    return [columns[n] for n in dict.fromkeys(["id", *names])]
+
+
+def _all_columns(model: Type[SQLModel]) -> list:
+    return list(model.__table__.c)
+
+
+def _with_sort_columns(columns: list, sort_key) -> tuple[list, list[str]]:
+    """Add sort-key columns a `fields` projection left out, so the next cursor
+    can be built; returns the columns and the names to drop from the output."""
+    present = {c.key for c in columns}
+    extra = [col for col, _ in sort_key if col.key not in present]
+    return [*columns, *extra], [c.key for c in extra]
+
+
+def _rows_as_dicts(rows, drop: list[str] = ()) -> list[dict]:
+    items = [dict(r._mapping) for r in rows]
+    for name in drop:
+        for item in items:
+            del item[name]
+    return items
+
+
+def _excel_text_filter(session: Session, q: str) -> list:
+    """WHERE clause for ExcelRow.data containing `q` (case-insensitive), evaluated in SQL.
+
+    Matches the same JSON text the in-Python check does, so callers keep that
+    check as a final filter. On PostgreSQL it can use the pg_trgm index on
+    CAST(data AS TEXT). Non-ASCII needles are left to Python on SQLite, where
+    stored JSON escapes them as \\uXXXX.
+    """
+    if not q.isascii() and session.get_bind().dialect.name != "postgresql":
+        return []
+    pattern = "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    return [cast(models.ExcelRow.data, Text).ilike(pattern, escape="\\")]
+
 
 def _generic_routes(model: Type[ModelType], prefix: str, tags: list[str]) -> APIRouter:
     router = APIRouter(prefix=prefix, tags=tags)
 
     @router.get("", response_model=List[model])
     @router.get("/", response_model=List[model])
-    def list_items(
-        session: Session = Depends(get_session),
+    async def list_items(
+        request: Request,
+        response: Response,
+        session: AsyncSession = Depends(get_async_read_session),
         limit: int = Query(500, le=50000),
         offset: int | None = Query(None, ge=0),
         skip: int | None = Query(None, ge=0),
+        after: str | None = Query(None, description="Cursor from X-Next-Cursor; replaces offset"),
+        fields: str | None = Query(None, description="Comma-separated columns to return"),
+        sort: str | None = Query(None, description="Comma-separated columns, '-' prefix for descending"),
     ):
-        eff_offset = offset if offset is not None else (skip or 0)
-        stmt = select(model).offset(eff_offset).limit(limit)
+        """List rows. Other query parameters named after a column are filters: `field=v`,
+        `field__in=a,b`, `field__gte=v` (also gt/lt/lte/ne), `field__prefix=v` (text
+        fields), `field__isnull=true`. Parameters that name no column are ignored."""
+        columns = _projection(model, fields) or _all_columns(model)
+        where = parse_filters(model, request.query_params.multi_items())
+        sort_key = parse_sort(model, sort)
+        not_modified = await conditional_async(request, response, session, [model])
+        if not_modified:
+            return not_modified
+        ndjson = wants_ndjson(request)
+        # Streams carry no cursor, so only pages need the sort columns
+        columns, hidden = (columns, []) if ndjson else _with_sort_columns(columns, sort_key)
+        stmt = apply_keyset(select(*columns).where(*where), sort_key, after)
+        if not after:
+            stmt = stmt.offset(offset if offset is not None else (skip or 0))
+        stmt = stmt.limit(limit)
+        if ndjson:
+            return ndjson_response(stmt, headers=dict(response.headers))
+        items = (await session.execute(stmt)).all()
 
-        return session.exec(stmt).all()
+        cursor = next_cursor(items, sort_key, limit)
+        if cursor:
+            response.headers[NEXT_CURSOR_HEADER] = cursor
+        # Rows go straight from the cursor to orjson; no model instances or
+        # response_model validation on the hot path
+        return ORJSONResponse(_rows_as_dicts(items, hidden), headers=dict(response.headers))
 
     @router.get("/{item_id}", response_model=model)
-    def get_item(item_id: int, session: Session = Depends(get_session)):
-        item = session.get(model, item_id)
+    async def get_item(
+        item_id: int,
+        request: Request,
+        response: Response,
+        session: AsyncSession = Depends(get_async_read_session),
+        fields: str | None = Query(None, description="Comma-separated columns to return"),
+    ):
+        columns = _projection(model, fields)
+        not_modified = await conditional_async(request, response, session, [model])
+        if not_modified:
+            return not_modified
+        if columns:
+            row = (await session.execute(select(*columns).where(model.id == item_id))).first()
+            if not row:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
+            return ORJSONResponse(dict(row._mapping), headers=dict(response.headers))
+        item = await session.get(model, item_id)
         if not item:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
         return item
 
     @router.post("/", response_model=model, status_code=status.HTTP_201_CREATED)
-    def create_item(payload: Dict[str, Any], session: Session = Depends(get_session)):
+    async def create_item(payload: Dict[str, Any], request: Request, session: AsyncSession = Depends(get_async_session)):
         obj = model(**payload)
         session.add(obj)
-        session.commit()
-        session.refresh(obj)
+        await session.commit()
+        await session.refresh(obj)
+        record_changes(request, None, obj.model_dump())
         return obj
 
     @router.put("/{item_id}", response_model=model)
-    def update_item(item_id: int, payload: Dict[str, Any], session: Session = Depends(get_session)):
-        db_obj = session.get(model, item_id)
+    async def update_item(
+        item_id: int, payload: Dict[str, Any], request: Request, session: AsyncSession = Depends(get_async_session)
+    ):
+        db_obj = await session.get(model, item_id)
         if not db_obj:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
+        before = db_obj.model_dump()
         for k, v in payload.items():
             if k == "id":
                 continue
             if hasattr(db_obj, k):
                 setattr(db_obj, k, v)
         session.add(db_obj)
-        session.commit()
-        session.refresh(db_obj)
+        await session.commit()
+        await session.refresh(db_obj)
+        record_changes(request, before, db_obj.model_dump())
         return db_obj
 
     @router.patch("/{item_id}", response_model=model)
-    def patch_item(item_id: int, payload: dict, session: Session = Depends(get_session)):
+    async def patch_item(item_id: int, payload: dict, request: Request, session: AsyncSession = Depends(get_async_session)):
         """Partial update for inline editing"""
-        db_obj = session.get(model, item_id)
+        db_obj = await session.get(model, item_id)
         if not db_obj:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
+        before = db_obj.model_dump()
         for k, v in payload.items():
             if hasattr(db_obj, k):
                 setattr(db_obj, k, v)
         session.add(db_obj)
-        session.commit()
-        session.refresh(db_obj)
+        await session.commit()
+        await session.refresh(db_obj)
+        record_changes(request, before, db_obj.model_dump())
         return db_obj
 
+    @router.post("/bulk")
+    async def bulk_items(payload: BulkRequest, request: Request, session: AsyncSession = Depends(get_async_session)):
+        """Apply creates, partial updates and deletes in a single transaction.
+
+        Each entity changed is audited with its own diff, as through the
+        single-item routes.
+        """
+        total = len(payload.create) + len(payload.update) + len(payload.delete)
+        if total > BULK_MAX_ITEMS:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Bulk request has {total} items; the limit is {BULK_MAX_ITEMS}",
+            )
+        columns = model.__table__.c
+        results: Dict[str, list] = {"create": [], "update": [], "delete": []}
+
+        def _unknown(data: Dict[str, Any]) -> list[str]:
+            return [k for k in data if k not in columns]
+
+        new_objs = []
+        for i, data in enumerate(payload.create):
+            unknown = _unknown(data)
+            if unknown:
+                results["create"].append({"index": i, "status": "error", "detail": f"Unknown field(s): {', '.join(unknown)}"})
+                continue
+            obj = model(**{k: v for k, v in data.items() if k != "id"})
+            new_objs.append((i, obj))
+
+        update_ids = [d.get("id") for d in payload.update if isinstance(d.get("id"), int)]
+        touched_ids = set(update_ids) | set(payload.delete)
+        rows = select(*columns)
+        existing = {
+            row["id"]: dict(row)
+            for row in (await session.execute(rows.where(model.id.in_(touched_ids)))).mappings()
+        } if touched_ids else {}
+
+        update_rows = []
+        for data in payload.update:
+            item_id = data.get("id")
+            if not isinstance(item_id, int):
+                results["update"].append({"id": item_id, "status": "error", "detail": "Missing id"})
+            elif item_id not in existing:
+                results["update"].append({"id": item_id, "status": "not_found"})
+            elif _unknown(data):
+                results["update"].append({"id": item_id, "status": "error", "detail": f"Unknown field(s): {', '.join(_unknown(data))}"})
+            else:
+                update_rows.append(data)
+                results["update"].append({"id": item_id, "status": "updated"})
+
+        delete_ids: dict[int, None] = {}
+        for item_id in payload.delete:
+            # A repeated id deletes nothing the second time
+            if item_id in existing and item_id not in delete_ids:
+                delete_ids[item_id] = None
+                results["delete"].append({"id": item_id, "status": "deleted"})
+            else:
+                results["delete"].append({"id": item_id, "status": "not_found"})
+
+        try:
+            if new_objs:
+                session.add_all([obj for _, obj in new_objs])
+                await session.flush()  # batched INSERT ... RETURNING
+            updated = {}
+            if update_rows:
+                await session.execute(update(model), update_rows)  # executemany by primary key
+                updated_ids = [data["id"] for data in update_rows]
+                updated = {
+                    row["id"]: dict(row)
+                    for row in (await session.execute(rows.where(model.id.in_(updated_ids)))).mappings()
+                }
+            if delete_ids:
+                await session.execute(
+                    delete(model).where(model.id.in_(list(delete_ids))),
+                    execution_options={"synchronize_session": False},
+                )
+            await session.commit()
+        except IntegrityError as e:
+            await session.rollback()
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Bulk operation rolled back: {e.orig}")
+
+        record_entity_changes(request, [
+            *((obj.id, None, obj.model_dump()) for _, obj in new_objs),
+            *((item_id, existing[item_id], after) for item_id, after in updated.items()),
+            *((item_id, existing[item_id], None) for item_id in delete_ids),
+        ])
+        for i, obj in new_objs:
+            results["create"].append({"index": i, "status": "created", "id": obj.id})
+        results["create"].sort(key=lambda r: r["index"])
+        return results
+
     @router.delete("/{item_id}", status_code=status.HTTP_204_NO_CONTENT)
-    def delete_item(item_id: int, session: Session = Depends(get_session)):
-        db_obj = session.get(model, item_id)
+    async def delete_item(item_id: int, request: Request, session: AsyncSession = Depends(get_async_session)):
+        db_obj = await session.get(model, item_id)
         if not db_obj:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
-        session.delete(db_obj)
-        session.commit()
+        before = db_obj.model_dump()
+        await session.delete(db_obj)
+        await session.commit()
+        record_changes(request, before, None)
         return None
 
     return router
@@ -88,56 +302,111 @@ district_router = _generic_routes(models.District, "/districts", ["Districts"])
 landmark_router = _generic_routes(models.Landmark, "/landmarks", ["Landmarks"])
 pole_router = _generic_routes(models.Pole, "/poles", ["Poles"])
 junction_box_router = _generic_routes(models.JunctionBox, "/junction-boxes", ["Junction Boxes"])
-component_router = _generic_routes(models.Component, "/components", ["Components"])
+component_crud_router = _generic_routes(models.Component, "/components", ["Components"])
 credential_router = _generic_routes(models.Credential, "/credentials", ["Credentials"])
 
-# Custom components router to include related credentials and convenient nested data
-from fastapi import APIRouter, Depends, Query
+# Custom components router to include related credentials and convenient nested data.
+# It is mounted before component_crud_router, so its GET routes take precedence while
+# writes (POST/PUT/PATCH/DELETE and /bulk) fall through to the generic routes.
 
 component_router = APIRouter(prefix="/components", tags=["Components"])
 
 
+def _credentials_by_component(conn, comp_ids: list[int]) -> Dict[int, list]:
+    # Fetch credentials in bulk for a page of components (avoid N+1 query);
+    # `conn` may be a Session or a Connection
+    creds_map: Dict[int, list] = {}
+    if comp_ids:
+        creds = conn.execute(
+            select(*_all_columns(models.Credential)).where(models.Credential.component_id.in_(comp_ids))
+        ).all()
+        for cred in creds:
+            creds_map.setdefault(cred.component_id, []).append(dict(cred._mapping))
+    return creds_map
+
+
+def _attach_credentials(conn, rows: list[dict]) -> list[dict]:
+    creds_map = _credentials_by_component(conn, [obj["id"] for obj in rows])
+    for obj in rows:
+        obj["credentials"] = creds_map.get(obj["id"], [])
+    return rows
+
+
+def _include_credentials(include: str | None) -> bool:
+    names = {i.strip() for i in (include or "").split(",") if i.strip()}
+    if names - {"credentials"}:
+        raise HTTPException(status_code=400, detail=f"Unknown include(s): {', '.join(sorted(names - {'credentials'}))}")
+    return "credentials" in names
+
+
 @component_router.get("")
-def list_components(
-    session: Session = Depends(get_session),
+@component_router.get("/")
+async def list_components(
+    request: Request,
+    response: Response,
+    session: AsyncSession = Depends(get_async_read_session),
     limit: int = Query(200, le=50000),
     offset: int | None = Query(None, ge=0),
     skip: int | None = Query(None, ge=0),
+    after: str | None = Query(None, description="Cursor from X-Next-Cursor; replaces offset"),
+    fields: str | None = Query(None, description="Comma-separated columns to return"),
+    include: str | None = Query(None, description="'credentials' to attach credentials to sparse rows"),
+    sort: str | None = Query(None, description="Comma-separated columns, '-' prefix for descending"),
 ):
-    # Fetch components with pagination
-    eff_offset = offset if offset is not None else (skip or 0)
-    stmt = select(models.Component).offset(eff_offset).limit(limit)
-    comps = session.exec(stmt).all()
-    
-    # Get all component IDs to fetch credentials in bulk (avoid N+1 query)
-    comp_ids = [c.id for c in comps]
-    creds_map = {}
-    if comp_ids:
-        creds = session.exec(
-            select(models.Credential).where(models.Credential.component_id.in_(comp_ids))
-        ).all()
-        for cred in creds:
-            if cred.component_id not in creds_map:
-                creds_map[cred.component_id] = []
-            creds_map[cred.component_id].append(cred.dict())
-    
-    # Build result with credentials
-    result = []
-    for c in comps:
-        obj = c.dict()
-        obj["credentials"] = creds_map.get(c.id, [])
-        result.append(obj)
-    return result
+    """List components. Other query parameters filter like the generic list routes."""
+    columns = _projection(models.Component, fields)
+    # Full rows keep their credentials; sparse rows only carry them on request
+    with_creds = _include_credentials(include) or not columns
+    where = parse_filters(models.Component, request.query_params.multi_items())
+    sort_key = parse_sort(models.Component, sort)
+    not_modified = await conditional_async(request, response, session, [models.Component, models.Credential])
+    if not_modified:
+        return not_modified
+
+    # Fetch components with pagination (keyset when a cursor is given)
+    columns = columns or _all_columns(models.Component)
+    ndjson = wants_ndjson(request)
+    columns, hidden = (columns, []) if ndjson else _with_sort_columns(columns, sort_key)
+    stmt = apply_keyset(select(*columns).where(*where), sort_key, after)
+    if not after:
+        stmt = stmt.offset(offset if offset is not None else (skip or 0))
+    stmt = stmt.limit(limit)
+    if ndjson:
+        return ndjson_response(stmt, headers=dict(response.headers), transform=_attach_credentials if with_creds else None)
+    comps = (await session.execute(stmt)).all()
+
+    cursor = next_cursor(comps, sort_key, limit)
+    if cursor:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
+
+    result = _rows_as_dicts(comps, hidden)
+    if with_creds:
+        await session.run_sync(_attach_credentials, result)
+    return ORJSONResponse(result, headers=dict(response.headers))
 
 
 @component_router.get("/{item_id}")
-def get_component(item_id: int, session: Session = Depends(get_session)):
-    c = session.get(models.Component, item_id)
-    if not c:
+async def get_component(
+    item_id: int,
+    request: Request,
+    response: Response,
+    session: AsyncSession = Depends(get_async_read_session),
+    fields: str | None = Query(None, description="Comma-separated columns to return"),
+    include: str | None = Query(None, description="'credentials' to attach credentials to sparse rows"),
+):
+    columns = _projection(models.Component, fields)
+    with_creds = _include_credentials(include) or not columns
+    not_modified = await conditional_async(request, response, session, [models.Component, models.Credential])
+    if not_modified:
+        return not_modified
+    row = (await session.execute(
+        select(*(columns or _all_columns(models.Component))).where(models.Component.id == item_id)
+    )).first()
+    if not row:
         raise HTTPException(status_code=404, detail="Not found")
-    creds = session.exec(select(models.Credential).where(models.Credential.component_id == c.id)).all()
-    obj = c.dict()
-    obj["credentials"] = [cr.dict() for cr in creds] if creds else []
+    obj = dict(row._mapping)
+    if with_creds:
+        await session.run_sync(_attach_credentials, [obj])
     return obj
 
 
@@ -147,28 +416,266 @@ audit_router = APIRouter(prefix="/audit-logs", tags=["Audit Logs"])
 
 @audit_router.get("", response_model=List[models.AuditLog])
 def list_audit_logs(
-    session: Session = Depends(get_session),
+    request: Request,
+    response: Response,
+    session: Session = Depends(get_read_session),
     limit: int = Query(5000, le=50000),
     offset: int = Query(0, ge=0),
+    start: str | None = Query(None, description="ISO timestamp, inclusive"),
+    end: str | None = Query(None, description="ISO timestamp, exclusive"),
+    sort: str | None = Query(None, description="Default -timestamp,-id (newest first)"),
+    after: str | None = Query(None, description="Cursor from X-Next-Cursor; replaces offset"),
+):
+    """Live (not yet archived) audit logs. Any other query parameter is a filter
+    as on the entity lists: `username=`, `action__in=UPDATE,DELETE`,
+    `entity_type=`, `entity_id=`."""
+    log = models.AuditLog
+    where = parse_filters(log, [(k, v) for k, v in request.query_params.multi_items() if k not in ("start", "end")])
+    if start:
+        where.append(log.timestamp >= start)
+    if end:
+        where.append(log.timestamp < end)
+    sort_key = parse_sort(log, sort or "-timestamp,-id")
+    not_modified = conditional(request, response, session, [log])
+    if not_modified:
+        return not_modified
+    stmt = apply_keyset(select(*_all_columns(log)).where(*where), sort_key, after)
+    if not after:
+        stmt = stmt.offset(offset)
+    stmt = stmt.limit(limit)
+    if wants_ndjson(request):
+        return ndjson_response(stmt, headers=dict(response.headers))
+    logs = session.execute(stmt).all()
+
+    cursor = next_cursor(logs, sort_key, limit)
+    if cursor:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
+    return ORJSONResponse(_rows_as_dicts(logs), headers=dict(response.headers))
+
+
+def _utc_moment(value: str) -> datetime:
+    """ISO date or timestamp as a naive UTC datetime, the way audit timestamps are stored."""
+    try:
+        moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid timestamp: {value}")
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def _day_range(stmt, day_column, start: str | None, end: str | None):
+    """Keep the rollup days that overlap [start, end); either bound may be a date or a timestamp."""
+    if start:
+        stmt = stmt.where(day_column >= _utc_moment(start).date().isoformat())
+    if end:
+        moment = _utc_moment(end)
+        # An end after midnight still takes in part of its own day
+        last = moment.date() if moment.time() == datetime.min.time() else moment.date() + timedelta(days=1)
+        stmt = stmt.where(day_column < last.isoformat())
+    return stmt
+
+
+@audit_router.get("/stats/activity")
+def audit_activity(
+    request: Request,
+    response: Response,
+    session: Session = Depends(get_read_session),
+    start: str | None = Query(None, description="Date or ISO timestamp; its whole day is included"),
+    end: str | None = Query(None, description="Date or ISO timestamp, exclusive; a day it reaches into is included"),
     username: str | None = Query(None),
+    action: str | None = Query(None),
+    entity_type: str | None = Query(None),
 ):
-    stmt = select(models.AuditLog)
-    if username:
-        stmt = stmt.where(models.AuditLog.username == username)
-    stmt = stmt.order_by(models.AuditLog.id.desc()).offset(offset).limit(limit)
-    return session.exec(stmt).all()
+    """Audit entries per day, user and action, from the daily rollup (archived history included)."""
+    not_modified = conditional(request, response, session, [models.AuditDailyActivity])
+    if not_modified:
+        return not_modified
+    t = models.AuditDailyActivity
+    stmt = _day_range(select(t.day, t.username, t.action, func.sum(t.count).label("count")), t.day, start, end)
+    for column, value in ((t.username, username), (t.action, action), (t.entity_type, entity_type)):
+        if value is not None:
+            stmt = stmt.where(column == value)
+    stmt = stmt.group_by(t.day, t.username, t.action).order_by(t.day, t.username, t.action)
+    return ORJSONResponse(_rows_as_dicts(session.execute(stmt).all()), headers=dict(response.headers))
 
 
-@audit_router.post("", response_model=models.AuditLog, status_code=status.HTTP_201_CREATED)
-def create_audit_log(payload: models.AuditLog, session: Session = Depends(get_session)):
-    session.add(payload)
-    session.commit()
-    session.refresh(payload)
-    return payload
+@audit_router.get("/stats/top-entities")
+def audit_top_entities(
+    request: Request,
+    response: Response,
+    session: Session = Depends(get_read_session),
+    start: str | None = Query(None, description="Date or ISO timestamp; its whole day is included"),
+    end: str | None = Query(None, description="Date or ISO timestamp, exclusive; a day it reaches into is included"),
+    entity_type: str | None = Query(None),
+    limit: int = Query(20, ge=1, le=1000),
+):
+    """Most created/updated/deleted entities, from the daily rollup."""
+    not_modified = conditional(request, response, session, [models.AuditDailyEntity])
+    if not_modified:
+        return not_modified
+    t = models.AuditDailyEntity
+    edits = func.sum(t.count).label("edits")
+    stmt = _day_range(select(t.entity_type, t.entity_id, edits, func.max(t.day).label("last_day")), t.day, start, end)
+    if entity_type is not None:
+        stmt = stmt.where(t.entity_type == entity_type)
+    stmt = stmt.group_by(t.entity_type, t.entity_id).order_by(edits.desc(), t.entity_type, t.entity_id).limit(limit)
+    return ORJSONResponse(_rows_as_dicts(session.execute(stmt).all()), headers=dict(response.headers))
+
+
+@audit_router.post("", status_code=status.HTTP_202_ACCEPTED)
+async def create_audit_log(payload: models.AuditLog):
+    """Queue a client-side event; it is written with the next audit batch.
+
+    Writes, imports and searches are recorded by AuditMiddleware already.
+    """
+    if not await audit_writer.submit_async(payload.model_dump(exclude={"id"})):
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Audit queue full")
+    return {"status": "queued"}
+
+
+def _query_audit_logs(session: Session, *args, **kwargs) -> list[dict]:
+    # The archive reports corruption as ArchiveCorrupt; only HTTP callers turn it into a 500
+    try:
+        return query_audit_logs(session, *args, **kwargs)
+    except ArchiveCorrupt as exc:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(exc))
+
+
+@audit_router.get("/history")
+def audit_history(
+    request: Request,
+    response: Response,
+    session: Session = Depends(get_read_session),
+    start: str | None = Query(None, description="ISO timestamp, inclusive"),
+    end: str | None = Query(None, description="ISO timestamp, exclusive"),
+    username: str | None = Query(None),
+    action: str | None = Query(None),
+    entity_type: str | None = Query(None),
+    limit: int = Query(1000, ge=1, le=50000),
+    after: str | None = Query(None, description="Cursor from X-Next-Cursor"),
+):
+    """Audit logs over any date range, oldest first, from the live table and the archive."""
+    not_modified = conditional(request, response, session, [models.AuditLog, models.AuditSegment])
+    if not_modified:
+        return not_modified
+    rows = _query_audit_logs(
+        session, start, end,
+        filters={"username": username, "action": action, "entity_type": entity_type},
+        after=tuple(decode_cursor(after, 2)) if after else None,
+        limit=limit,
+    )
+    if len(rows) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor([rows[-1]["timestamp"], rows[-1]["id"]])
+    return ORJSONResponse(rows, headers=dict(response.headers))
+
+
+@audit_router.post("/archive")
+def archive_audit(older_than_days: int = Query(AUDIT_HOT_DAYS, ge=1)):
+    """Move logs older than `older_than_days` from the table into the compressed archive now."""
+    return archive_audit_logs(older_than_days)
+
+
+# entity_type as recorded by AuditMiddleware -> model whose rows it names
+_AUDITED_MODELS: Dict[str, Type[SQLModel]] = {
+    "regions": models.Region,
+    "districts": models.District,
+    "landmarks": models.Landmark,
+    "poles": models.Pole,
+    "junction-boxes": models.JunctionBox,
+    "components": models.Component,
+    "credentials": models.Credential,
+    "excel_rows": models.ExcelRow,
+}
+
+
+def _audit_entries_after(session: Session, at: str, filters: Dict[str, Any]) -> list[dict]:
+    """Every audit entry matching `filters` timestamped after `at`, oldest first."""
+    entries: list[dict] = []
+    cursor = None
+    while True:
+        page = _query_audit_logs(session, start=at, filters=filters, after=cursor, limit=1000)
+        entries.extend(row for row in page if row["timestamp"] > at)
+        if len(page) < 1000:
+            return entries
+        cursor = (page[-1]["timestamp"], page[-1]["id"])
+
+
+@audit_router.get("/state/{entity_type}/{entity_id}")
+def audit_entity_state(
+    entity_type: str,
+    entity_id: int,
+    request: Request,
+    response: Response,
+    at: str = Query(..., description="ISO timestamp; changes recorded up to and including it are kept"),
+    session: Session = Depends(get_read_session),
+):
+    """Rebuild an entity as it was at `at` by undoing its later changes, newest first.
+
+    Starts from the current row and applies the inverse patch (old_value) of
+    every audit entry for the entity after `at`, archived ones included.
+    `unrecorded` counts later edits of the entity without a diff (made before
+    diffs were recorded); updates that changed nothing are not counted.
+    `untracked` counts later writes that may have changed it without an entry
+    of its own: imports, bulk requests from before bulk edits were recorded
+    per entity and, for Excel rows, workbook deletes. The state is only
+    `complete` when both are zero.
+    """
+    model = _AUDITED_MODELS.get(entity_type)
+    if model is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown entity type: {entity_type}")
+    moment = _utc_moment(at)
+    at = moment.isoformat(timespec="milliseconds") + "Z"  # same shape as audit_timestamp()
+    not_modified = conditional(request, response, session, [model, models.AuditLog, models.AuditSegment])
+    if not_modified:
+        return not_modified
+
+    later = _audit_entries_after(session, at, {"entity_type": entity_type, "entity_id": entity_id})
+    untracked_sources = [{"action": "IMPORT"}, {"action": "BULK", "entity_type": entity_type}]
+    if entity_type == "excel_rows":
+        untracked_sources.append({"action": "DELETE", "entity_type": "excel_workbooks"})
+    untracked = sum(len(_audit_entries_after(session, at, filters)) for filters in untracked_sources)
+
+    current = session.get(model, entity_id)
+    state = current.model_dump() if current else None
+    undone = unrecorded = 0
+    for entry in reversed(later):
+        if entry["action"] == "UPDATE" and entry["old_value"] is None and entry["new_value"] is None:
+            continue  # an update that changed nothing
+        try:
+            inverse = json.loads(entry["old_value"]) if entry["old_value"] else None
+        except ValueError:
+            inverse = None
+        if not isinstance(inverse, list):
+            unrecorded += entry["action"] in EDIT_ACTIONS
+            continue
+        try:
+            state = apply_patch(state, inverse)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Audit entry {entry['id']} does not apply to the rebuilt state: {e}",
+            )
+        undone += 1
+    if state is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Not found at {at}")
+    return ORJSONResponse({
+        "entity_type": entity_type,
+        "entity_id": entity_id,
+        "at": at,
+        "state": state,
+        "undone": undone,
+        "unrecorded": unrecorded,
+        "untracked": untracked,
+        "complete": unrecorded == 0 and untracked == 0,
+    }, headers=dict(response.headers))
 
 
 @audit_router.get("/{log_id}", response_model=models.AuditLog)
-def get_audit_log(log_id: int, session: Session = Depends(get_session)):
+def get_audit_log(log_id: int, request: Request, response: Response, session: Session = Depends(get_read_session)):
+    not_modified = conditional(request, response, session, [models.AuditLog])
+    if not_modified:
+        return not_modified
     log = session.get(models.AuditLog, log_id)
     if not log:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
@@ -184,7 +691,7 @@ excel_router = APIRouter(prefix="/excel", tags=["Excel"])
 
 @excel_router.get("/workbooks")
 def list_workbooks(
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
     limit: int = Query(200, le=2000),
     offset: int = Query(0, ge=0),
 ):
@@ -193,21 +700,50 @@ def list_workbooks(
 
 
 @excel_router.get("/workbooks/{workbook_id}")
-def get_workbook(workbook_id: int, session: Session = Depends(get_session)):
+def get_workbook(workbook_id: int, session: Session = Depends(get_read_session)):
     wb = session.get(models.ExcelWorkbook, workbook_id)
     if not wb:
         raise HTTPException(status_code=404, detail="Not found")
     return wb
 
 
+@excel_router.delete("/workbooks/{workbook_id}")
+def delete_workbook(workbook_id: int, background_tasks: BackgroundTasks, session: Session = Depends(get_session)):
+    """Delete a stored workbook with all its sheets and rows; free pages are reclaimed after the response."""
+    if not session.get(models.ExcelWorkbook, workbook_id):
+        raise HTTPException(status_code=404, detail="Not found")
+    deleted = delete_workbooks(session, [workbook_id])
+    session.commit()
+    background_tasks.add_task(reclaim_space)
+    return {"deleted": deleted}
+
+
+@excel_router.post("/workbooks/prune")
+def prune_workbooks(
+    background_tasks: BackgroundTasks,
+    session: Session = Depends(get_session),
+    keep_versions: int = Query(WORKBOOK_KEEP_VERSIONS, ge=0, description="Newest versions to keep per filename; 0 = no limit"),
+    older_than_days: int = Query(WORKBOOK_MAX_AGE_DAYS, ge=0, description="Delete versions older than this; 0 = no limit"),
+    dry_run: bool = Query(False),
+):
+    """Apply the retention policy to every filename (defaults from WORKBOOK_KEEP_VERSIONS / WORKBOOK_MAX_AGE_DAYS)."""
+    ids = expired_workbooks(session, keep_versions=keep_versions, max_age_days=older_than_days)
+    if dry_run or not ids:
+        return {"workbook_ids": ids, "deleted": None}
+    deleted = delete_workbooks(session, ids)
+    session.commit()
+    background_tasks.add_task(reclaim_space)
+    return {"workbook_ids": ids, "deleted": deleted}
+
+
 @excel_router.get("/workbooks/{workbook_id}/sheets")
-def list_sheets(workbook_id: int, session: Session = Depends(get_session)):
+def list_sheets(workbook_id: int, session: Session = Depends(get_read_session)):
     stmt = select(models.ExcelSheet).where(models.ExcelSheet.workbook_id == workbook_id).order_by(models.ExcelSheet.id.asc())
     return session.exec(stmt).all()
 
 
 @excel_router.get("/sheets/{sheet_id}")
-def get_sheet(sheet_id: int, session: Session = Depends(get_session)):
+def get_sheet(sheet_id: int, session: Session = Depends(get_read_session)):
     sh = session.get(models.ExcelSheet, sheet_id)
     if not sh:
         raise HTTPException(status_code=404, detail="Not found")
@@ -217,14 +753,21 @@ def get_sheet(sheet_id: int, session: Session = Depends(get_session)):
 @excel_router.get("/sheets/{sheet_id}/rows")
 def list_sheet_rows(
     sheet_id: int,
-    session: Session = Depends(get_session),
+    request: Request,
+    response: Response,
+    session: Session = Depends(get_read_session),
     limit: int = Query(200, le=5000),
     offset: int = Query(0, ge=0),
     q: str | None = Query(None, description="Search across cell values"),
     sort_col: str | None = Query(None, description="Column key to sort by"),
     sort_dir: str = Query("asc", pattern="^(asc|desc)$"),
 ):
+    not_modified = conditional(request, response, session, [models.ExcelRow])
+    if not_modified:
+        return not_modified
     stmt = select(models.ExcelRow).where(models.ExcelRow.sheet_id == sheet_id)
+    if q:
+        stmt = stmt.where(*_excel_text_filter(session, q))
     stmt = stmt.order_by(models.ExcelRow.row_index.asc()).offset(offset).limit(limit)
     rows = session.exec(stmt).all()
 
@@ -243,12 +786,13 @@ def list_sheet_rows(
 
 
 @excel_router.patch("/rows/{row_id}")
-def patch_excel_row(row_id: int, payload: Dict[str, Any], session: Session = Depends(get_session)):
+def patch_excel_row(row_id: int, payload: Dict[str, Any], request: Request, session: Session = Depends(get_session)):
     """Excel-like inline editing: PATCH {"ColumnName": "value", ...}"""
     row = session.get(models.ExcelRow, row_id)
     if not row:
         raise HTTPException(status_code=404, detail="Not found")
 
+    before = row.model_dump()
     data = dict(row.data or {})
     for k, v in payload.items():
         if v is None:
@@ -259,12 +803,13 @@ def patch_excel_row(row_id: int, payload: Dict[str, Any], session: Session = Dep
     session.add(row)
     session.commit()
     session.refresh(row)
+    record_changes(request, before, row.model_dump())
     return row
 
 @search_router.get("/global")
-def global_search(
+async def global_search(
     q: str = Query(..., min_length=1),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_read_session),
     limit: int = Query(5000, le=50000),
 ):
     """
@@ -285,78 +830,78 @@ def global_search(
     search_term = f"%{q}%"
     
     # Search regions
-    regions = session.exec(
-        select(models.Region).where(models.Region.name.ilike(search_term)).limit(limit)
-    ).all()
-    results["regions"] = [r.dict() for r in regions]
+    regions = (await session.execute(
+        select(*_all_columns(models.Region)).where(models.Region.name.ilike(search_term)).limit(limit)
+    )).all()
+    results["regions"] = _rows_as_dicts(regions)
     
     # Search districts
-    districts = session.exec(
-        select(models.District).where(models.District.name.ilike(search_term)).limit(limit)
-    ).all()
-    results["districts"] = [d.dict() for d in districts]
+    districts = (await session.execute(
+        select(*_all_columns(models.District)).where(models.District.name.ilike(search_term)).limit(limit)
+    )).all()
+    results["districts"] = _rows_as_dicts(districts)
     
     # Search landmarks
-    landmarks = session.exec(
-        select(models.Landmark).where(
+    landmarks = (await session.execute(
+        select(*_all_columns(models.Landmark)).where(
             (models.Landmark.code.ilike(search_term)) | 
             (models.Landmark.name.ilike(search_term))
         ).limit(limit)
-    ).all()
-    results["landmarks"] = [l.dict() for l in landmarks]
+    )).all()
+    results["landmarks"] = _rows_as_dicts(landmarks)
     
     # Search poles
-    poles = session.exec(
-        select(models.Pole).where(
+    poles = (await session.execute(
+        select(*_all_columns(models.Pole)).where(
             (models.Pole.code.ilike(search_term)) |
             (models.Pole.location_name.ilike(search_term))
         ).limit(limit)
-    ).all()
-    results["poles"] = [p.dict() for p in poles]
+    )).all()
+    results["poles"] = _rows_as_dicts(poles)
     
     # Search junction boxes
-    jbs = session.exec(
-        select(models.JunctionBox).where(
+    jbs = (await session.execute(
+        select(*_all_columns(models.JunctionBox)).where(
             models.JunctionBox.code.ilike(search_term)
         ).limit(limit)
-    ).all()
-    results["junction_boxes"] = [j.dict() for j in jbs]
+    )).all()
+    results["junction_boxes"] = _rows_as_dicts(jbs)
     
     # Search components
-    components = session.exec(
-        select(models.Component).where(
+    components = (await session.execute(
+        select(*_all_columns(models.Component)).where(
             (models.Component.component_code.ilike(search_term)) |
             (models.Component.component_type.ilike(search_term)) |
             (models.Component.model.ilike(search_term)) |
             (models.Component.serial.ilike(search_term))
         ).limit(limit)
-    ).all()
-    results["components"] = [c.dict() for c in components]
+    )).all()
+    results["components"] = _rows_as_dicts(components)
     
     # Search credentials
-    credentials = session.exec(
-        select(models.Credential).where(
+    credentials = (await session.execute(
+        select(*_all_columns(models.Credential)).where(
             (models.Credential.component_code.ilike(search_term)) |
             (models.Credential.ip_address.ilike(search_term)) |
             (models.Credential.username.ilike(search_term))
         ).limit(limit)
-    ).all()
-    results["credentials"] = [c.dict() for c in credentials]
+    )).all()
+    results["credentials"] = _rows_as_dicts(credentials)
 
     try:
         needle = q.lower()
-        # Get ALL Excel rows with their workbook and sheet info
-        all_excel_rows = session.exec(
-            select(models.ExcelRow).order_by(models.ExcelRow.id.desc())
-        ).all()
+        # Excel rows matching in SQL, with their workbook and sheet info
+        all_excel_rows = (await session.exec(
+            select(models.ExcelRow).where(*_excel_text_filter(session, q)).order_by(models.ExcelRow.id.desc())
+        )).all()
         
         hits = []
         hits_by_key = {}  # Track hits to deduplicate
         
         for r in all_excel_rows:
             if needle in json.dumps(r.data, ensure_ascii=False).lower():
-                sh = session.get(models.ExcelSheet, r.sheet_id)
-                wb = session.get(models.ExcelWorkbook, sh.workbook_id) if sh else None
+                sh = await session.get(models.ExcelSheet, r.sheet_id)
+                wb = await session.get(models.ExcelWorkbook, sh.workbook_id) if sh else None
                 
                 hit = {
                     "workbook_id": wb.id if wb else None,
@@ -378,24 +923,23 @@ def global_search(
                     break
         
         results["excel"] = hits
-    except Exception as e:
-        print(f"Excel search error: {e}")
-        pass
+    except Exception:
+        logger.exception("Excel search failed for %r", q)
 
     # Count total results
     total = sum(len(v) for v in results.values())
     
-    return {
+    return ORJSONResponse({
         "query": q,
         "total_results": total,
         "results": results,
-    }
+    })
 
 
 @search_router.get("/excel-by-value")
 def search_excel_by_value(
     q: str = Query(..., min_length=1),
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
 ):
     """
     Search for a specific value across all Excel workbooks and sheets.
@@ -405,8 +949,8 @@ def search_excel_by_value(
     needle = q.lower()
     results_by_workbook = {}
     
-    # Get all Excel rows
-    all_rows = session.exec(select(models.ExcelRow)).all()
+    # Excel rows whose cell text matches
+    all_rows = session.exec(select(models.ExcelRow).where(*_excel_text_filter(session, q))).all()
     
     for row in all_rows:
         # Search in all cell values of the row
@@ -455,3 +999,109 @@ def search_excel_by_value(
     }
 
 
+# Stats Router (dashboard counts without shipping the rows)
+stats_router = APIRouter(prefix="/stats", tags=["Stats"])
+
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", "30"))
+
+_STATS_ENTITIES = {
+    "regions": models.Region,
+    "districts": models.District,
+    "landmarks": models.Landmark,
+    "poles": models.Pole,
+    "junction-boxes": models.JunctionBox,
+    "components": models.Component,
+    "credentials": models.Credential,
+}
+_stats_cache: Dict[str, Any] = {"versions": None, "value": None, "expires": 0.0}
+
+
+def _compute_stats(session: Session) -> Dict[str, Any]:
+    counts = {
+        name: session.exec(select(func.count()).select_from(model)).one()
+        for name, model in _STATS_ENTITIES.items()
+    }
+
+    C = models.Component
+    by_region = session.exec(
+        select(C.region_id, models.Region.name, func.count())
+        .join(models.Region, models.Region.id == C.region_id, isouter=True)
+        .group_by(C.region_id, models.Region.name)
+    ).all()
+    by_district = session.exec(
+        select(C.district_id, models.District.name, func.count())
+        .join(models.District, models.District.id == C.district_id, isouter=True)
+        .group_by(C.district_id, models.District.name)
+    ).all()
+    by_type = session.exec(
+        select(C.component_type, func.count()).group_by(C.component_type)
+    ).all()
+
+    return {
+        "counts": counts,
+        "components_by_region": [
+            {"region_id": rid, "region": name, "count": n} for rid, name, n in by_region
+        ],
+        "components_by_district": [
+            {"district_id": did, "district": name, "count": n} for did, name, n in by_district
+        ],
+        "components_by_type": [{"component_type": t, "count": n} for t, n in by_type],
+        "generated_at": datetime.utcnow().replace(microsecond=0).isoformat() + "Z",
+    }
+
+
+@stats_router.get("")
+def get_stats(session: Session = Depends(get_read_session)):
+    """Entity counts and component breakdowns, cached until a counted table changes or TTL expiry."""
+    now = time.monotonic()
+    versions = table_versions(session, _STATS_ENTITIES.values())
+    if versions != _stats_cache["versions"] or now >= _stats_cache["expires"]:
+        _stats_cache["value"] = _compute_stats(session)
+        _stats_cache["versions"] = versions
+        _stats_cache["expires"] = now + STATS_CACHE_TTL
+    return _stats_cache["value"]
+
+
+@stats_router.get("/cache")
+def get_cache_stats():
+    """Hit/miss counters for the in-process reference caches (per worker process)."""
+    return {"caches": cache_stats()}
+
+
+@stats_router.get("/audit")
+def get_audit_stats():
+    """Audit writer queue depth and counters (per worker process)."""
+    return audit_writer.stats()
+
+
+# Reference Router (id -> name lists for resolving foreign keys in the UI)
+reference_router = APIRouter(prefix="/reference", tags=["Reference"])
+
+_REFERENCE_TABLES = {
+    "regions": (models.Region, ["id", "name"]),
+    "districts": (models.District, ["id", "name", "region_id"]),
+    "landmarks": (models.Landmark, ["id", "code", "name", "district_id"]),
+}
+
+
+@reference_router.get("")
+async def get_reference(
+    tables: str = Query("regions,districts", description="Comma-separated: regions, districts, landmarks"),
+    session: AsyncSession = Depends(get_async_read_session),
+):
+    """Id/name lists served from the reference cache; the database is read only after a write or TTL expiry."""
+    names = [t.strip() for t in tables.split(",") if t.strip()]
+    unknown = [n for n in names if n not in _REFERENCE_TABLES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown table(s): {', '.join(unknown)}")
+    result = {}
+    for name in names:
+        rows = reference_lists.get(name)
+        if rows is MISSING:
+            generation = reference_lists.generation
+            model, cols = _REFERENCE_TABLES[name]
+            table = model.__table__.c
+            rows = _rows_as_dicts((await session.execute(select(*[table[c] for c in cols]).order_by(table["id"]))).all())
+            reference_lists.set(name, rows, generation=generation)
+        result[name] = rows
+    return ORJSONResponse(result)
@@ -0,0 +1,264 @@
+from __future__ import annotations
+
+import math
+import os
+from typing import Any
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy import Column, Float, Integer, MetaData, Table, and_, case, func, or_, select
+from sqlmodel import Session
+
+from . import models
+from .database import get_read_session
+from .responses import ORJSONResponse
+from .versions import conditional
+
+# Location queries over the lat/lng of landmarks, poles, junction boxes and
+# components. Candidates come from the spatial index (see models.GEO_TABLES):
+# the R*Tree on SQLite, the GiST index on point(lng, lat) on PostgreSQL. Exact
+# bounds and distances (haversine, metres) are then checked on those rows only.
+GEO_MAX_RESULTS = int(os.getenv("GEO_MAX_RESULTS", "50000"))
+
+EARTH_RADIUS_M = 6_371_008.8
+_M_PER_DEG_LAT = math.pi * EARTH_RADIUS_M / 180
+
+# type name in the API -> (model, columns returned)
+GEO_TYPES: dict[str, tuple[type, list[str]]] = {
+    "landmarks": (models.Landmark, ["id", "code", "name", "lat", "lng", "district_id"]),
+    "poles": (models.Pole, ["id", "code", "location_name", "lat", "lng", "landmark_id", "district_id"]),
+    "junction_boxes": (models.JunctionBox, ["id", "code", "lat", "lng", "pole_id", "landmark_id", "district_id"]),
+    "components": (models.Component,
+                   ["id", "component_code", "component_type", "lat", "lng", "pole_id", "jb_id", "landmark_id", "district_id"]),
+}
+
+# The SQLite R*Trees, for building queries; created by models._create_geo_index, not create_all
+_rtree_metadata = MetaData()
+_RTREES = {
+    table.name: Table(
+        models.geo_index_name(table.name), _rtree_metadata,
+        Column("id", Integer, primary_key=True),
+        Column("min_lat", Float), Column("max_lat", Float), Column("min_lng", Float), Column("max_lng", Float),
+    )
+    for table in models.GEO_TABLES
+}
+
+Box = tuple[float, float, float, float]  # south, west, north, east
+
+
+def haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def circle_boxes(lat: float, lng: float, radius_m: float) -> list[Box]:
+    """Boxes covering every point within `radius_m` of (lat, lng); two when it crosses the antimeridian."""
+    dlat = radius_m / _M_PER_DEG_LAT
+    south, north = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+    if south == -90.0 or north == 90.0:
+        return [(south, -180.0, north, 180.0)]  # a circle around a pole spans every longitude
+    dlng = math.degrees(radius_m / (EARTH_RADIUS_M * math.cos(math.radians(max(abs(south), abs(north))))))
+    if dlng >= 180:
+        return [(south, -180.0, north, 180.0)]
+    return split_box(south, lng - dlng, north, lng + dlng)
+
+
+def split_box(south: float, west: float, north: float, east: float) -> list[Box]:
+    """Normalise longitudes into [-180, 180]; a box crossing the antimeridian becomes two."""
+    if west < -180:
+        return [(south, west + 360, north, 180.0), (south, -180.0, north, east)]
+    if east > 180:
+        return [(south, west, north, 180.0), (south, -180.0, north, east - 360)]
+    if west > east:
+        return [(south, west, north, 180.0), (south, -180.0, north, east)]
+    return [(south, west, north, east)]
+
+
+def _in_boxes(session: Session, model, boxes: list[Box]) -> tuple[Any, list]:
+    """(FROM clause, WHERE conditions) selecting rows of `model` inside any of `boxes`."""
+    dialect = session.get_bind().dialect.name
+    exact = or_(*(and_(model.lat.between(s, n), model.lng.between(w, e)) for s, w, n, e in boxes))
+    source = model.__table__
+    if dialect == "sqlite":
+        # R*Tree bounds are 32-bit floats rounded outwards: overlap test, then `exact`
+        rtree = _RTREES[source.name]
+        source = source.join(rtree, rtree.c.id == model.id)
+        index = or_(*(
+            and_(rtree.c.max_lat >= s, rtree.c.min_lat <= n, rtree.c.max_lng >= w, rtree.c.min_lng <= e)
+            for s, w, n, e in boxes
+        ))
+        return source, [index, exact]
+    if dialect == "postgresql":
+        point = func.point(model.lng, model.lat)
+        index = or_(*(point.op("<@")(func.box(func.point(w, s), func.point(e, n))) for s, w, n, e in boxes))
+        return source, [index, exact]
+    return source, [exact]
+
+
+def _planar_distance(model, lat: float, lng: float):
+    """Squared equirectangular distance to (lat, lng) in degrees of latitude.
+
+    Plain arithmetic, so any dialect can ORDER BY it; longitudes are taken the
+    short way round the antimeridian. Close to haversine order over the small
+    circles this serves; the exact distance is checked afterwards.
+    """
+    dlng = model.lng - lng
+    dlng = case((dlng > 180, dlng - 360), (dlng < -180, dlng + 360), else_=dlng)
+    dlat = model.lat - lat
+    scale = math.cos(math.radians(lat))
+    return dlat * dlat + dlng * dlng * (scale * scale)
+
+
+def in_boxes(
+    session: Session, geo_type: str, boxes: list[Box], limit: int | None = None, near: tuple[float, float] | None = None
+) -> list[dict[str, Any]]:
+    """Rows of a type inside `boxes`; with `near`, the `limit` closest to that point."""
+    model, names = GEO_TYPES[geo_type]
+    source, where = _in_boxes(session, model, boxes)
+    stmt = select(*(getattr(model, n) for n in names)).select_from(source).where(*where)
+    if near is not None:
+        stmt = stmt.order_by(_planar_distance(model, *near), model.id)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return [dict(row._mapping) for row in session.execute(stmt)]
+
+
+def within(
+    session: Session, geo_type: str, lat: float, lng: float, radius_m: float, limit: int | None = None
+) -> tuple[list[dict[str, Any]], bool]:
+    """Rows within `radius_m` of (lat, lng), nearest first, each with its `distance_m`.
+
+    With `limit`, the database ranks the candidates and returns only the
+    closest few beyond `limit`, so a dense area is never loaded whole; the
+    headroom absorbs rows the planar ranking places slightly out of order.
+    The flag is True when more than `limit` rows are in the circle.
+    """
+    fetch = None if limit is None else limit + max(16, limit // 4)
+    candidates = in_boxes(session, geo_type, circle_boxes(lat, lng, radius_m), fetch, near=(lat, lng) if limit else None)
+    rows = []
+    for row in candidates:
+        distance = haversine_m(lat, lng, row["lat"], row["lng"])
+        if distance <= radius_m:
+            row["distance_m"] = round(distance, 1)
+            rows.append(row)
+    rows.sort(key=lambda r: (r["distance_m"], r["id"]))
+    truncated = limit is not None and len(rows) > limit
+    return (rows[:limit] if truncated else rows), truncated
+
+
+def nearest(session: Session, geo_type: str, lat: float, lng: float, k: int, start_radius_m: float = 250.0):
+    """The `k` rows nearest to (lat, lng), nearest first.
+
+    Searches a circle that doubles until it holds `k` rows: everything closer
+    than the circle's radius is inside it, so its k nearest are the answer.
+    """
+    radius = start_radius_m
+    while True:
+        rows, _ = within(session, geo_type, lat, lng, radius, k)
+        if len(rows) >= k or radius >= math.pi * EARTH_RADIUS_M:
+            return rows[:k]
+        radius *= 4 if not rows else 2
+
+
+# -- endpoints --------------------------------------------------------------------
+
+router = APIRouter(prefix="/geo", tags=["Geo"])
+
+
+def _types(types: str | None) -> list[str]:
+    if not types:
+        return list(GEO_TYPES)
+    names = [t.strip() for t in types.split(",") if t.strip()]
+    unknown = [n for n in names if n not in GEO_TYPES]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown type(s): {', '.join(unknown)}; expected {', '.join(GEO_TYPES)}",
+        )
+    return list(dict.fromkeys(names))
+
+
+def _models(names: list[str]) -> list:
+    return [GEO_TYPES[n][0] for n in names]
+
+
+@router.get("/bbox")
+def assets_in_bbox(
+    request: Request,
+    response: Response,
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lng: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lng: float = Query(..., ge=-180, le=180),
+    types: str | None = Query(None, description="Comma-separated: landmarks,poles,junction_boxes,components"),
+    limit: int = Query(5000, ge=1, le=GEO_MAX_RESULTS, description="Per type"),
+    session: Session = Depends(get_read_session),
+):
+    """Assets inside a bounding box; min_lng > max_lng means the box crosses the antimeridian.
+
+    `truncated` lists the types that had more than `limit` rows in the box.
+    """
+    if min_lat > max_lat:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="min_lat is greater than max_lat")
+    names = _types(types)
+    not_modified = conditional(request, response, session, _models(names))
+    if not_modified:
+        return not_modified
+    boxes = split_box(min_lat, min_lng, max_lat, max_lng)
+    body: dict[str, Any] = {}
+    truncated = []
+    for name in names:
+        rows = in_boxes(session, name, boxes, limit + 1)
+        if len(rows) > limit:
+            truncated.append(name)
+            del rows[limit:]
+        body[name] = rows
+    body["truncated"] = truncated
+    return ORJSONResponse(body, headers=dict(response.headers))
+
+
+@router.get("/radius")
+def assets_within_radius(
+    request: Request,
+    response: Response,
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius_m: float = Query(..., gt=0, le=math.pi * EARTH_RADIUS_M),
+    types: str | None = Query(None, description="Comma-separated: landmarks,poles,junction_boxes,components"),
+    limit: int = Query(5000, ge=1, le=GEO_MAX_RESULTS, description="Per type"),
+    session: Session = Depends(get_read_session),
+):
+    """Assets within `radius_m` metres of a point, nearest first, with `distance_m`.
+
+    `truncated` lists the types that had more than `limit` rows in the circle.
+    """
+    names = _types(types)
+    not_modified = conditional(request, response, session, _models(names))
+    if not_modified:
+        return not_modified
+    body: dict[str, Any] = {}
+    truncated = []
+    for name in names:
+        body[name], more = within(session, name, lat, lng, radius_m, limit)
+        if more:
+            truncated.append(name)
+    body["truncated"] = truncated
+    return ORJSONResponse(body, headers=dict(response.headers))
+
+
+@router.get("/nearest")
+def nearest_assets(
+    request: Request,
+    response: Response,
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    k: int = Query(5, ge=1, le=1000),
+    geo_type: str = Query("poles", alias="type", description="landmarks, poles, junction_boxes or components"),
+    session: Session = Depends(get_read_session),
+):
+    """The `k` assets of one type nearest to a point, with `distance_m`."""
+    name = _types(geo_type)[0]
+    not_modified = conditional(request, response, session, _models([name]))
+    if not_modified:
+        return not_modified
+    return ORJSONResponse(nearest(session, name, lat, lng, k), headers=dict(response.headers))
@@ -0,0 +1,437 @@
+from __future__ import annotations
+
+import heapq
+import os
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Iterable
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy import inspect, select
+from sqlmodel import Session
+
+from . import models
+from .database import get_read_session
+from .responses import ORJSONResponse
+from .versions import (
+    APPLY,
+    RELOAD,
+    CommitListener,
+    add_commit_listener,
+    conditional,
+    table_versions,
+    version_step,
+)
+
+# Network topology from Component.connected_to_code: each component points at
+# the one it is connected to (its upstream), so the graph is a forest whose
+# roots are core devices or codes that are not imported yet. It is held in
+# memory as adjacency maps keyed by component_code and kept at the version of
+# the component table it reflects:
+# - commits through this process's sessions that insert, update or delete
+#   Component objects apply their changes in place (no reload);
+# - bulk statements (imports, /bulk) and writes from other worker processes
+#   only show up as a newer table version, and reload the graph on next use.
+TOPOLOGY_MAX_RESULTS = int(os.getenv("TOPOLOGY_MAX_RESULTS", "10000"))
+
+_COMPONENT_TABLE = models.Component.__tablename__
+_GRAPH_COLUMNS = ("component_code", "connected_to_code", "component_type")
+
+
+class TopologyGraph:
+    """Adjacency maps over component codes.
+
+    `up[code]` is the code a component is connected to; `down[code]` the codes
+    connected to it. `nodes[code]` is (id, component_type) for components that
+    exist; a code only referenced through connected_to_code has no entry there.
+    """
+
+    def __init__(self):
+        self.nodes: dict[str, tuple[int, str]] = {}
+        self.up: dict[str, str] = {}
+        self.down: dict[str, set[str]] = {}
+        self.version: int | None = None  # component table version; None = load on next use
+        self.lock = threading.RLock()
+        self.loads = self.incremental_updates = 0
+        self.load_seconds = 0.0
+        self._clusters: list[dict[str, Any]] | None = None
+
+    # -- maintenance --------------------------------------------------------
+
+    def _add(self, code: str, parent: str | None, id: int, component_type: str) -> None:
+        self.nodes[code] = (id, component_type)
+        if parent and parent != code:
+            self.up[code] = parent
+            self.down.setdefault(parent, set()).add(code)
+
+    def _remove(self, code: str) -> None:
+        self.nodes.pop(code, None)
+        parent = self.up.pop(code, None)
+        if parent is not None:
+            children = self.down.get(parent)
+            if children is not None:
+                children.discard(code)
+                if not children:
+                    del self.down[parent]
+
+    def load(self, session) -> None:
+        with self.lock:
+            started = time.perf_counter()
+            # Version first: a write that lands in between makes the next check reload again
+            version = table_versions(session, [models.Component])[_COMPONENT_TABLE]
+            c = models.Component
+            # Core rows off the connection: no ORM row processing for 4 columns x every component
+            rows = session.connection().execute(
+                select(c.id, c.component_code, c.connected_to_code, c.component_type)
+            ).all()
+            nodes = {code: (id, component_type) for id, code, _, component_type in rows}
+            up = {code: parent for _, code, parent, _ in rows if parent and parent != code}
+            down: dict[str, set[str]] = {}
+            for code, parent in up.items():
+                children = down.get(parent)
+                if children is None:
+                    down[parent] = {code}
+                else:
+                    children.add(code)
+            self.nodes, self.up, self.down = nodes, up, down
+            self.version = version
+            self._clusters = None
+            self.loads += 1
+            self.load_seconds = time.perf_counter() - started
+
+    def apply(self, changes: list[tuple[str | None, tuple | None]], version: int) -> None:
+        """Apply one committed transaction's (old code, new node) changes that moved the table to `version`."""
+        with self.lock:
+            step = version_step(self.version, version)
+            if step == RELOAD:
+                self.version = None
+            if step != APPLY:
+                return
+            for old_code, node in changes:
+                if old_code is not None:
+                    self._remove(old_code)
+                if node is not None:
+                    self._add(*node)
+            self.version = version
+            if changes:
+                self._clusters = None
+            self.incremental_updates += 1
+
+    def invalidate(self) -> None:
+        with self.lock:
+            self.version = None
+
+    # -- queries ------------------------------------------------------------
+
+    def node(self, code: str, **extra) -> dict[str, Any]:
+        id, component_type = self.nodes.get(code, (None, None))
+        return {"code": code, "id": id, "component_type": component_type, **extra}
+
+    def knows(self, code: str) -> bool:
+        return code in self.nodes or code in self.down
+
+    def upstream(self, code: str, max_depth: int | None = None) -> tuple[list[str], bool]:
+        """Codes from `code`'s parent to its root, and whether the chain loops back on itself."""
+        chain: list[str] = []
+        seen = {code}
+        current = code
+        while current in self.up and (max_depth is None or len(chain) < max_depth):
+            current = self.up[current]
+            if current in seen:
+                return chain, True
+            seen.add(current)
+            chain.append(current)
+        return chain, False
+
+    def downstream(self, codes: Iterable[str], max_depth: int | None = None) -> dict[str, int]:
+        """Everything connected below `codes` (breadth first), code -> depth; `codes` themselves excluded."""
+        start = set(codes)
+        depth = {c: 0 for c in start}
+        queue = deque(start)
+        while queue:
+            code = queue.popleft()
+            d = depth[code]
+            if max_depth is not None and d >= max_depth:
+                continue
+            for child in self.down.get(code, ()):
+                if child not in depth:
+                    depth[child] = d + 1
+                    queue.append(child)
+        return {c: d for c, d in depth.items() if c not in start}
+
+    def _neighbours(self, code: str) -> Iterable[str]:
+        parent = self.up.get(code)
+        if parent is not None:
+            yield parent
+        yield from self.down.get(code, ())
+
+    def shortest_path(self, source: str, target: str) -> list[str] | None:
+        """Fewest-links path between two codes, links followed in either direction.
+
+        Searches from both ends and expands the smaller frontier each round.
+        """
+        if source == target:
+            return [source]
+        parents = {source: None}
+        children = {target: None}
+        front, back = [source], [target]
+        while front and back:
+            if len(front) > len(back):
+                front, back, parents, children = back, front, children, parents
+            next_front = []
+            for code in front:
+                for n in self._neighbours(code):
+                    if n in parents:
+                        continue
+                    parents[n] = code
+                    if n in children:
+                        left, right = [], []
+                        c = n
+                        while c is not None:
+                            left.append(c)
+                            c = parents[c]
+                        c = children[n]
+                        while c is not None:
+                            right.append(c)
+                            c = children[c]
+                        path = left[::-1] + right
+                        return path if path[0] == source else path[::-1]
+                    next_front.append(n)
+            front = next_front
+        return None
+
+    def clusters(self) -> list[dict[str, Any]]:
+        """Connected groups (links in either direction), largest first, as size, root codes and
+        component types; computed once per change to the graph."""
+        if self._clusters is None:
+            seen: set[str] = set()
+            found = []
+            for start in [*self.nodes, *self.down]:
+                if start in seen:
+                    continue
+                seen.add(start)
+                members, queue = [], [start]
+                while queue:
+                    code = queue.pop()
+                    members.append(code)
+                    for n in self._neighbours(code):
+                        if n not in seen:
+                            seen.add(n)
+                            queue.append(n)
+                found.append({
+                    "size": len(members),
+                    "roots": sorted(code for code in members if code not in self.up),
+                    "types": dict(Counter(self.nodes[c][1] for c in members if c in self.nodes)),
+                })
+            found.sort(key=lambda g: g["size"], reverse=True)
+            self._clusters = found
+        return self._clusters
+
+    def nearest(self, depths: dict[str, int], limit: int) -> list[str]:
+        """Up to `limit` codes of a traversal result, shallowest first, then by code."""
+        return heapq.nsmallest(limit, depths, key=lambda c: (depths[c], c))
+
+    def stats(self) -> dict[str, Any]:
+        with self.lock:
+            return {
+                "components": len(self.nodes),
+                "links": len(self.up),
+                "unknown_targets": sum(1 for code in self.down if code not in self.nodes),
+                "version": self.version,
+                "loads": self.loads,
+                "last_load_ms": round(self.load_seconds * 1000, 1),
+                "incremental_updates": self.incremental_updates,
+            }
+
+
+topology = TopologyGraph()
+
+
+def topology_graph(session) -> TopologyGraph:
+    """The graph, reloaded first if the component table has changed since it was built."""
+    version = table_versions(session, [models.Component])[_COMPONENT_TABLE]
+    with topology.lock:
+        if topology.version != version:
+            topology.load(session)
+    return topology
+
+
+# -- keeping the graph current ------------------------------------------------
+
+def _graph_node(obj) -> tuple:
+    return obj.component_code, obj.connected_to_code, obj.id, obj.component_type
+
+
+class _GraphChanges(CommitListener):
+    tables = frozenset({_COMPONENT_TABLE})
+
+    def flushed(self, session, changes: dict) -> None:
+        graph_changes = changes.setdefault(_COMPONENT_TABLE, [])
+        for obj in session.new:
+            if isinstance(obj, models.Component):
+                graph_changes.append((None, _graph_node(obj)))
+        for obj in session.dirty:
+            if isinstance(obj, models.Component):
+                state = inspect(obj)
+                if any(state.attrs[name].history.has_changes() for name in _GRAPH_COLUMNS):
+                    old = state.attrs.component_code.history.deleted
+                    graph_changes.append((old[0] if old else obj.component_code, _graph_node(obj)))
+        for obj in session.deleted:
+            if isinstance(obj, models.Component):
+                old = inspect(obj).attrs.component_code.history.deleted
+                graph_changes.append((old[0] if old else obj.component_code, None))
+
+    def committed(self, changes: dict, unknown: set[str], versions: dict[str, int]) -> None:
+        if unknown:
+            topology.invalidate()
+        else:
+            topology.apply(changes.get(_COMPONENT_TABLE, []), versions[_COMPONENT_TABLE])
+
+
+add_commit_listener(_GraphChanges())
+
+
+# -- endpoints --------------------------------------------------------------------
+
+router = APIRouter(prefix="/topology", tags=["Topology"])
+
+
+def _known(graph: TopologyGraph, code: str) -> None:
+    if not graph.knows(code):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Unknown component code: {code}")
+
+
+def _codes(codes: str) -> list[str]:
+    names = list(dict.fromkeys(c.strip() for c in codes.split(",") if c.strip()))
+    if not names:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No component codes given")
+    return names
+
+
+@router.get("/stats")
+def topology_stats(session: Session = Depends(get_read_session)):
+    """Size of the graph and how it has been kept current."""
+    return topology_graph(session).stats()
+
+
+@router.get("/path")
+def shortest_path(
+    request: Request,
+    response: Response,
+    source: str = Query(..., alias="from"),
+    target: str = Query(..., alias="to"),
+    session: Session = Depends(get_read_session),
+):
+    """Fewest-links path between two components, following links in either direction."""
+    not_modified = conditional(request, response, session, [models.Component])
+    if not_modified:
+        return not_modified
+    graph = topology_graph(session)
+    with graph.lock:
+        _known(graph, source)
+        _known(graph, target)
+        path = graph.shortest_path(source, target)
+        if path is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"{source} and {target} are not connected")
+        body = {"hops": len(path) - 1, "path": [graph.node(code) for code in path]}
+    return ORJSONResponse(body, headers=dict(response.headers))
+
+
+@router.get("/clusters")
+def connected_components(
+    request: Request,
+    response: Response,
+    min_size: int = Query(1, ge=1),
+    limit: int = Query(100, ge=1, le=TOPOLOGY_MAX_RESULTS),
+    session: Session = Depends(get_read_session),
+):
+    """Connected groups of components, largest first, with their root codes."""
+    not_modified = conditional(request, response, session, [models.Component])
+    if not_modified:
+        return not_modified
+    graph = topology_graph(session)
+    with graph.lock:
+        groups = [g for g in graph.clusters() if g["size"] >= min_size]
+        body = {"total": len(groups), "clusters": groups[:limit]}
+    return ORJSONResponse(body, headers=dict(response.headers))
+
+
+@router.get("/impact")
+def failure_impact(
+    request: Request,
+    response: Response,
+    codes: str = Query(..., description="Comma-separated component codes assumed to have failed"),
+    limit: int = Query(1000, ge=0, le=TOPOLOGY_MAX_RESULTS),
+    session: Session = Depends(get_read_session),
+):
+    """Components cut off when the given components fail: everything connected through them."""
+    failed = _codes(codes)
+    not_modified = conditional(request, response, session, [models.Component])
+    if not_modified:
+        return not_modified
+    graph = topology_graph(session)
+    with graph.lock:
+        for code in failed:
+            _known(graph, code)
+        affected = graph.downstream(failed)
+        body = {
+            "failed": [graph.node(code) for code in failed],
+            "affected_count": len(affected),
+            "affected_by_type": dict(Counter(graph.nodes[c][1] for c in affected if c in graph.nodes)),
+            "affected": [
+                graph.node(c, depth=affected[c], connected_to=graph.up.get(c)) for c in graph.nearest(affected, limit)
+            ],
+        }
+    return ORJSONResponse(body, headers=dict(response.headers))
+
+
+@router.get("/{code}/upstream")
+def upstream(
+    code: str,
+    request: Request,
+    response: Response,
+    max_depth: int | None = Query(None, ge=1),
+    session: Session = Depends(get_read_session),
+):
+    """The chain of components from `code` up to its root, nearest first."""
+    not_modified = conditional(request, response, session, [models.Component])
+    if not_modified:
+        return not_modified
+    graph = topology_graph(session)
+    with graph.lock:
+        _known(graph, code)
+        chain, cycle = graph.upstream(code, max_depth)
+        body = {
+            "component": graph.node(code),
+            "upstream": [graph.node(c, depth=i + 1) for i, c in enumerate(chain)],
+            "cycle": cycle,
+        }
+    return ORJSONResponse(body, headers=dict(response.headers))
+
+
+@router.get("/{code}/downstream")
+def downstream(
+    code: str,
+    request: Request,
+    response: Response,
+    max_depth: int | None = Query(None, ge=1),
+    limit: int = Query(1000, ge=0, le=TOPOLOGY_MAX_RESULTS),
+    session: Session = Depends(get_read_session),
+):
+    """Everything connected below `code`, breadth first, with its depth and the code it connects to."""
+    not_modified = conditional(request, response, session, [models.Component])
+    if not_modified:
+        return not_modified
+    graph = topology_graph(session)
+    with graph.lock:
+        _known(graph, code)
+        below = graph.downstream([code], max_depth)
+        body = {
+            "component": graph.node(code),
+            "total": len(below),
+            "downstream": [
+                graph.node(c, depth=below[c], connected_to=graph.up.get(c)) for c in graph.nearest(below, limit)
+            ],
+        }
+    return ORJSONResponse(body, headers=dict(response.headers))
@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import hashlib
+import itertools
+from typing import Callable, Iterable, Type
+
+from fastapi import Request, Response, status
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import SQLModel
+
+from .dialects import supports_upsert, upsert_stmt
+from .models import TableVersion
+
+_CHANGED = "changed_tables"
+_PENDING = "commit_listener_changes"
+_NEW_VERSIONS = "committed_versions"
+_VERSION_TABLE = TableVersion.__tablename__
+
+# What a cache at one table version does with a commit that moved the table on
+SKIP = "skip"  # not loaded yet, or reloaded since: it already reflects the commit
+APPLY = "apply"  # the commit is the next version: apply its rows in place
+RELOAD = "reload"  # another process wrote in between: its rows are unknown here
+
+
+def version_step(known: int | None, version: int) -> str:
+    """SKIP, APPLY or RELOAD for a cache at `known` and a commit that produced `version`."""
+    if known is None or version <= known:
+        return SKIP
+    return APPLY if version == known + 1 else RELOAD
+
+
+class CommitListener:
+    """Keeps a process-local cache of some tables current from this process's commits.
+
+    This module runs the session events for every listener: `flushed` and
+    `bulk` record what a transaction wrote into its own `changes` dict, and
+    once the commit has bumped the table versions `committed` receives that
+    dict with the new versions of each of `tables` it wrote. Changes of
+    rolled-back transactions are dropped. Writes from other processes only
+    show up as versions more than one step ahead (see version_step).
+    """
+
+    tables: frozenset[str] = frozenset()
+
+    def flushed(self, session, changes: dict) -> None:
+        """Record the rows of `tables` a flush wrote (session.new, dirty and deleted)."""
+
+    def bulk(self, orm_execute_state, table: str, changes: dict) -> bool:
+        """Record the rows a bulk statement on `table` wrote; False if they are unknown."""
+        return False
+
+    def committed(self, changes: dict, unknown: set[str], versions: dict[str, int]) -> None:
+        """Take a commit. `unknown` lists tables bulk statements wrote without a record of their rows."""
+
+
+_commit_listeners: list[CommitListener] = []
+
+
+def add_commit_listener(listener: CommitListener) -> None:
+    _commit_listeners.append(listener)
+
+
+def _pending(session, listener: CommitListener) -> tuple[dict, set[str]]:
+    return session.info.setdefault(_PENDING, {}).setdefault(listener, ({}, set()))
+
+
+def _mark(session, table_name: str) -> None:
+    if table_name != _VERSION_TABLE:
+        session.info.setdefault(_CHANGED, set()).add(table_name)
+
+
+@event.listens_for(OrmSession, "after_flush")
+def _collect_flushed(session, flush_context):
+    tables = set()
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        table = getattr(obj, "__table__", None)
+        if table is not None:
+            _mark(session, table.name)
+            tables.add(table.name)
+    for listener in _commit_listeners:
+        if not listener.tables.isdisjoint(tables):
+            listener.flushed(session, _pending(session, listener)[0])
+
+
+@event.listens_for(OrmSession, "do_orm_execute")
+def _collect_bulk(orm_execute_state):
+    # Bulk INSERT/UPDATE/DELETE statements bypass the unit of work
+    if orm_execute_state.is_select:
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None:
+        return
+    table = mapper.local_table.name
+    _mark(orm_execute_state.session, table)
+    for listener in _commit_listeners:
+        if table in listener.tables:
+            changes, unknown = _pending(orm_execute_state.session, listener)
+            if not listener.bulk(orm_execute_state, table, changes):
+                unknown.add(table)
+
+
+def _bump(conn, tables: list[str]) -> None:
+    if supports_upsert(conn.dialect.name):
+        stmt = upsert_stmt(
+            conn.dialect.name, TableVersion, ["table_name"],
+            set_={"version": TableVersion.version + 1},
+        )
+        conn.execute(stmt, [{"table_name": t, "version": 1} for t in tables])
+        return
+    result = conn.execute(
+        update(TableVersion)
+        .where(TableVersion.table_name.in_(tables))
+        .values(version=TableVersion.version + 1)
+    )
+    if result.rowcount < len(tables):
+        known = set(conn.execute(
+            select(TableVersion.table_name).where(TableVersion.table_name.in_(tables))
+        ).scalars())
+        conn.execute(insert(TableVersion), [{"table_name": t, "version": 1} for t in tables if t not in known])
+
+
+@event.listens_for(OrmSession, "before_commit")
+def _bump_versions(session):
+    # Flush now so rows written by this commit are counted before we bump
+    session.flush()
+    tables = sorted(session.info.get(_CHANGED, ()))
+    if not tables:
+        return
+    conn = session.connection()
+    _bump(conn, tables)
+    # Versions this commit produced, for the commit listeners of those tables
+    watched = [t for t in tables if any(t in listener.tables for listener in _commit_listeners)]
+    if watched:
+        session.info[_NEW_VERSIONS] = dict(conn.execute(
+            select(TableVersion.table_name, TableVersion.version).where(TableVersion.table_name.in_(watched))
+        ).all())
+
+
+_change_listeners: list[Callable[[set[str]], None]] = []
+
+
+def add_change_listener(listener: Callable[[set[str]], None]) -> None:
+    """Call `listener(table_names)` once a transaction that wrote those tables ends.
+
+    It runs after commit and also after rollback: rows a rolled-back flush
+    created (and their ids) were visible to this process but no longer exist.
+    Listeners must not touch the database.
+    """
+    _change_listeners.append(listener)
+
+
+def _notify(session) -> None:
+    tables = session.info.pop(_CHANGED, None)
+    if tables:
+        for listener in _change_listeners:
+            listener(tables)
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _committed(session):
+    pending = session.info.pop(_PENDING, {})
+    versions = session.info.pop(_NEW_VERSIONS, {})
+    for listener in _commit_listeners:
+        written = {t: v for t, v in versions.items() if t in listener.tables}
+        if written:
+            changes, unknown = pending.get(listener, ({}, set()))
+            listener.committed(changes, unknown, written)
+    _notify(session)
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def _rolled_back(session):
+    session.info.pop(_PENDING, None)
+    session.info.pop(_NEW_VERSIONS, None)
+    _notify(session)
+
+
+def _table_names(models: Iterable[Type[SQLModel]]) -> list[str]:
+    return sorted(m.__tablename__ for m in models)
+
+
+def table_versions(session, models: Iterable[Type[SQLModel]]) -> dict[str, int]:
+    names = _table_names(models)
+    found = dict(session.execute(
+        select(TableVersion.table_name, TableVersion.version).where(TableVersion.table_name.in_(names))
+    ).all())
+    return {n: found.get(n, 0) for n in names}
+
+
+def make_etag(versions: dict[str, int], *parts: object) -> str:
+    raw = "|".join([*(f"{k}:{v}" for k, v in sorted(versions.items())), *map(str, parts)])
+    return 'W/"%s"' % hashlib.sha1(raw.encode()).hexdigest()[:20]
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = {c.strip() for c in header.split(",")}
+    # Weak comparison: W/"x" and "x" are equivalent for If-None-Match
+    return "*" in candidates or etag in candidates or etag[2:] in candidates
+
+
+def conditional(
+    request: Request,
+    response: Response,
+    session,
+    models: Iterable[Type[SQLModel]],
+    *parts: object,
+) -> Response | None:
+    """ETag check for a read endpoint.
+
+    Returns a 304 response when the client's copy is current; otherwise sets
+    the ETag on `response` and returns None so the handler builds the body.
+    Only the version table is queried, never the rows themselves. List
+    endpoints answer the same URL as JSON or NDJSON by `Accept`, so the
+    negotiated media type is part of the tag and caches are told to vary on it.
+    """
+    from .responses import NDJSON_MEDIA_TYPE, wants_ndjson  # responses imports database, which imports this module
+
+    media_type = NDJSON_MEDIA_TYPE if wants_ndjson(request) else "application/json"
+    etag = make_etag(table_versions(session, models), request.url.path, request.url.query, media_type, *parts)
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept"}
+    if _etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+async def conditional_async(
+    request: Request,
+    response: Response,
+    session,
+    models: Iterable[Type[SQLModel]],
+    *parts: object,
+) -> Response | None:
+    """`conditional` for an AsyncSession."""
+    return await session.run_sync(lambda s: conditional(request, response, s, models, *parts))
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import os
+from datetime import datetime, timedelta
+from typing import Iterable
+
+from sqlalchemy import delete, func, or_, select
+from sqlmodel import Session
+
+from . import models
+from .database import engine
+
+# Raw workbook retention; 0 disables the rule. Applied after every raw upload
+# and by POST /excel/workbooks/prune.
+WORKBOOK_KEEP_VERSIONS = int(os.getenv("WORKBOOK_KEEP_VERSIONS", "0"))
+WORKBOOK_MAX_AGE_DAYS = int(os.getenv("WORKBOOK_MAX_AGE_DAYS", "0"))
+VACUUM_STEP_PAGES = int(os.getenv("VACUUM_STEP_PAGES", "512"))
+
+
+def delete_workbooks(session: Session, workbook_ids: Iterable[int]) -> dict[str, int]:
+    """Delete workbooks with their sheets and rows: three set-based DELETEs, no ORM loads.
+
+    The caller commits.
+    """
+    ids = list(workbook_ids)
+    if not ids:
+        return {"workbooks": 0, "sheets": 0, "rows": 0}
+    sheet_ids = select(models.ExcelSheet.id).where(models.ExcelSheet.workbook_id.in_(ids))
+    opts = {"synchronize_session": False}
+    rows = session.execute(delete(models.ExcelRow).where(models.ExcelRow.sheet_id.in_(sheet_ids)), execution_options=opts)
+    sheets = session.execute(delete(models.ExcelSheet).where(models.ExcelSheet.workbook_id.in_(ids)), execution_options=opts)
+    books = session.execute(delete(models.ExcelWorkbook).where(models.ExcelWorkbook.id.in_(ids)), execution_options=opts)
+    return {"workbooks": books.rowcount, "sheets": sheets.rowcount, "rows": rows.rowcount}
+
+
+def expired_workbooks(
+    session: Session,
+    keep_versions: int = WORKBOOK_KEEP_VERSIONS,
+    max_age_days: int = WORKBOOK_MAX_AGE_DAYS,
+    filename: str | None = None,
+) -> list[int]:
+    """Ids outside the retention policy: beyond the newest `keep_versions` per filename, or older than `max_age_days`.
+
+    The newest version of a filename is always kept, whatever its age.
+    """
+    wb = models.ExcelWorkbook
+    rank = func.row_number().over(partition_by=wb.filename, order_by=(wb.imported_at.desc(), wb.id.desc()))
+    ranked = select(wb.id, wb.imported_at, rank.label("rank"))
+    if filename is not None:
+        ranked = ranked.where(wb.filename == filename)
+    ranked = ranked.subquery()
+
+    rules = []
+    if keep_versions > 0:
+        rules.append(ranked.c.rank > keep_versions)
+    if max_age_days > 0:
+        cutoff = (datetime.utcnow() - timedelta(days=max_age_days)).replace(microsecond=0).isoformat()
+        # imported_at is an ISO string, so string order is time order
+        rules.append((ranked.c.imported_at < cutoff) & (ranked.c.rank > 1))
+    if not rules:
+        return []
+    return list(session.execute(select(ranked.c.id).where(or_(*rules)).order_by(ranked.c.id)).scalars())
+
+
+def reclaim_space(step_pages: int = VACUUM_STEP_PAGES, max_steps: int | None = None) -> dict[str, int]:
+    """Return free SQLite pages to the filesystem a few at a time.
+
+    Each `PRAGMA incremental_vacuum(step_pages)` is its own short write
+    transaction; readers keep reading in WAL mode, and other writers get the
+    write connection between steps. Does nothing unless the database uses
+    auto_vacuum=INCREMENTAL (new databases do; an existing one needs a single
+    `VACUUM` after `PRAGMA auto_vacuum=INCREMENTAL`). Freed pages that are not
+    reclaimed are reused by later imports anyway.
+    """
+    if engine.dialect.name != "sqlite":
+        return {"freed_pages": 0, "free_pages": 0}  # PostgreSQL: autovacuum
+    with engine.connect() as conn:
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:  # 2 = INCREMENTAL
+            return {"freed_pages": 0, "free_pages": conn.exec_driver_sql("PRAGMA freelist_count").scalar()}
+    freed = steps = 0
+    while max_steps is None or steps < max_steps:
+        with engine.connect() as conn:
+            before = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+            if not before:
+                break
+            # sqlite3's execute() steps this PRAGMA once, freeing a single page;
+            # executescript() runs it to completion
+            conn.connection.driver_connection.executescript(f"PRAGMA incremental_vacuum({int(step_pages)});")
+            after = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+        freed += before - after
+        steps += 1
+        if after >= before:
+            break
+    with engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+        remaining = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+    return {"freed_pages": freed, "free_pages": remaining}
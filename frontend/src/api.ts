@@ -9,6 +9,12 @@ export type EntityName =
   | "components"
   | "credentials";
 
+// Writes, imports and searches are audited server-side under the token's user
+function authHeader(): Record<string, string> {
+  const token = localStorage.getItem("token");
+  return token ? { Authorization: `Bearer ${token}` } : {};
+}
+
 export async function fetchEntities(entity: EntityName, offset: number = 0, limitOverride?: number) {
   const limit = limitOverride ?? (entity === "components" ? 200 : 500);
   const res = await fetch(
@@ -18,10 +24,16 @@ export async function fetchEntities(entity: EntityName, offset: number = 0, limi
   return res.json();
 }
 
+export async function fetchStats() {
+  const res = await fetch(`${BASE_URL}/stats`);
+  if (!res.ok) throw new Error("Failed to fetch stats");
+  return res.json();
+}
+
 export async function createEntity(entity: EntityName, payload: unknown) {
   const res = await fetch(`${BASE_URL}/${entity}/`, {
     method: "POST",
-    headers: { "Content-Type": "application/json" },
+    headers: { "Content-Type": "application/json", ...authHeader() },
     body: JSON.stringify(payload),
   });
   if (!res.ok) throw new Error(`Create failed: ${entity}`);
@@ -57,7 +69,7 @@ export async function patchEntity(entity: EntityName, id: number, payload: Recor
 }
 
 export async function deleteEntity(entity: EntityName, id: number) {
-  const res = await fetch(`${BASE_URL}/${entity}/${id}`, { method: "DELETE" });
+  const res = await fetch(`${BASE_URL}/${entity}/${id}`, { method: "DELETE", headers: authHeader() });
   if (!res.ok) throw new Error(`Delete failed: ${entity} ${id}`);
   return true;
 }
@@ -65,7 +77,7 @@ export async function deleteEntity(entity: EntityName, id: number) {
 export async function importEnum1(filePath: string, sheetName?: string) {
   const res = await fetch(`${BASE_URL}/import/enum1`, {
     method: "POST",
-    headers: { "Content-Type": "application/json" },
+    headers: { "Content-Type": "application/json", ...authHeader() },
     body: JSON.stringify({ file_path: filePath, sheet_name: sheetName ?? "Enum-1" }),
   });
   if (!res.ok) throw new Error("Enum-1 import failed");
@@ -75,7 +87,7 @@ export async function importEnum1(filePath: string, sheetName?: string) {
 export async function importIpSchemaPoles(filePath: string, sheetName?: string) {
   const res = await fetch(`${BASE_URL}/import/ip-schema/poles`, {
     method: "POST",
-    headers: { "Content-Type": "application/json" },
+    headers: { "Content-Type": "application/json", ...authHeader() },
     body: JSON.stringify({ file_path: filePath, sheet_name: sheetName }),
   });
   if (!res.ok) throw new Error("IP schema poles import failed");
@@ -85,7 +97,7 @@ export async function importIpSchemaPoles(filePath: string, sheetName?: string)
 export async function importIpSchemaJbs(filePath: string, sheetName?: string) {
   const res = await fetch(`${BASE_URL}/import/ip-schema/jbs`, {
     method: "POST",
-    headers: { "Content-Type": "application/json" },
+    headers: { "Content-Type": "application/json", ...authHeader() },
     body: JSON.stringify({ file_path: filePath, sheet_name: sheetName }),
   });
   if (!res.ok) throw new Error("IP schema JB import failed");
@@ -95,7 +107,7 @@ export async function importIpSchemaJbs(filePath: string, sheetName?: string) {
 export async function importCredentials(filePath: string, sheetName?: string) {
   const res = await fetch(`${BASE_URL}/import/credentials`, {
     method: "POST",
-    headers: { "Content-Type": "application/json" },
+    headers: { "Content-Type": "application/json", ...authHeader() },
     body: JSON.stringify({ file_path: filePath, sheet_name: sheetName }),
   });
   if (!res.ok) throw new Error("Credentials import failed");
@@ -113,7 +125,7 @@ export async function importAll(payload: {
 }) {
   const res = await fetch(`${BASE_URL}/import/all`, {
     method: "POST",
-    headers: { "Content-Type": "application/json" },
+    headers: { "Content-Type": "application/json", ...authHeader() },
     body: JSON.stringify(payload),
   });
   if (!res.ok) throw new Error("Import all failed");
@@ -123,7 +135,7 @@ export async function importAll(payload: {
 export async function importAuto() {
   const res = await fetch(`${BASE_URL}/import/auto`, {
     method: "POST",
-    headers: { "Content-Type": "application/json" },
+    headers: { "Content-Type": "application/json", ...authHeader() },
   });
   if (!res.ok) throw new Error("Auto import failed");
   return res.json();
@@ -243,14 +255,18 @@ export async function createAuditLog(payload: {
 
 // Global search function
 export async function globalSearch(query: string, limit: number = 100) {
-  const res = await fetch(`${BASE_URL}/search/global?q=${encodeURIComponent(query)}&limit=${limit}`);
+  const res = await fetch(`${BASE_URL}/search/global?q=${encodeURIComponent(query)}&limit=${limit}`, {
+    headers: authHeader(),
+  });
   if (!res.ok) throw new Error("Search failed");
   return res.json();
 }
 
 // Search for a specific value across all Excel workbooks and sheets
 export async function searchExcelByValue(query: string) {
-  const res = await fetch(`${BASE_URL}/search/excel-by-value?q=${encodeURIComponent(query)}`);
+  const res = await fetch(`${BASE_URL}/search/excel-by-value?q=${encodeURIComponent(query)}`, {
+    headers: authHeader(),
+  });
   if (!res.ok) throw new Error("Excel search failed");
   return res.json();
 }
@@ -280,6 +296,7 @@ export async function uploadAndImport(
   
   const res = await fetch(`${BASE_URL}/import/upload-and-import`, {
     method: "POST",
+    headers: authHeader(),
     body: formData,
   });
   if (!res.ok) {
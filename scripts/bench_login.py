@@ -0,0 +1,150 @@
+"""Login throughput, and latency of other endpoints while logins run.
+
+Usage: python scripts/bench_login.py [--executors process,thread] [--seconds 10] [--logins 16]
+
+For each password executor a uvicorn server is started on a fresh SQLite
+file, users are registered, then `--logins` clients log in back to back
+while one probe client calls /health (a sync handler, so it needs a
+threadpool slot) and /regions (async) at a steady rate. Needs httpx.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _pct(values: list[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] * 1000
+
+
+async def _load(base: str, seconds: float, logins: int, users: int, probe_interval: float) -> dict:
+    async with httpx.AsyncClient(base_url=base, timeout=60) as client:
+        for i in range(users):
+            await client.post("/auth/register", json={"username": f"bench{i}", "password": f"pw-{i}"})
+        r = await client.post("/auth/login", json={"username": "bench0", "password": "pw-0"})
+        headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+        async def probe(path: str, **kw) -> list[float]:
+            out = []
+            while time.perf_counter() < deadline:
+                t0 = time.perf_counter()
+                (await client.get(path, **kw)).raise_for_status()
+                out.append(time.perf_counter() - t0)
+                await asyncio.sleep(probe_interval)
+            return out
+
+        baseline_end = time.perf_counter() + min(2.0, seconds / 4)
+        deadline = baseline_end
+        idle = await probe("/health")
+
+        login_times: list[float] = []
+        failures = [0]
+
+        async def login_client(n: int) -> None:
+            i = n
+            while time.perf_counter() < deadline:
+                user = i % users
+                t0 = time.perf_counter()
+                r = await client.post("/auth/login", json={"username": f"bench{user}", "password": f"pw-{user}"})
+                if r.status_code == 200:
+                    login_times.append(time.perf_counter() - t0)
+                else:
+                    failures[0] += 1
+                i += logins
+
+        start = time.perf_counter()
+        deadline = start + seconds
+        results = await asyncio.gather(
+            probe("/health"),
+            probe("/regions", headers=headers),
+            *(login_client(n) for n in range(logins)),
+        )
+        elapsed = time.perf_counter() - start
+    health, regions = results[0], results[1]
+    return {
+        "logins_per_s": len(login_times) / elapsed,
+        "login_p50": _pct(login_times, 0.5),
+        "login_p99": _pct(login_times, 0.99),
+        "idle_health_p99": _pct(idle, 0.99),
+        "health_p50": _pct(health, 0.5),
+        "health_p99": _pct(health, 0.99),
+        "regions_p99": _pct(regions, 0.99),
+        "failures": failures[0],
+    }
+
+
+def run_executor(executor: str, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        port = _free_port()
+        env = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite:///{tmp}/bench.db",
+            PASSWORD_HASH_EXECUTOR=executor,
+            PASSWORD_HASH_ROUNDS=str(args.rounds),
+        )
+        env.pop("ASYNC_DATABASE_URL", None)
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=ROOT, env=env,
+        )
+        base = f"http://127.0.0.1:{port}"
+        try:
+            for _ in range(100):
+                try:
+                    httpx.get(f"{base}/health", timeout=1)
+                    break
+                except httpx.TransportError:
+                    time.sleep(0.1)
+            return asyncio.run(_load(base, args.seconds, args.logins, args.users, args.probe_interval))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--executors", default="process,thread")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--logins", type=int, default=16, help="concurrent login clients")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=int(os.getenv("PASSWORD_HASH_ROUNDS", "29000")))
+    parser.add_argument("--probe-interval", type=float, default=0.02)
+    args = parser.parse_args()
+
+    print(f"cpus={os.cpu_count()} rounds={args.rounds} login clients={args.logins}")
+    print(
+        f"{'executor':<10}{'logins/s':>10}{'login p50':>11}{'login p99':>11}"
+        f"{'idle /health p99':>18}{'/health p50':>13}{'/health p99':>13}{'/regions p99':>14}{'fail':>6}"
+    )
+    for executor in args.executors.split(","):
+        r = run_executor(executor.strip(), args)
+        print(
+            f"{executor:<10}{r['logins_per_s']:>10.1f}{r['login_p50']:>11.1f}{r['login_p99']:>11.1f}"
+            f"{r['idle_health_p99']:>18.1f}{r['health_p50']:>13.1f}{r['health_p99']:>13.1f}"
+            f"{r['regions_p99']:>14.1f}{r['failures']:>6}"
+        )
+    print("latencies in ms")
+
+
+if __name__ == "__main__":
+    main()
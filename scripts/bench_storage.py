@@ -0,0 +1,219 @@
+"""Read and write latency, throughput and lock errors while imports and edits run.
+
+Usage: python scripts/bench_storage.py [--setups original,legacy,balanced,fast] [--seconds 10]
+
+For each setup a fresh SQLite file is seeded with components. Three loads
+then run at the same time:
+- importer processes each commit batches of inserts, like imports running
+  in other workers;
+- editor threads in this process load a row and commit a change to it on
+  the write engine, like PATCH /components/{id};
+- reader threads page through /components-style queries and count a
+  filtered set.
+
+`original` is the engine this app used before storage profiles: one pool
+shared by reads and writes, rollback journal, and only the driver's 5 s
+lock wait. The other setups are STORAGE_PROFILES on the split read/write
+engines. A "lock error" is an OperationalError such as "database is locked"
+after the setup's wait ran out; the operation is lost and a client would
+see a 500.
+"""
+from __future__ import annotations
+
+import argparse
+import multiprocessing as mp
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import func  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from sqlmodel import Session, SQLModel, create_engine, select  # noqa: E402
+
+from app import models  # noqa: E402
+from app.database import STORAGE_PROFILES, get_engine  # noqa: E402
+
+
+def _engines(url: str, setup: str):
+    """(write engine, read engine) for a setup."""
+    if setup == "original":
+        engine = create_engine(url, connect_args={"check_same_thread": False}, echo=False)
+        return engine, engine
+    return get_engine(url, profile=setup), get_engine(url, profile=setup, read_only=True)
+
+
+def _seed(engine, n: int) -> None:
+    with Session(engine) as s:
+        s.add_all(
+            models.Component(component_code=f"SEED-{i}", component_type="CAMERA" if i % 3 else "SWITCH")
+            for i in range(n)
+        )
+        s.commit()
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    return values[min(len(values) - 1, int(len(values) * q))] * 1000
+
+
+def _importer(url: str, setup: str, worker: int, batch: int, stop, written, errors, slowest) -> None:
+    engine, _ = _engines(url, setup)
+    i = 0
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        try:
+            with Session(engine) as s:
+                s.add_all(
+                    models.Component(component_code=f"IMP-{worker}-{i}-{j}", component_type="SWITCH")
+                    for j in range(batch)
+                )
+                s.commit()
+            with written.get_lock():
+                written.value += batch
+        except OperationalError:
+            with errors.get_lock():
+                errors.value += 1
+        with slowest.get_lock():
+            slowest.value = max(slowest.value, time.perf_counter() - t0)
+        i += 1
+    engine.dispose()
+
+
+class _Samples:
+    """Latencies and lock errors from a group of threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies: list[float] = []
+        self.errors = 0
+
+    def merge(self, latencies: list[float], errors: int) -> None:
+        with self.lock:
+            self.latencies.extend(latencies)
+            self.errors += errors
+
+    def summary(self, seconds: float) -> dict:
+        self.latencies.sort()
+        return {
+            "per_s": len(self.latencies) / seconds,
+            "p50_ms": _percentile(self.latencies, 0.50),
+            "p99_ms": _percentile(self.latencies, 0.99),
+            "max_ms": self.latencies[-1] * 1000 if self.latencies else float("nan"),
+            "errors": self.errors,
+        }
+
+
+def run_setup(setup: str, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{tmp}/bench.db"
+        write_engine, read_engine = _engines(url, setup)
+        SQLModel.metadata.create_all(write_engine)
+        _seed(write_engine, args.seed)
+
+        stop = threading.Event()
+        reads, edits = _Samples(), _Samples()
+
+        def reader():
+            latencies, errors, after = [], 0, 0
+            while not stop.is_set():
+                t0 = time.perf_counter()
+                try:
+                    with Session(read_engine) as s:
+                        rows = s.exec(
+                            select(models.Component.id, models.Component.component_code)
+                            .where(models.Component.id > after)
+                            .order_by(models.Component.id)
+                            .limit(200)
+                        ).all()
+                        s.exec(
+                            select(func.count()).select_from(models.Component)
+                            .where(models.Component.component_type == "CAMERA")
+                        ).one()
+                    after = rows[-1][0] if rows else 0
+                    latencies.append(time.perf_counter() - t0)
+                except OperationalError:
+                    errors += 1
+            reads.merge(latencies, errors)
+
+        def editor(n: int):
+            rng = random.Random(n)
+            latencies, errors = [], 0
+            while not stop.is_set():
+                t0 = time.perf_counter()
+                try:
+                    with Session(write_engine) as s:
+                        component = s.get(models.Component, rng.randrange(1, args.seed + 1))
+                        component.firmware = f"{n}.{len(latencies)}"
+                        s.commit()
+                    latencies.append(time.perf_counter() - t0)
+                except OperationalError:
+                    errors += 1
+                time.sleep(args.edit_pause)
+            edits.merge(latencies, errors)
+
+        proc_stop = mp.Event()
+        written = mp.Value("i", 0)
+        import_errors = mp.Value("i", 0)
+        slowest_import = mp.Value("d", 0.0)
+        procs = [
+            mp.Process(target=_importer, args=(url, setup, w, args.batch, proc_stop, written, import_errors, slowest_import))
+            for w in range(args.importers)
+        ]
+        threads = [threading.Thread(target=reader) for _ in range(args.readers)]
+        threads += [threading.Thread(target=editor, args=(n,)) for n in range(args.editors)]
+        for p in procs:
+            p.start()
+        for t in threads:
+            t.start()
+        time.sleep(args.seconds)
+        stop.set()
+        proc_stop.set()
+        for t in threads:
+            t.join()
+        for p in procs:
+            p.join()
+        write_engine.dispose()
+        read_engine.dispose()
+
+    return {
+        "setup": setup,
+        "reads": reads.summary(args.seconds),
+        "edits": edits.summary(args.seconds),
+        "rows_imported_per_s": written.value / args.seconds,
+        "slowest_import_ms": slowest_import.value * 1000,
+        "import_errors": import_errors.value,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--setups", "--profiles", default="original," + ",".join(STORAGE_PROFILES))
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--editors", type=int, default=2)
+    parser.add_argument("--edit-pause", type=float, default=0.01, help="seconds between one editor's commits")
+    parser.add_argument("--importers", type=int, default=2, help="processes committing insert batches")
+    parser.add_argument("--seed", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'':<10}{'reads':>41}{'edits':>41}{'imports':>30}")
+    head = f"{'/s':>8}{'p50 ms':>8}{'p99 ms':>9}{'max ms':>9}{'errors':>7}"
+    print(f"{'setup':<10}{head}{head}{'rows/s':>10}{'max ms':>10}{'errors':>10}")
+    for setup in args.setups.split(","):
+        r = run_setup(setup.strip(), args)
+        cells = "".join(
+            f"{g['per_s']:>8.0f}{g['p50_ms']:>8.1f}{g['p99_ms']:>9.1f}{g['max_ms']:>9.1f}{g['errors']:>7}"
+            for g in (r["reads"], r["edits"])
+        )
+        print(f"{r['setup']:<10}{cells}{r['rows_imported_per_s']:>10.0f}{r['slowest_import_ms']:>10.0f}{r['import_errors']:>10}")
+
+
+if __name__ == "__main__":
+    main()
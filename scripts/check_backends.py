@@ -0,0 +1,356 @@
+"""Run the same database checks against SQLite and PostgreSQL.
+
+Usage: python scripts/check_backends.py [--urls postgresql://user:pw@host/inventory_test]
+
+A temporary SQLite file is always checked; extra URLs come from --urls or
+CHECK_DATABASE_URLS (comma separated). Each URL runs in its own process with
+DATABASE_URL set, because the engines are created at import time.
+
+The checks DROP AND RECREATE every table, so point them at a scratch database.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import traceback
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+
+def _checks():
+    from fastapi import HTTPException
+    from sqlalchemy import func, update
+    from sqlmodel import SQLModel, select
+
+    from app import models
+    from app.database import engine, init_db, session_scope
+    from app.dialects import supports_upsert, upsert_stmt
+    from app.filters import parse_filters, parse_sort
+    from app.importers import _upsert_components
+    from app.pagination import apply_keyset, next_cursor
+    from app.routers import _excel_text_filter
+    from app.versions import table_versions
+
+    def schema():
+        SQLModel.metadata.drop_all(engine)
+        init_db()
+        init_db()  # idempotent, including the PostgreSQL-only indexes
+
+    def seed():
+        with session_scope() as s:
+            region = models.Region(name="North")
+            s.add(region)
+            s.flush()
+            district = models.District(name="Alpha", region_id=region.id)
+            s.add(district)
+            s.flush()
+            s.add_all(
+                models.Component(
+                    component_code=f"C-{i:03d}", component_type="CAMERA" if i % 2 else "SWITCH",
+                    model=None if i % 3 == 0 else f"M{i % 4}", region_id=region.id, district_id=district.id,
+                )
+                for i in range(30)
+            )
+            s.commit()
+
+    def versions():
+        with session_scope(read_only=True) as s:
+            before = table_versions(s, [models.Component])
+        with session_scope() as s:
+            s.execute(update(models.Component).values(firmware="1.0").where(models.Component.id == 1))
+            s.commit()
+        with session_scope(read_only=True) as s:
+            after = table_versions(s, [models.Component])
+        assert after != before, (before, after)
+
+    def upsert():
+        with session_scope() as s:
+            if not supports_upsert(s.get_bind().dialect.name):
+                return "skipped (no upsert for this dialect)"
+            pending = {
+                "C-001": {"component_code": "C-001", "component_type": "CAMERA", "serial": "S1"},
+                "NEW-1": {"component_code": "NEW-1", "component_type": "CAMERA", "serial": "S2"},
+            }
+            _upsert_components(s, pending)
+            s.commit()
+            rows = dict(s.execute(
+                select(models.Component.component_code, models.Component.serial)
+                .where(models.Component.component_code.in_(["C-001", "NEW-1"]))
+            ).all())
+            assert rows == {"C-001": "S1", "NEW-1": "S2"}, rows
+            # Version rows are upserted too
+            stmt = upsert_stmt(s.get_bind().dialect.name, models.TableVersion, ["table_name"],
+                               set_={"version": models.TableVersion.version + 1})
+            s.execute(stmt, [{"table_name": "check", "version": 1}])
+            s.execute(stmt, [{"table_name": "check", "version": 1}])
+            assert s.get(models.TableVersion, "check").version == 2
+
+    def keyset():
+        with session_scope(read_only=True) as s:
+            where = parse_filters(models.Component, {"component_type__in": "CAMERA,SWITCH", "model__isnull": "false"}.items())
+            sort_key = parse_sort(models.Component, "-model,component_code")
+            seen, after = [], None
+            while True:
+                stmt = apply_keyset(select(models.Component).where(*where), sort_key, after).limit(7)
+                page = s.exec(stmt).all()
+                seen.extend(c.component_code for c in page)
+                after = next_cursor(page, sort_key, 7)
+                if not after:
+                    break
+            expected = s.exec(
+                select(models.Component.component_code).where(*where)
+                .order_by(models.Component.model.desc(), models.Component.component_code)
+            ).all()
+            assert seen == list(expected), (seen, expected)
+            # Parameters that name no column (cache-busters) are not filters
+            assert parse_filters(models.Component, [("_", "123"), ("utm_source", "x")]) == []
+            try:
+                parse_filters(models.Component, [("district_id__prefix", "1")])
+            except HTTPException as exc:
+                assert exc.status_code == 400, exc
+            else:
+                raise AssertionError("__prefix accepted on an integer field")
+            # The largest code point has no successor: the range is left open above
+            top = chr(0x10FFFF)
+            for prefix in (top, "C-" + top):
+                where = parse_filters(models.Component, [("component_code__prefix", prefix)])
+                assert s.exec(select(func.count()).select_from(models.Component).where(*where)).one() == 0
+
+    def excel_search():
+        with session_scope() as s:
+            book = models.ExcelWorkbook(filename="check.xlsx", imported_at=datetime.utcnow().isoformat())
+            s.add(book)
+            s.flush()
+            sheet = models.ExcelSheet(workbook_id=book.id, name="Sheet1", columns=["IP", "Name"])
+            s.add(sheet)
+            s.flush()
+            s.add_all([
+                models.ExcelRow(sheet_id=sheet.id, row_index=1, data={"IP": "10.0.0.5", "Name": "Cam_North"}),
+                models.ExcelRow(sheet_id=sheet.id, row_index=2, data={"IP": "10.0.1.7", "Name": "Switch 100%"}),
+            ])
+            s.commit()
+        with session_scope(read_only=True) as s:
+            def hits(q):
+                stmt = select(models.ExcelRow.row_index).where(*_excel_text_filter(s, q))
+                return sorted(s.exec(stmt).all())
+            assert hits("cam_n") == [1], hits("cam_n")
+            assert hits("100%") == [2], hits("100%")
+            assert hits("10.0.") == [1, 2]
+            assert hits("_") == [1]
+            row = s.exec(select(models.ExcelRow).where(models.ExcelRow.row_index == 2)).one()
+            assert row.data == {"IP": "10.0.1.7", "Name": "Switch 100%"}
+
+    def retention():
+        from app.workbooks import delete_workbooks, expired_workbooks
+
+        with session_scope() as s:
+            ids = []
+            for day in (1, 2, 3):
+                book = models.ExcelWorkbook(filename="retained.xlsx", imported_at=f"2024-01-0{day}T00:00:00")
+                s.add(book)
+                s.flush()
+                sheet = models.ExcelSheet(workbook_id=book.id, name="S")
+                s.add(sheet)
+                s.flush()
+                s.add(models.ExcelRow(sheet_id=sheet.id, row_index=1, data={"A": day}))
+                ids.append(book.id)
+            s.commit()
+            expired = expired_workbooks(s, keep_versions=1, filename="retained.xlsx")
+            assert expired == ids[:2], (expired, ids)
+            assert expired_workbooks(s, max_age_days=1, filename="retained.xlsx") == ids[:2]
+            assert delete_workbooks(s, expired) == {"workbooks": 2, "sheets": 2, "rows": 2}
+            s.commit()
+
+    def audit_archive():
+        from app.audit_archive import ArchiveCorrupt, _segment_rows, archive_audit_logs, query_audit_logs
+
+        with session_scope() as s:
+            s.add_all(
+                models.AuditLog(username="check", action="UPDATE", entity_type="components", entity_id=i,
+                                timestamp=f"2024-0{1 + i % 3}-01T00:00:{i:02d}.000Z")
+                for i in range(12)
+            )
+            s.add(models.AuditLog(username="check", action="UPDATE", entity_type="components", entity_id=99,
+                                  timestamp=datetime.utcnow().isoformat()))
+            s.commit()
+        with tempfile.TemporaryDirectory() as archive_dir:
+            result = archive_audit_logs(30, batch_size=5, archive_dir=Path(archive_dir))
+            assert result["archived"] == 12, result
+            with session_scope(read_only=True) as s:
+                rows = query_audit_logs(s, start="2024-02-01", filters={"username": "check"}, archive_dir=Path(archive_dir))
+                assert [r["entity_id"] for r in rows] == [1, 4, 7, 10, 2, 5, 8, 11, 99], rows
+                # A damaged member is a domain error, not an HTTP one
+                segment = s.exec(select(models.AuditSegment).order_by(models.AuditSegment.id)).first()
+                with open(Path(archive_dir) / segment.path, "r+b") as f:
+                    f.seek(segment.offset + 12)
+                    byte = f.read(1)
+                    f.seek(-1, 1)
+                    f.write(bytes([byte[0] ^ 0xFF]))
+                _segment_rows.cache_clear()
+                try:
+                    query_audit_logs(s, start="2024-01-01", archive_dir=Path(archive_dir))
+                except ArchiveCorrupt:
+                    pass
+                else:
+                    raise AssertionError("corrupt archive member was read")
+                _segment_rows.cache_clear()
+
+    def audit_rollups():
+        from app.audit import apply_rollups
+
+        entries = [
+            {"username": "check", "action": "UPDATE", "entity_type": "components", "entity_id": 7,
+             "timestamp": "2024-05-01T10:00:00.000Z"},
+            {"username": "check", "action": "SEARCH", "entity_type": "global", "entity_id": None,
+             "timestamp": "2024-05-01T11:00:00.000Z"},
+        ]
+        with session_scope() as s:
+            apply_rollups(s, entries)
+            apply_rollups(s, entries[:1])
+            s.commit()
+            counts = dict(s.execute(
+                select(models.AuditDailyActivity.action, models.AuditDailyActivity.count)
+                .where(models.AuditDailyActivity.day == "2024-05-01")
+            ).all())
+            assert counts == {"UPDATE": 2, "SEARCH": 1}, counts
+            assert s.get(models.AuditDailyEntity, ("2024-05-01", "components", 7)).count == 2
+
+    def topology():
+        from app.topology import topology_graph
+
+        with session_scope(read_only=True) as s:
+            graph = topology_graph(s)
+        loads = graph.loads
+        with session_scope() as s:
+            s.add(models.Component(component_code="T-001", component_type="CAMERA", connected_to_code="C-001"))
+            s.commit()
+        # Applied in place from the commit, at the table version the commit produced
+        assert graph.loads == loads and graph.downstream(["C-001"]) == {"T-001": 1}, graph.stats()
+        with session_scope() as s:
+            s.delete(s.exec(select(models.Component).where(models.Component.component_code == "T-001")).one())
+            s.commit()
+        with session_scope(read_only=True) as s:
+            assert topology_graph(s) is graph and graph.loads == loads and not graph.downstream(["C-001"])
+
+    def geo():
+        from app.spatial import in_boxes, nearest, split_box
+
+        with session_scope() as s:
+            s.execute(update(models.Component).where(models.Component.id <= 3).values(lat=34.1, lng=74.8))
+            s.execute(update(models.Component).where(models.Component.id == 3).values(lat=None))
+            s.execute(update(models.Component).where(models.Component.id == 4).values(lat=0.0, lng=179.9))
+            s.commit()
+        with session_scope(read_only=True) as s:
+            found = in_boxes(s, "components", split_box(34, 74, 35, 75))
+            assert sorted(r["id"] for r in found) == [1, 2], found
+            assert [r["id"] for r in in_boxes(s, "components", split_box(-1, 179, 1, -179))] == [4]
+            assert [r["id"] for r in nearest(s, "components", 34.2, 74.9, 2)] == [1, 2]
+
+    def map_clusters():
+        from app.map_clusters import cell_xy, cluster_grid
+
+        with session_scope(read_only=True) as s:
+            grid = cluster_grid(s, "components")
+        loads, cell = grid.loads, cell_xy(34.1, 74.8, 10)
+        with session_scope() as s:
+            s.add(models.Component(component_code="M-001", component_type="CAMERA", lat=34.1, lng=74.8))
+            s.commit()
+        # Applied in place from the commit; ids 1 and 2 were placed there by the geo check
+        assert grid.loads == loads and grid.levels[10][cell][0] == 3, grid.stats()
+        with session_scope() as s:
+            s.delete(s.exec(select(models.Component).where(models.Component.component_code == "M-001")).one())
+            s.commit()
+        with session_scope(read_only=True) as s:
+            assert cluster_grid(s, "components") is grid and grid.loads == loads and grid.levels[10][cell][0] == 2
+
+    def ip_checks():
+        from app.ip_checks import ip_index
+
+        with session_scope() as s:
+            s.execute(update(models.Component).where(models.Component.id.in_([5, 6])).values(
+                local_if_ip="10.9.0.5", proposed_subnet="10.9.0.0/24"))
+            s.commit()
+        with session_scope(read_only=True) as s:
+            ip_index.refresh(s)
+        assert (4, 0x0A090005) in ip_index.duplicates, ip_index.stats()
+        with session_scope() as s:
+            s.get(models.Component, 6).local_if_ip = "10.8.0.6"
+            s.commit()
+        with session_scope(read_only=True) as s:
+            # Only the edited row is re-read; it is now outside its subnet
+            assert ip_index.refresh(s)["rows_rechecked"] == 1
+        assert not ip_index.duplicates and [p["id"] for p in ip_index.problems("outside_subnet")] == [6]
+
+    def subnet_usage():
+        def usage(s):
+            u = models.SubnetUsage
+            return sorted(tuple(r) for r in s.execute(select(u.district_id, u.vlan, u.subnet, u.components, u.addressed)))
+
+        with session_scope() as s:
+            s.execute(update(models.Component).where(models.Component.id <= 4).values(
+                proposed_vlan="110", proposed_subnet="10.7.0.0/29", local_if_ip="10.7.0.2"))
+            s.add(models.Component(component_code="U-001", component_type="CAMERA", proposed_subnet="10.7.0.0/29"))
+            s.commit()
+            s.delete(s.get(models.Component, 4))
+            s.commit()
+            live = usage(s)
+            # The triggers agree with a recount, whatever the write path
+            models.rebuild_subnet_usage(s.connection())
+            assert usage(s) == live, live
+            s.rollback()
+        rows = [r for r in live if r[2] == "10.7.0.0/29"]
+        assert sum(r[3] for r in rows) == 4 and sum(r[4] for r in rows) == 3, rows
+
+    def counts():
+        with session_scope(read_only=True) as s:
+            assert s.exec(select(func.count()).select_from(models.Component)).one() == 31
+
+    return [
+        ("schema", schema), ("seed", seed), ("versions", versions), ("upsert", upsert),
+        ("keyset", keyset), ("excel_search", excel_search), ("retention", retention),
+        ("audit_archive", audit_archive), ("audit_rollups", audit_rollups),
+        ("topology", topology), ("geo", geo), ("map_clusters", map_clusters),
+        ("ip_checks", ip_checks), ("subnet_usage", subnet_usage),
+        ("counts", counts),
+    ]
+
+
+def run_child() -> int:
+    failed = 0
+    for name, check in _checks():
+        try:
+            note = check()
+            print(f"  ok    {name}{' - ' + note if note else ''}")
+        except Exception:
+            failed += 1
+            print(f"  FAIL  {name}")
+            traceback.print_exc()
+    return 1 if failed else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--urls", default=os.getenv("CHECK_DATABASE_URLS", ""))
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return run_child()
+
+    status = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        urls = [f"sqlite:///{tmp}/check.db"] + [u.strip() for u in args.urls.split(",") if u.strip()]
+        for url in urls:
+            print(f"{url.split('://')[0]}: {url.rsplit('@', 1)[-1]}")
+            env = dict(os.environ, DATABASE_URL=url)
+            status |= subprocess.call([sys.executable, __file__, "--child"], env=env, cwd=ROOT)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,269 @@
+"""EXPLAIN QUERY PLAN for every query the read endpoints issue; fail on unindexed access.
+
+Usage: python scripts/check_query_plans.py [--verbose]
+
+Seeds a temporary SQLite database, calls every GET route (plus the filtered
+access paths in ACCESS_PATHS) through the ASGI app, captures each SELECT,
+and explains it. A plan step that scans a whole table without an index
+("SCAN pole") or sorts in a temp B-tree ("USE TEMP B-TREE FOR ORDER BY")
+fails the run unless ALLOWED lists it for that call. Needs httpx for
+fastapi.testclient.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# Filtered reads the UI and importers rely on, beyond each route's defaults
+ACCESS_PATHS = [
+    "/districts?region_id=1",
+    "/landmarks?district_id=1",
+    "/poles?landmark_id=1",
+    "/poles?district_id=1",
+    "/junction-boxes?pole_id=1",
+    "/junction-boxes?landmark_id=1",
+    "/components?district_id=1&component_type=CAMERA",
+    "/components?district_id=1",
+    "/components?pole_id=1",
+    "/components?jb_id=1",
+    "/components?landmark_id=1",
+    "/components?region_id=1",
+    "/components?component_type=CAMERA&fields=id,component_code",
+    # Sort column outside the projection: still needed for the next cursor
+    "/regions?limit=1&sort=name&fields=id",
+    "/components?limit=2&sort=component_code&fields=component_type",
+    "/credentials?component_id=1",
+    "/audit-logs?username=admin",
+    "/audit-logs?action=CREATE",
+    "/audit-logs?entity_type=components&entity_id=1",
+    "/audit-logs?start=2024-01-01&end=2100-01-01",
+    "/audit-logs?username=admin&start=2024-01-01",
+    "/audit-logs/history?start=2024-01-01&username=admin",
+    "/audit-logs/stats/activity?start=2024-01-01&end=2100-01-01",
+    "/audit-logs/stats/top-entities?entity_type=components",
+    "/audit-logs/stats/top-entities?start=2024-01-01",
+    "/audit-logs/state/components/1?at=2024-01-01",
+    "/geo/bbox?min_lat=34&min_lng=74&max_lat=35&max_lng=75",
+    "/geo/bbox?min_lat=-1&min_lng=179&max_lat=1&max_lng=-179&types=poles",
+    "/geo/radius?lat=34.1&lng=74.8&radius_m=500",
+    "/geo/nearest?lat=34.1&lng=74.8&k=3",
+    "/map/clusters?min_lat=34&min_lng=74&max_lat=35&max_lng=75&zoom=10",
+    "/map/clusters?min_lat=34.1&min_lng=74.8&max_lat=34.11&max_lng=74.81&zoom=18",
+    "/ip-checks/ip/10.0.0.1",
+    "/capacity/subnets?district_id=1",
+    "/capacity/vlans?district_id=1",
+    "/excel/sheets/1/rows?limit=50",
+    "/hierarchy?region_id=1",
+    "/hierarchy?district_id=1&depth=2",
+]
+
+# Call -> plan findings it may produce, with the reason
+_LIST_SCAN = "unfiltered page: walks the table in id order and LIMIT stops it"
+ALLOWED: dict[str, dict[str, str]] = {
+    **{
+        f"/{path}": {f"scan:{table}": _LIST_SCAN}
+        for path, table in [
+            ("regions", "region"), ("districts", "district"), ("landmarks", "landmark"),
+            ("poles", "pole"), ("junction-boxes", "junctionbox"), ("components", "component"),
+            ("credentials", "credential"), ("audit-logs", "auditlog"),
+        ]
+    },
+    "/excel/workbooks": {"scan:excelworkbook": _LIST_SCAN},
+    "/excel/workbooks/1/sheets": {"scan:excelsheet": "a workbook has a handful of sheets"},
+    "/search/global?q=cam": {
+        **{f"scan:{t}": "substring match (ILIKE '%q%') cannot use a b-tree index"
+           for t in ("region", "district", "landmark", "pole", "junctionbox", "component", "credential", "excelrow")},
+        "sort": "Excel hits ordered newest first after the substring scan",
+    },
+    "/search/excel-by-value?q=cam": {"scan:excelrow": "substring match over cell text"},
+    "/hierarchy": {
+        f"scan:{t}": "whole tree requested" for t in ("region", "district", "landmark", "pole", "junctionbox")
+    } | {"scan:component": "whole tree requested"},
+    "/stats": {
+        f"scan:{t}": "COUNT(*) visits every row; SQLite walks the narrowest b-tree it has"
+        for t in ("region", "district", "landmark", "pole", "junctionbox", "component", "credential")
+    },
+    "/reference": {
+        f"scan:{t}": "whole reference list loaded once into the cache" for t in ("region", "district", "landmark")
+    },
+    **{
+        call: {"sort": "ranked by summed count: sorts the grouped rollup, one row per entity"}
+        for call in ("/audit-logs/stats/top-entities", "/audit-logs/stats/top-entities?entity_type=components",
+                     "/audit-logs/stats/top-entities?start=2024-01-01")
+    },
+    **{
+        call: {"sort": "ranked by distance: LIMIT keeps a top-N sort over the spatial index's candidates"}
+        for call in ("/geo/radius?lat=34.1&lng=74.8&radius_m=500", "/geo/nearest?lat=34.1&lng=74.8&k=3")
+    },
+    "/hierarchy?region_id=1": {
+        "scan:region": "region table is tiny; id lookup plus region_id filters below",
+        "sort": "components with and without a region id come from two index ranges, merged in id order",
+    },
+    "/hierarchy?district_id=1&depth=2": {
+        "sort": "components with and without a district id come from two index ranges, merged in id order",
+    },
+    # Whichever /topology call comes first loads the graph; later calls only read the version table
+    "/topology/stats": {"scan:component": "topology graph load reads every component's link once"},
+    # Likewise /map/stats loads the cluster hierarchies before the /map/clusters calls
+    "/map/stats": {
+        f"scan:{t}": "cluster hierarchy load reads every located asset once"
+        for t in ("landmark", "pole", "junctionbox", "component")
+    },
+    **{
+        call: {"scan:subnetusage": "capacity views total the rollup: one row per district, VLAN and subnet"}
+        for call in ("/capacity/subnets", "/capacity/subnets?district_id=1", "/capacity/vlans", "/capacity/districts")
+    },
+    "/ip-checks": {
+        f"scan:{t}": "address index load parses every component and credential address once"
+        for t in ("component", "credential")
+    },
+}
+
+_SCAN = re.compile(r"^SCAN (\w+)$")
+
+
+def _seed(session, models) -> None:
+    from datetime import datetime
+
+    region = models.Region(name="North")
+    session.add(region)
+    session.flush()
+    district = models.District(name="Alpha", region_id=region.id)
+    session.add(district)
+    session.flush()
+    landmark = models.Landmark(code="LM-1", name="Square", district_id=district.id, region_id=region.id)
+    session.add(landmark)
+    session.flush()
+    pole = models.Pole(code="P-1", landmark_id=landmark.id, district_id=district.id, region_id=region.id)
+    session.add(pole)
+    session.flush()
+    jb = models.JunctionBox(code="JB-1", pole_id=pole.id, landmark_id=landmark.id,
+                            district_id=district.id, region_id=region.id)
+    session.add(jb)
+    session.flush()
+    comps = [
+        models.Component(component_code=f"C-{i}", component_type="CAMERA" if i % 2 else "SWITCH",
+                         pole_id=pole.id, jb_id=jb.id, landmark_id=landmark.id,
+                         district_id=district.id, region_id=region.id)
+        for i in range(50)
+    ]
+    session.add_all(comps)
+    session.flush()
+    session.add(models.Credential(component_id=comps[0].id, component_code="C-0", username="admin"))
+    session.add(models.AuditLog(username="admin", action="CREATE", entity_type="components",
+                                timestamp=datetime.utcnow().isoformat()))
+    book = models.ExcelWorkbook(filename="plan.xlsx", imported_at=datetime.utcnow().isoformat())
+    session.add(book)
+    session.flush()
+    sheet = models.ExcelSheet(workbook_id=book.id, name="Sheet1", columns=["A"])
+    session.add(sheet)
+    session.flush()
+    session.add_all(models.ExcelRow(sheet_id=sheet.id, row_index=r, data={"A": f"cam {r}"}) for r in range(1, 51))
+    session.commit()
+
+
+def _calls(app) -> list[str]:
+    from fastapi.routing import APIRoute
+
+    calls = []
+    for route in app.routes:
+        if not isinstance(route, APIRoute) or "GET" not in route.methods or route.path.startswith("/import"):
+            continue
+        if route.path.endswith("/") and route.path != "/":
+            continue  # trailing-slash alias of the same handler
+        path = re.sub(r"\{\w+\}", "1", route.path)
+        required = [p.name for p in route.dependant.query_params if p.required]
+        if required:
+            path += "?" + "&".join(f"{name}=cam" for name in required)
+        calls.append(path)
+    return list(dict.fromkeys(calls + ACCESS_PATHS))
+
+
+def _findings(db: sqlite3.Connection, statement: str, params) -> tuple[list[str], list[str]]:
+    plan = [row[3] for row in db.execute(f"EXPLAIN QUERY PLAN {statement}", params or ())]
+    found = []
+    for step in plan:
+        m = _SCAN.match(step)
+        if m:
+            found.append(f"scan:{m.group(1)}")
+        elif step.startswith("USE TEMP B-TREE FOR ORDER BY"):
+            found.append("sort")
+    return found, plan
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--verbose", action="store_true", help="print every plan")
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    db_path = Path(tmp.name) / "plans.db"
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+
+    from app import auth, models
+    from app.database import async_engine, async_read_engine, engine, init_db, read_engine, session_scope
+    from app.main import app
+
+    init_db()
+    with session_scope() as session:
+        session.add(models.User(username="admin", hashed_password="x"))
+        _seed(session, models)
+    token = auth.create_access_token({"sub": "admin"})
+
+    captured: list[tuple[str, str, object]] = []
+    current = {"call": None}
+
+    def _capture(conn, cursor, statement, parameters, context, executemany):
+        if current["call"] and statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            captured.append((current["call"], statement, parameters))
+
+    for eng in {engine, read_engine, async_engine.sync_engine, async_read_engine.sync_engine}:
+        event.listen(eng, "before_cursor_execute", _capture)
+
+    with TestClient(app) as client:
+        for call in _calls(app):
+            current["call"] = call
+            r = client.get(call, headers={"Authorization": f"Bearer {token}"})
+            if r.status_code >= 500:
+                print(f"ERROR {call}: HTTP {r.status_code}")
+                return 1
+        current["call"] = None
+
+    db = sqlite3.connect(db_path)
+    failures = 0
+    seen = set()
+    for call, statement, params in captured:
+        key = (call, statement)
+        if key in seen:
+            continue
+        seen.add(key)
+        found, plan = _findings(db, statement, params)
+        unexpected = [f for f in found if f not in ALLOWED.get(call, {})]
+        if unexpected or args.verbose:
+            status = "FAIL" if unexpected else "ok"
+            print(f"{status:4}  {call}  {', '.join(unexpected)}")
+            print("      " + " ".join(statement.split())[:300])
+            for step in plan:
+                print(f"        {step}")
+        failures += bool(unexpected)
+    db.close()
+
+    calls = {c for c, _, _ in captured}
+    print(f"{len(seen)} queries from {len(calls)} calls, {failures} with unindexed access")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())